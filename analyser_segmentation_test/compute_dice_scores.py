@@ -6,25 +6,35 @@ OBJECTIF :
 ----------
 Ce script évalue la performance d’un modèle de segmentation en comparant
 chaque segmentation prédite avec une segmentation de référence, en utilisant le Dice score
-fourni par Spinal Cord Toolbox ('sct_dice_coefficient').
+calculé directement en Python (voir metriques.py), sans lancer 'sct_dice_coefficient'.
 
 FONCTIONNEMENT :
 ----------------
 1. Pour chaque sujet et contraste (T1w, T2w) :
-   - Charge la segmentation prédite (`*_seg_nnunet.nii.gz`)
    - Charge la segmentation de référence fusionnée ('*_fusion_cropped.nii.gz') ou
      un fichier GT alternatif dans `labels_softseg_bin` si le premier est absent.
-   - Calcule le Dice score avec 'sct_dice_coefficient'.
-2. Construit un tableau récapitulatif des scores pour tous les sujets.
-3. Sauvegarde deux fichiers CSV :
-   - 'dice_scores.csv' : scores individuels par sujet/contraste
-   - 'dice_stats.csv'  : statistiques globales (moyenne, écart-type, CV)
+     La référence n'est chargée qu'une seule fois, quel que soit le nombre de modèles.
+   - Charge la segmentation prédite par chaque modèle de MODELES (par défaut seulement
+     `*_seg_nnunet.nii.gz` dans PRED_DIR ; d'autres dossiers de prédictions, ex: plusieurs
+     checkpoints ou contrast-agnostic, peuvent être ajoutés).
+   - Calcule le Dice score, le Jaccard et la différence de volume (et, si DISTANCES = True,
+     la distance de Hausdorff et l'ASSD) entre chaque prédiction et la référence.
+   Les sujets sont traités en parallèle sur JOBS processus.
+2. Construit un tableau récapitulatif des scores pour tous les sujets et tous les modèles.
+3. Sauvegarde trois fichiers CSV :
+   - 'dice_scores.csv' : Dice individuel par sujet/contraste (colonnes subject, contrast,
+     dice_score), pour le premier modèle de MODELES
+   - 'dice_stats.csv'  : statistiques globales du Dice de ce modèle (mean_dice, std_dice, cv_dice)
+   - OUTPUT_LONG_CSV   : toutes les métriques de tous les modèles en format long
+     (subject, contrast, model, metric, value)
+   Les deux premiers fichiers gardent le format d'origine ; les autres modèles et métriques ne
+   sont que dans OUTPUT_LONG_CSV (leurs statistiques sont affichées dans la console).
 
 
 UTILISATION :
 -------------
-L'utilisateur doit modifier les paramètres GT_DIR, PRED_DIR, OUTPUT_ALL_DICE_CSV et 
-OUTPUT_STATS_DICE_CSV directement dans le script. L'utilisateur doit aussi spécifier
+L'utilisateur doit modifier les paramètres GT_DIR, PRED_DIR (ou MODELES), OUTPUT_ALL_DICE_CSV,
+OUTPUT_STATS_DICE_CSV et OUTPUT_LONG_CSV (et au besoin JOBS et DISTANCES) directement dans le script. L'utilisateur doit aussi spécifier
 les sujets à analyser. Il doit ensuite lancer :
 
     bash extend-seg-upper-cord/analyser_segmentation_test/compute_dice_scores.py
@@ -36,14 +46,24 @@ Date : Avril 2025
 """
 
 import os
-import subprocess
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from metriques import metriques_predictions, METRIQUES, METRIQUES_DISTANCES
 
 # === CONFIGURATION ===
 GT_DIR = "data-multi-subject/derivatives/labels_softseg_bin" # À modifier selon l'emplacement des segmentations de référence
 PRED_DIR = "/home/ge.polymtl.ca/mestaa/output_extend-seg-upper-cord_2104" # À modifier selon l'emplacement des préditions du modèle
 OUTPUT_ALL_DICE_CSV = "/home/ge.polymtl.ca/mestaa/results/dice_scores_2104.csv" # À modifier selon l'emplacement voulu du fichier CSV contenant tous les Dice
 OUTPUT_STATS_DICE_CSV = "/home/ge.polymtl.ca/mestaa/results/dice_stats_2104.csv" # À modifier selon l'emplacement voulu du fichier CSV contenant les statistiques sur les Dice
+OUTPUT_LONG_CSV = "/home/ge.polymtl.ca/mestaa/results/metriques_2104.csv" # À modifier selon l'emplacement voulu du fichier CSV en format long (toutes les métriques)
+
+# Modèles à évaluer : {nom du modèle: (dossier des prédictions, suffixe des fichiers)}.
+# Le fichier de prédiction attendu est <dossier>/<sujet>_<contraste><suffixe>.
+# Ajouter une entrée par modèle ou checkpoint à comparer. Le premier modèle est celui des
+# fichiers OUTPUT_ALL_DICE_CSV et OUTPUT_STATS_DICE_CSV.
+MODELES = {
+    "nnunet": (PRED_DIR, "_seg_nnunet.nii.gz"),
+}
 
 # À modifier selon les fichiers pour lesquels on veut calculer le Dice score.
 SUBJECTS = [ 
@@ -55,69 +75,96 @@ SUBJECTS = [
 
 CONTRASTS = ["T1w", "T2w"]
 
-def compute_dice_sct(pred_path, gt_path):
-    try:
-        result = subprocess.run(
-            ["sct_dice_coefficient", "-i", pred_path, "-d", gt_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            check=True
-        )
-        for line in result.stdout.splitlines():
-            if "Dice coefficient" in line:
-                return float(line.split("=")[-1].strip())
-    except subprocess.CalledProcessError as e:
-        print(f"Erreur avec sct_maths : {e.stderr}")
-        return None
-
-results = []
-
-for subj in SUBJECTS:
-    for contrast in CONTRASTS:
-        gt_file = os.path.join(GT_DIR, f"{subj}/anat/{subj}_{contrast}_desc-softseg_label-SC_seg.nii.gz")
-        pred_file = os.path.join(PRED_DIR, f"{subj}_{contrast}_seg_nnunet.nii.gz")
-
-        if not os.path.isfile(gt_file):
-            print(f"GT introuvable : {gt_file}")
-            continue
-        if not os.path.isfile(pred_file):
-            print(f"Prédiction introuvable : {pred_file}")
-            continue
-
-        dice = compute_dice_sct(pred_file, gt_file)
-        if dice is not None:
-            print(f"Dice {subj} ({contrast}) : {dice:.4f}")
-            results.append({
-                "subject": subj,
-                "contrast": contrast,
-                "dice_score": round(dice, 4)
-            })
-
-# === Sauvegarde CSV ===
-df = pd.DataFrame(results)
-df.to_csv(OUTPUT_ALL_DICE_CSV, index=False)
-print(f"Résultats sauvegardés dans : {OUTPUT_ALL_DICE_CSV}")
-
-# === Moyenne, écart-type, coefficient de variation ===
-mean_dice = df["dice_score"].mean()
-std_dice = df["dice_score"].std()
-cv_dice = std_dice / mean_dice if mean_dice > 0 else 0
-
-# Affichage console
-print("\n=== Statistiques globales ===")
-print(f"Moyenne Dice      : {mean_dice:.4f}")
-print(f"Écart-type Dice   : {std_dice:.4f}")
-print(f"Coefficient de variation : {cv_dice:.4f}")
-
-# === Export dans un second fichier CSV ===
-stats_output = {
-    "mean_dice": [round(mean_dice, 4)],
-    "std_dice": [round(std_dice, 4)],
-    "cv_dice": [round(cv_dice, 4)]
-}
-
-df_stats = pd.DataFrame(stats_output)
-df_stats.to_csv(OUTPUT_STATS_DICE_CSV, index=False)
-
-print(f"Statistiques sauvegardées dans : {OUTPUT_STATS_DICE_CSV}")
+JOBS = os.cpu_count() # Nombre de sujets traités en parallèle
+DISTANCES = False # True pour calculer aussi la distance de Hausdorff et l'ASSD (plus long)
+
+
+def lister_sujets():
+    """
+    Liste, pour chaque sujet/contraste ayant un GT, les prédictions existantes de chaque modèle.
+    :return: Liste de tuples (sujet, contraste, gt_file, {modèle: pred_file})
+    """
+    sujets = []
+    for subj in SUBJECTS:
+        for contrast in CONTRASTS:
+            gt_file = os.path.join(GT_DIR, f"{subj}/anat/{subj}_{contrast}_desc-softseg_label-SC_seg.nii.gz")
+            if not os.path.isfile(gt_file):
+                print(f"GT introuvable : {gt_file}")
+                continue
+
+            predictions = {}
+            for modele, (pred_dir, suffixe) in MODELES.items():
+                pred_file = os.path.join(pred_dir, f"{subj}_{contrast}{suffixe}")
+                if not os.path.isfile(pred_file):
+                    print(f"Prédiction introuvable ({modele}) : {pred_file}")
+                    continue
+                predictions[modele] = pred_file
+            if predictions:
+                sujets.append((subj, contrast, gt_file, predictions))
+    return sujets
+
+
+def evaluer(sujets, metriques):
+    """
+    Évalue toutes les prédictions de chaque sujet contre son GT (chargé une seule fois par sujet),
+    avec un sujet par processus.
+    :return: Liste de lignes en format long (subject, contrast, model, metric, value)
+    """
+    lignes = []
+    with ProcessPoolExecutor(max_workers=JOBS) as executor:
+        futures = [executor.submit(metriques_predictions, gt_file, predictions, DISTANCES)
+                   for _, _, gt_file, predictions in sujets]
+        for (subj, contrast, gt_file, _), future in zip(sujets, futures):
+            try:
+                resultats = future.result()
+            except Exception as e:
+                print(f"Erreur avec {gt_file} : {e}")
+                continue
+            for modele, resultat in resultats.items():
+                if resultat is None:
+                    continue
+                print(f"Dice {subj} ({contrast}, {modele}) : {resultat['dice']:.4f}")
+                lignes.extend({"subject": subj, "contrast": contrast, "model": modele,
+                               "metric": m, "value": round(resultat[m], 4)} for m in metriques)
+    return lignes
+
+
+def main():
+    metriques = METRIQUES + (METRIQUES_DISTANCES if DISTANCES else [])
+    df_long = pd.DataFrame(evaluer(lister_sujets(), metriques),
+                           columns=["subject", "contrast", "model", "metric", "value"])
+    df_long.to_csv(OUTPUT_LONG_CSV, index=False)
+    print(f"Métriques (format long) sauvegardées dans : {OUTPUT_LONG_CSV}")
+
+    # === Moyenne, écart-type, coefficient de variation (par modèle) ===
+    dice = df_long[df_long["metric"] == "dice"]
+    stats = dice.groupby("model", sort=False)["value"].agg(["mean", "std"])
+    stats["cv"] = (stats["std"] / stats["mean"]).where(stats["mean"] > 0, 0)
+
+    # Affichage console
+    for modele, ligne in stats.iterrows():
+        print(f"\n=== Statistiques globales ({modele}) ===")
+        print(f"Moyenne Dice      : {ligne['mean']:.4f}")
+        print(f"Écart-type Dice   : {ligne['std']:.4f}")
+        print(f"Coefficient de variation : {ligne['cv']:.4f}")
+
+    # === Sauvegarde CSV (format d'origine, premier modèle) ===
+    modele = next(iter(MODELES))
+    df = dice[dice["model"] == modele].rename(columns={"value": "dice_score"})[["subject", "contrast", "dice_score"]]
+    df.to_csv(OUTPUT_ALL_DICE_CSV, index=False)
+    print(f"Résultats sauvegardés dans : {OUTPUT_ALL_DICE_CSV}")
+
+    # === Export dans un second fichier CSV ===
+    ligne = stats.reindex([modele]).iloc[0]
+    df_stats = pd.DataFrame({
+        "mean_dice": [round(ligne["mean"], 4)],
+        "std_dice": [round(ligne["std"], 4)],
+        "cv_dice": [round(ligne["cv"], 4)]
+    })
+    df_stats.to_csv(OUTPUT_STATS_DICE_CSV, index=False)
+
+    print(f"Statistiques sauvegardées dans : {OUTPUT_STATS_DICE_CSV}")
+
+
+if __name__ == '__main__':
+    main()
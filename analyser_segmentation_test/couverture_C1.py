@@ -16,19 +16,31 @@ fichier de labels (C2 et C1).
 FONCTIONNEMENT :
 ----------------
 Pour chaque sujet/contraste :
-1. Charge les fichiers :
+1. Charge les fichiers, une seule fois chacun :
    - Segmentation GT
-   - Segmentation contrast-agnostic
-   - Segmentation obtenue par le nouveau modèle
    - Fichier de labels vertébraux (`*_label-discs_dlabel.nii.gz`)
+   - La segmentation de chaque modèle de `modeles` (par défaut contrast-agnostic et le nouveau
+     modèle ; d'autres dossiers de prédictions, ex: plusieurs checkpoints, peuvent être ajoutés)
 2. Localise C1 à partir du fichier de labels.
 3. Calcule, dans cette région C1, le pourcentage de voxels GT couverts par chaque segmentation.
-4. Calcule le gain de couverture entre la segmentation étendue et la segmentation d'origine.
+   Les volumes ne sont jamais chargés en entier : seules les slices entre le label le plus haut et
+   le plus bas sont lues, une seule fois par fichier et dans leur type natif, puis partagées par
+   le calcul de la couverture de C1 et le profil par niveau (étape 7).
+   Un sujet auquel il manque la prédiction d'un modèle est sauté, comme un sujet sans GT, sauf si
+   `garder_incomplets` est True (couverture vide pour le modèle manquant).
+4. Calcule le gain de couverture de chaque modèle par rapport au premier modèle de `modeles`
+   (la segmentation d'origine).
 5. Exporte un tableau récapitulatif dans un fichier CSV avec :
    - `subject`
-   - `coverage_contrast_agnostic (%)`
-   - `coverage_extend_seg (%)`
-   - `gain (%)`
+   - `coverage_<modèle> (%)` pour chaque modèle (ex: `coverage_contrast_agnostic (%)`,
+     `coverage_extend_seg (%)`)
+   - `gain (%)` (ou `gain_<modèle> (%)` s'il y a plus de deux modèles)
+6. Exporte aussi un tableau en format long (`subject`, `contrast`, `model`, `metric`, `value`).
+7. Exporte le profil de couverture de tous les niveaux vertébraux (C1, C2, C3...) : à partir
+   d'une seule lecture des labels, chaque niveau N va du label N au label N+1 ; pour chaque
+   prédiction et chaque niveau, le tableau donne la couverture du GT (%), le Dice et l'étendue
+   (% des slices du niveau où la prédiction / le GT n'est pas vide). Les comptes par niveau sont
+   obtenus en une opération vectorisée (sommes cumulées des comptes par slice).
 
 FORMAT DES FICHIERS ATTENDUS :
 -------------------------------
@@ -41,6 +53,7 @@ FORMAT DES FICHIERS ATTENDUS :
 - Les répertoires suivants sont utilisés :
     - `seg_extend_dir` : répertoire des segmentations obtenues avec le nouveau modèle
     - `seg_contrast_agnostic_dir` : répertoire des segmentations contrast-agnostic
+    - `modeles` : {nom du modèle: (répertoire, suffixe)}, construit à partir des deux précédents
     - `seg_gt_dir` : répertoire des segmentations GT 
     - `label_path` : répertoire des labels vertébraux pour localiser C1
 Les répertoires peuvent être modifiés directement dans le script par l'utilisateur
@@ -52,26 +65,38 @@ Avril 2025
 """
 
 import os
-import nibabel as nib
+import sys
 import numpy as np
 import pandas as pd
 from glob import glob
 from pathlib import Path
 
-def compute_c1_coverage(gt_seg, pred_seg, label_sup, label_inf):
-    mask_c1 = np.zeros_like(gt_seg, dtype=bool)
-    if label_sup > label_inf:
-        mask_c1[:, :, label_inf:label_sup+1] = True
-    else:
-        mask_c1[:, :, label_sup:label_inf+1] = True
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "creer_GT"))
+from cache_metadonnees import obtenir_metadonnees
+from outils_nifti import boite_englobante
+from acces_nifti import charger_nifti
 
-    gt_c1 = (gt_seg > 0) & mask_c1
-    pred_c1 = (pred_seg > 0) & mask_c1
+def compute_c1_coverage(gt_seg, pred_seg, label_sup, label_inf):
+    """
+    Pourcentage des voxels du GT couverts par la prédiction entre les slices label_inf et label_sup.
+    :param gt_seg: Proxy nibabel (img.dataobj) ou tableau du GT ; seules les slices de C1 sont lues
+    :param pred_seg: Proxy nibabel ou tableau de la prédiction ; seule la boîte englobante du GT
+                     dans les slices de C1 est lue
+    """
+    # Lire seulement les slices de C1 du GT, dans leur type natif
+    # (gt_seg et pred_seg peuvent aussi être des slabs déjà lus, avec des indices Z relatifs)
+    z_inf, z_sup = sorted((label_inf, label_sup))
+    gt_c1 = np.asanyarray(gt_seg[:, :, z_inf:z_sup+1]) > 0
 
-    total_gt = np.sum(gt_c1)
-    if total_gt == 0:
+    boite = boite_englobante(gt_c1)
+    if boite is None:
         return 0.0
 
+    # Lire seulement la boîte englobante du GT (dans les slices de C1) de la prédiction
+    gt_c1 = gt_c1[boite]
+    pred_c1 = np.asanyarray(pred_seg[boite[0], boite[1], slice(z_inf + boite[2].start, z_inf + boite[2].stop)]) > 0
+
+    total_gt = np.sum(gt_c1)
     covered = np.sum(pred_c1 & gt_c1)
     return (covered / total_gt) * 100
 
@@ -81,64 +106,228 @@ seg_contrast_agnostic_dir = "output_contrast" # À modifier dépendemment de où
 seg_extend_dir = "output_extend-seg-upper-cord_2004" # À modifier dépendemment de où se trouvent les segmentations obtenues par le modèle entraîné
 seg_gt_dir = "data-multi-subject/derivatives/labels_softseg_bin"
 output_csv_path = "c1_coverage_results_2004.csv" # À modifier dépendemment du fichier output désiré
+output_long_csv_path = "c1_coverage_long_2004.csv" # À modifier dépendemment du fichier output (format long) désiré
+output_profile_csv_path = "coverage_profile_2004.csv" # À modifier dépendemment du fichier output (profil par niveau) désiré
 
+# Modèles comparés : {nom: (répertoire, suffixe des fichiers)}. Le premier sert de référence pour le gain.
+# Ajouter une entrée par modèle ou checkpoint à comparer.
+modeles = {
+    "contrast_agnostic": (seg_contrast_agnostic_dir, "_contrast.nii.gz"),
+    "extend_seg": (seg_extend_dir, "_seg_nnunet.nii.gz"),
+}
+garder_incomplets = False # True pour garder les sujets auxquels il manque la prédiction d'un modèle (couverture vide)
 
 
-# Boucler sur les segmentations extend
-results = []
+def lire_labels(label_file):
+    """
+    Lit une seule fois les labels vertébraux (à partir du cache de métadonnées si le fichier de
+    labels n'a pas changé depuis le dernier calcul).
+    :return: Tableau (N, 4) des points [x, y, z, valeur] (coordonnées voxel natives)
+    """
+    labels = obtenir_metadonnees(label_file, ["labels"])["labels"]
+    if labels is None:
+        data = np.asanyarray(charger_nifti(label_file, ombre=True).dataobj)
+        coords = np.argwhere(data > 0)
+        return np.column_stack([coords, data[tuple(coords.T)]]).reshape(-1, 4)
+    return np.array(labels, dtype=float).reshape(-1, 4)
 
-for seg_path in sorted(glob(os.path.join(seg_extend_dir, "*.nii.gz"))):
-    filename = Path(seg_path).name  # ex: sub-unf01_T1w_seg_nnunet.nii.gz
-    subject_and_contrast = filename.replace("_seg_nnunet.nii.gz", "")
-    print(f"Traitement de {subject_and_contrast}")
-    subject = subject_and_contrast.split('_')[0]
-    seg_extend_data = nib.load(seg_path).get_fdata()
 
-    contrast_file = os.path.join(seg_contrast_agnostic_dir, f"{subject_and_contrast}_contrast.nii.gz")
+def labels_c1(labels):
+    """
+    Trouve les slices Z des deux labels les plus hauts (haut et bas de C1).
+    :param labels: Tableau des points [x, y, z, valeur] (voir lire_labels)
+    :return: Tuple (label_sup, label_inf)
+    """
+    # Trier par Z décroissant (du plus haut vers le plus bas)
+    sorted_coords = labels[np.argsort(labels[:, 2])[::-1]]
+
+    # Récupérer les deux plus hauts labels (Z les plus grands)
+    label_sup = int(sorted_coords[0][2])  # haut de C1
+    label_inf = int(sorted_coords[1][2])  # bas de C1
+    return label_sup, label_inf
+
+
+def nom_niveau(valeur):
+    """
+    Nom du niveau vertébral correspondant à une valeur de label (1 -> C1, 8 -> T1, 20 -> L1).
+    """
+    if valeur <= 7:
+        return f"C{valeur}"
+    if valeur <= 19:
+        return f"T{valeur - 7}"
+    return f"L{valeur - 19}"
+
+
+def niveaux_vertebraux(labels):
+    """
+    Déduit les slices de chaque niveau vertébral à partir des labels des disques : le niveau N est
+    compris entre le label de valeur N (haut de la vertèbre) et le label de valeur N+1 (bas de la
+    vertèbre), bornes incluses, comme C1 dans compute_c1_coverage.
+    :param labels: Tableau des points [x, y, z, valeur] (voir lire_labels)
+    :return: Liste de tuples (valeur du niveau, z_bas, z_haut), du haut vers le bas
+    """
+    z_par_valeur = {int(round(valeur)): int(z) for _, _, z, valeur in labels}
+    niveaux = []
+    for valeur in sorted(z_par_valeur):
+        if valeur + 1 in z_par_valeur:
+            z_bas, z_haut = sorted((z_par_valeur[valeur + 1], z_par_valeur[valeur]))
+            niveaux.append((valeur, z_bas, z_haut))
+    return niveaux
+
+
+def profil_niveaux(gt_seg, predictions, niveaux, z0=0):
+    """
+    Calcule, en une passe, la couverture du GT, le Dice et l'étendue de chaque prédiction pour tous
+    les niveaux vertébraux. Seules les slices entre le niveau le plus haut et le plus bas sont lues
+    (une fois par fichier) ; les comptes sont faits slice par slice puis sommés par niveau avec des
+    sommes cumulées.
+    :param gt_seg: Proxy nibabel (img.dataobj) ou tableau du GT
+    :param predictions: Dictionnaire {modèle: proxy nibabel ou tableau de la prédiction}
+    :param niveaux: Liste de tuples (valeur, z_bas, z_haut) (voir niveaux_vertebraux)
+    :param z0: Indice Z de la première slice de gt_seg et des prédictions, si ce sont des slabs
+               déjà lus (0 pour des volumes entiers)
+    :return: Liste de lignes (une par modèle et par niveau)
+    """
+    if not niveaux:
+        return []
+    z_min = min(z_bas for _, z_bas, _ in niveaux)
+    z_max = max(z_haut for _, _, z_haut in niveaux)
+    slab = slice(z_min - z0, z_max + 1 - z0)
+    # Bornes [début, fin[ de chaque niveau, relatives au slab
+    debut = np.array([z_bas - z_min for _, z_bas, _ in niveaux])
+    fin = np.array([z_haut - z_min + 1 for _, _, z_haut in niveaux])
+
+    def par_niveau(par_slice):
+        cumul = np.concatenate(([0], np.cumsum(par_slice)))
+        return cumul[fin] - cumul[debut]
+
+    gt = np.asanyarray(gt_seg[:, :, slab]) > 0
+    gt_par_slice = np.count_nonzero(gt, axis=(0, 1))
+    n_gt = par_niveau(gt_par_slice)
+    slices_gt = par_niveau(gt_par_slice > 0)
+    n_slices = fin - debut
+
+    lignes = []
+    for modele, pred_seg in predictions.items():
+        pred = np.asanyarray(pred_seg[:, :, slab]) > 0
+        pred_par_slice = np.count_nonzero(pred, axis=(0, 1))
+        intersection = par_niveau(np.count_nonzero(pred & gt, axis=(0, 1)))
+        n_pred = par_niveau(pred_par_slice)
+        slices_pred = par_niveau(pred_par_slice > 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            couverture = np.where(n_gt > 0, intersection / n_gt * 100, np.nan)
+            dice = np.where(n_gt + n_pred > 0, 2 * intersection / (n_gt + n_pred), np.nan)
+
+        for i, (valeur, z_bas, z_haut) in enumerate(niveaux):
+            lignes.append({
+                "model": modele,
+                "level": nom_niveau(valeur),
+                "z_inf": z_bas,
+                "z_sup": z_haut,
+                "coverage (%)": couverture[i],
+                "dice": dice[i],
+                "extent_pred (%)": slices_pred[i] / n_slices[i] * 100,
+                "extent_gt (%)": slices_gt[i] / n_slices[i] * 100,
+            })
+    return lignes
+
+
+def lister_sujets():
+    """
+    Trouve tous les sujets/contrastes ayant au moins une prédiction, et les prédictions de chaque modèle.
+    :return: Dictionnaire trié {sujet_contraste: {modèle: chemin}}
+    """
+    sujets = {}
+    for modele, (dossier, suffixe) in modeles.items():
+        for seg_path in glob(os.path.join(dossier, f"*{suffixe}")):
+            subject_and_contrast = Path(seg_path).name[:-len(suffixe)]  # ex: sub-unf01_T1w
+            sujets.setdefault(subject_and_contrast, {})[modele] = seg_path
+    return dict(sorted(sujets.items()))
+
+
+def evaluer_sujet(subject_and_contrast, predictions):
+    """
+    Charge le GT et les labels une seule fois et calcule, pour chaque prédiction, la couverture de
+    C1 et le profil par niveau vertébral.
+    :return: Tuple ({modèle: couverture de C1 (%)}, lignes du profil par niveau), ou None si le GT
+             ou les labels manquent
+    """
+    subject = subject_and_contrast.split('_')[0]
     gt_file = os.path.join(seg_gt_dir, f"{subject}/anat/{subject_and_contrast}_desc-softseg_label-SC_seg.nii.gz")
+    label_file = os.path.join(label_path, subject, "anat", f"{subject_and_contrast}_label-discs_dlabel.nii.gz")
 
-    if not os.path.exists(contrast_file):
-        print(f"Fichier contrast manquant pour {subject_and_contrast}")
-        continue
     if not os.path.exists(gt_file):
         print(f"Fichier gt manquant pour {subject_and_contrast}")
-        continue
-    
-    seg_contrast_data = nib.load(contrast_file).get_fdata()
-    gt_data = nib.load(gt_file).get_fdata()
+        return None
+    if not os.path.exists(label_file):
+        print(f"Fichier de labels manquant pour {subject_and_contrast}")
+        return None
 
-    label_file = os.path.join(label_path, subject, "anat", f"{subject_and_contrast}_label-discs_dlabel.nii.gz")
+    labels = lire_labels(label_file)
+    label_sup, label_inf = labels_c1(labels)
+    niveaux = niveaux_vertebraux(labels)
+
+    print(f"Label supérieur (haut C1) : slice z = {label_sup}")
+    print(f"Label inférieur (bas C1) : slice z = {label_inf}")
 
-    # Charger les labels
-    label_img = nib.load(label_file)
-    label_data = label_img.get_fdata()
+    # Lire une seule fois, pour chaque fichier, les slices de C1 et de tous les niveaux
+    z_utiles = [label_sup, label_inf] + [z for _, z_bas, z_haut in niveaux for z in (z_bas, z_haut)]
+    z0, z1 = min(z_utiles), max(z_utiles) + 1
+    gt_data = np.asanyarray(charger_nifti(gt_file, ombre=True).dataobj[:, :, z0:z1])
+    seg_data = {modele: np.asanyarray(charger_nifti(seg_path, ombre=True).dataobj[:, :, z0:z1])
+                for modele, seg_path in predictions.items()}
 
-    # Trouver toutes les coordonnées de labels > 0
-    coords = np.argwhere(label_data > 0)
+    couvertures = {modele: compute_c1_coverage(gt_data, data, label_sup - z0, label_inf - z0)
+                   for modele, data in seg_data.items()}
+    profil = profil_niveaux(gt_data, seg_data, niveaux, z0)
+    return couvertures, profil
 
-    # Trier par Z décroissant (du plus haut vers le plus bas)
-    sorted_coords = coords[np.argsort(coords[:, 2])[::-1]]
 
-    # Récupérer les deux plus hauts labels (Z les plus grands)
-    label_sup = int(sorted_coords[0][2])  # haut de C1
-    label_inf = int(sorted_coords[1][2])  # bas de C1
+def main():
+    reference = next(iter(modeles))
+    autres = [m for m in modeles if m != reference]
 
-    print(f"Label supérieur (haut C1) : slice z = {label_sup}")
-    print(f"Label inférieur (bas C1) : slice z = {label_inf}")  
+    results, long_results, profile_results = [], [], []
+    for subject_and_contrast, predictions in lister_sujets().items():
+        print(f"Traitement de {subject_and_contrast}")
+        manquants = [m for m in modeles if m not in predictions]
+        if manquants:
+            print(f"Fichier manquant pour {subject_and_contrast} ({', '.join(manquants)})")
+            if not garder_incomplets:
+                continue
+
+        resultat = evaluer_sujet(subject_and_contrast, predictions)
+        if resultat is None:
+            continue
+        couvertures, profil = resultat
+
+        ligne = {"subject": subject_and_contrast}
+        for modele in modeles:
+            ligne[f"coverage_{modele} (%)"] = couvertures.get(modele, np.nan)
+        for modele in autres:
+            nom_gain = "gain (%)" if len(autres) == 1 else f"gain_{modele} (%)"
+            ligne[nom_gain] = couvertures.get(modele, np.nan) - couvertures.get(reference, np.nan)
+        results.append(ligne)
+
+        subject, contrast = subject_and_contrast.split('_')[:2]
+        long_results.extend({"subject": subject, "contrast": contrast, "model": modele,
+                             "metric": "coverage_c1_pct", "value": couverture}
+                            for modele, couverture in couvertures.items())
+        profile_results.extend({"subject": subject, "contrast": contrast, **ligne} for ligne in profil)
+
+    # Sauvegarder
+    df = pd.DataFrame(results)
+    df.to_csv(output_csv_path, index=False)
+    print(f"Résultats sauvegardés dans {output_csv_path}")
 
-    coverage_contrast = compute_c1_coverage(gt_data, seg_contrast_data, label_sup, label_inf)
-    coverage_extend = compute_c1_coverage(gt_data, seg_extend_data, label_sup, label_inf)
-    gain = coverage_extend - coverage_contrast
+    pd.DataFrame(long_results, columns=["subject", "contrast", "model", "metric", "value"]).to_csv(
+        output_long_csv_path, index=False)
+    print(f"Résultats (format long) sauvegardés dans {output_long_csv_path}")
 
+    pd.DataFrame(profile_results).to_csv(output_profile_csv_path, index=False)
+    print(f"Profil par niveau sauvegardé dans {output_profile_csv_path}")
 
-    results.append({
-        "subject": subject_and_contrast,
-        "coverage_contrast_agnostic (%)": coverage_contrast,
-        "coverage_extend_seg (%)": coverage_extend,
-        "gain (%)": gain
-    })
 
-# Sauvegarder
-df = pd.DataFrame(results)
-df.to_csv(output_csv_path, index=False)
-print(f"Résultats sauvegardés dans {output_csv_path}")
+if __name__ == '__main__':
+    main()
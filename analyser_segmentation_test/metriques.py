@@ -0,0 +1,172 @@
+"""
+Calcul en mémoire des métriques de comparaison entre une segmentation prédite et une segmentation
+de référence, sans appeler `sct_dice_coefficient`.
+
+OBJECTIF :
+----------
+compute_dice_scores.py lançait `sct_dice_coefficient` pour chaque sujet/contraste et lisait le
+Dice dans sa sortie texte, ce qui coûte le démarrage de SCT à chaque paire. Ce module calcule
+directement, à partir des masques binaires :
+  - le Dice et l'indice de Jaccard ;
+  - les volumes (mm³) et la différence de volume relative (%) ;
+  - (optionnel) la distance de Hausdorff et la distance de surface moyenne symétrique (ASSD), en mm.
+
+FONCTIONNEMENT :
+----------------
+1. Chaque fichier est lu une seule fois, dans son type natif, et binarisé (voxels > 0).
+2. Les comptes sont faits sur la boîte englobante commune des deux masques (voir outils_nifti.py).
+3. Pour les distances, les surfaces sont les voxels du masque qui ont un voisin hors du masque ;
+   la distance de chaque voxel de surface à la surface de l'autre masque vient d'une transformée
+   de distance euclidienne (scipy) qui tient compte de la taille des voxels.
+4. Pour comparer plusieurs prédictions à la même référence (ex: plusieurs modèles),
+   `metriques_predictions` ne charge la référence qu'une seule fois. Une erreur sur une
+   prédiction donne des métriques vides (None) pour cette prédiction. Le traitement des sujets en
+   parallèle est fait par compute_dice_scores.py.
+
+UTILISATION :
+-------------
+Depuis Python :
+
+    from metriques import metriques_paire
+    resultat = metriques_paire("sub-XXX_T1w_seg_nnunet.nii.gz", "sub-XXX_T1w_desc-softseg_label-SC_seg.nii.gz")
+
+En ligne de commande (équivalent de sct_dice_coefficient -i ... -d ...) :
+
+    python analyser_segmentation_test/metriques.py -i prediction.nii.gz -d reference.nii.gz -distances
+
+ARGUMENTS :
+-----------
+- `-i`          : segmentation prédite
+- `-d`          : segmentation de référence
+- `-distances`  : (Optionnel) calculer aussi la distance de Hausdorff et l'ASSD
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+from scipy.ndimage import binary_erosion, distance_transform_edt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "creer_GT"))
+from outils_nifti import boite_englobante, union_boites
+from acces_nifti import charger_nifti
+
+METRIQUES = ["dice", "jaccard", "volume_pred_mm3", "volume_gt_mm3", "diff_volume_pct"]
+METRIQUES_DISTANCES = ["hausdorff_mm", "assd_mm"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Calcule le Dice (et d'autres métriques) entre une segmentation prédite et une référence.")
+    parser.add_argument("-i", type=str, required=True, help="Segmentation prédite")
+    parser.add_argument("-d", type=str, required=True, help="Segmentation de référence")
+    parser.add_argument("-distances", action="store_true", help="Calculer aussi la distance de Hausdorff et l'ASSD")
+    return parser
+
+
+def charger_binaire(chemin):
+    """
+    Charge un masque dans son type natif et le binarise (voxels > 0).
+    :return: Tuple (masque booléen, taille des voxels en mm selon X, Y et Z)
+    """
+    img = charger_nifti(chemin, ombre=True)
+    return np.asanyarray(img.dataobj) > 0, tuple(float(z) for z in img.header.get_zooms()[:3])
+
+
+def surface(masque):
+    """
+    Voxels du masque ayant au moins un voisin (6-connexité) hors du masque.
+    """
+    return masque & ~binary_erosion(masque, border_value=0)
+
+
+def distances_surfaces(pred, gt, zooms):
+    """
+    Calcule la distance de Hausdorff et l'ASSD (mm) entre les surfaces de deux masques non vides.
+    :return: Tuple (hausdorff, assd)
+    """
+    surface_pred, surface_gt = surface(pred), surface(gt)
+    # Distance de chaque voxel à la surface la plus proche de l'autre masque
+    distance_a_gt = distance_transform_edt(~surface_gt, sampling=zooms)[surface_pred]
+    distance_a_pred = distance_transform_edt(~surface_pred, sampling=zooms)[surface_gt]
+    hausdorff = max(distance_a_gt.max(), distance_a_pred.max())
+    assd = (distance_a_gt.sum() + distance_a_pred.sum()) / (distance_a_gt.size + distance_a_pred.size)
+    return float(hausdorff), float(assd)
+
+
+def comparer_masques(pred, gt, zooms, distances=False):
+    """
+    Calcule les métriques entre deux masques booléens de même dimension.
+    :param zooms: Taille des voxels (mm) selon X, Y et Z
+    :param distances: Si True, calcule aussi la distance de Hausdorff et l'ASSD
+    :return: Dictionnaire {métrique: valeur} (NaN si la métrique n'est pas définie)
+    """
+    if pred.shape != gt.shape:
+        raise ValueError(f"Dimensions différentes : prédiction={pred.shape}, référence={gt.shape}")
+
+    resultat = dict.fromkeys(METRIQUES + (METRIQUES_DISTANCES if distances else []), np.nan)
+    boite = union_boites(boite_englobante(pred), boite_englobante(gt))
+    if boite is None:
+        # Les deux masques sont vides
+        resultat.update(volume_pred_mm3=0.0, volume_gt_mm3=0.0)
+        return resultat
+
+    # Une marge d'un voxel garde le bord des masques dans la boîte (surfaces et distances)
+    boite = tuple(slice(max(0, b.start - 1), min(n, b.stop + 1)) for b, n in zip(boite, pred.shape))
+    pred, gt = pred[boite], gt[boite]
+
+    n_pred, n_gt = np.count_nonzero(pred), np.count_nonzero(gt)
+    intersection = np.count_nonzero(pred & gt)
+    union = n_pred + n_gt - intersection
+    volume_voxel = float(np.prod(zooms))
+
+    resultat["dice"] = 2 * intersection / (n_pred + n_gt)
+    resultat["jaccard"] = intersection / union
+    resultat["volume_pred_mm3"] = n_pred * volume_voxel
+    resultat["volume_gt_mm3"] = n_gt * volume_voxel
+    if n_gt:
+        resultat["diff_volume_pct"] = (n_pred - n_gt) / n_gt * 100
+    if distances and n_pred and n_gt:
+        resultat["hausdorff_mm"], resultat["assd_mm"] = distances_surfaces(pred, gt, zooms)
+    return resultat
+
+
+def metriques_paire(pred_path, gt_path, distances=False):
+    """
+    Charge une paire (prédiction, référence) une seule fois et calcule ses métriques.
+    """
+    pred, zooms = charger_binaire(pred_path)
+    gt, _ = charger_binaire(gt_path)
+    return comparer_masques(pred, gt, zooms, distances)
+
+
+def metriques_predictions(gt_path, pred_paths, distances=False):
+    """
+    Charge la référence une seule fois et la compare à plusieurs prédictions (ex: plusieurs modèles).
+    :param pred_paths: Dictionnaire {modèle: pred_path}
+    :return: Dictionnaire {modèle: métriques, ou None en cas d'erreur sur cette prédiction}
+    """
+    gt, zooms = charger_binaire(gt_path)
+    resultats = {}
+    for modele, pred_path in pred_paths.items():
+        try:
+            pred, _ = charger_binaire(pred_path)
+            resultats[modele] = comparer_masques(pred, gt, zooms, distances)
+        except Exception as e:
+            print(f"Erreur avec {pred_path} : {e}")
+            resultats[modele] = None
+    return resultats
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    resultat = metriques_paire(args.i, args.d, args.distances)
+    print(f"Dice coefficient = {resultat['dice']}")
+    for metrique, valeur in resultat.items():
+        if metrique != "dice":
+            print(f"{metrique} = {valeur}")
+
+
+if __name__ == '__main__':
+    main()
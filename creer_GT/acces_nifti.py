@@ -0,0 +1,183 @@
+"""
+Accès aux fichiers NIfTI compressés par une copie non compressée (« ombre ») lue en mémoire
+partagée (memory map).
+
+OBJECTIF :
+----------
+Les masques du dataset (GT, labels, prédictions) sont en .nii.gz : chaque lecture doit tout
+décompresser avec zlib, même si le même fichier a déjà été lu lors de l'exécution précédente.
+Ce module garde, pour les fichiers .nii.gz du dataset relus à chaque analyse (charger_nifti(...,
+ombre=True)), une copie .nii non compressée dans le dossier du cache (voir cache_metadonnees.py). Les lectures suivantes ouvrent cette copie en memory map : les
+données sont lues dans leur type natif, seulement pour les parties utilisées, et restent dans le
+cache de pages du système d'une analyse à l'autre.
+
+FONCTIONNEMENT :
+----------------
+- Le nom de l'ombre contient le hash du chemin absolu du fichier d'origine, sa date de
+  modification et sa taille : si le fichier d'origine change, l'ancienne ombre ne correspond plus
+  et une nouvelle est créée (les anciennes ombres du même fichier sont supprimées).
+- L'ombre contient exactement l'en-tête et les données brutes (non mises à l'échelle) du fichier
+  d'origine : l'image obtenue a la même géométrie, le même type et les mêmes valeurs.
+- L'ombre est écrite dans un fichier temporaire unique (tempfile) puis renommée, donc plusieurs
+  processus ou threads peuvent lire le même fichier en même temps.
+- Les ombres sont opt-in : les fichiers lus une seule fois (fichiers intermédiaires, images
+  anatomiques, calcul des métadonnées) sont lus directement, sans ombre.
+- La taille du dossier des ombres est limitée (EXTEND_SEG_OMBRES_MAX, en Go, 5 par défaut) : après
+  chaque nouvelle ombre, les ombres les moins récemment utilisées sont supprimées.
+- Si le cache est désactivé (EXTEND_SEG_CACHE=""), si le fichier n'est pas compressé ou si
+  l'ombre ne peut pas être écrite, le fichier d'origine est lu directement.
+- Les masques au format compact .msk (voir masque_compact.py) sont lus directement, sans ombre :
+  leurs slices sont déjà accessibles une par une.
+
+UTILISATION :
+-------------
+    from acces_nifti import charger_nifti
+
+    img = charger_nifti("sub-XXX_T1w_desc-softseg_label-SC_seg.nii.gz", ombre=True)
+    data = np.asanyarray(img.dataobj)   # memmap dans le type natif
+    slab = img.dataobj[:, :, 40:50]     # seules ces slices sont lues
+"""
+
+import os
+import glob
+import hashlib
+import tempfile
+import nibabel as nib
+import numpy as np
+from nibabel.spatialimages import HeaderDataError
+from cache_metadonnees import chemin_cache
+from masque_compact import MasqueCompact, EXTENSION as EXTENSION_COMPACT
+
+# Taille maximale (Go) du dossier des ombres, modifiable avec EXTEND_SEG_OMBRES_MAX
+TAILLE_MAX_OMBRES = 5
+
+
+def taille_max_ombres():
+    """
+    Taille maximale du dossier des ombres, en octets.
+    """
+    return float(os.environ.get("EXTEND_SEG_OMBRES_MAX", TAILLE_MAX_OMBRES)) * 1024 ** 3
+
+
+def dossier_ombres():
+    """
+    Dossier des ombres, à côté du cache de métadonnées (None si le cache est désactivé).
+    """
+    chemin_db = chemin_cache()
+    if chemin_db is None:
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(chemin_db)), "ombres")
+
+
+def chemin_ombre(chemin):
+    """
+    Chemin de l'ombre correspondant à l'état actuel d'un fichier .nii.gz, ou None si le fichier ne
+    doit pas avoir d'ombre (fichier non compressé ou cache désactivé).
+    """
+    dossier = dossier_ombres()
+    if dossier is None or not chemin.endswith(".nii.gz"):
+        return None
+    chemin_abs = os.path.abspath(chemin)
+    stat = os.stat(chemin_abs)
+    prefixe = hashlib.sha1(chemin_abs.encode()).hexdigest()
+    return os.path.join(dossier, f"{prefixe}_{stat.st_mtime_ns}_{stat.st_size}.nii")
+
+
+def debut_donnees(header):
+    """
+    Début des données dans l'ombre : taille de l'en-tête (NIfTI-1 ou NIfTI-2) plus le bloc (vide)
+    d'extensions, arrondi au multiple de 16 supérieur (352 en NIfTI-1, 544 en NIfTI-2).
+    """
+    return -(-(int(header.sizeof_hdr) + 4) // 16) * 16
+
+
+def ecrire_ombre(img, ombre):
+    """
+    Écrit l'en-tête et les données brutes d'une image dans un fichier .nii non compressé, puis
+    supprime les anciennes ombres du même fichier d'origine.
+    """
+    os.makedirs(os.path.dirname(ombre), exist_ok=True)
+    header = img.header.copy()
+    header.extensions.clear()
+    debut = debut_donnees(header)
+    header.set_data_offset(debut)
+    # nibabel retire la mise à l'échelle de l'en-tête au chargement : la remettre depuis dataobj
+    header.set_slope_inter(img.dataobj.slope, img.dataobj.inter)
+
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(ombre))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            header.write_to(f)
+            f.write(b"\0" * (debut - f.tell()))
+            header.data_to_fileobj(np.asanyarray(img.dataobj.get_unscaled()), f, rescale=False)
+        os.replace(tmp, ombre)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+    prefixe = os.path.basename(ombre).split("_")[0]
+    for ancienne in glob.glob(os.path.join(os.path.dirname(ombre), f"{prefixe}_*.nii")):
+        if ancienne != ombre:
+            try:
+                os.remove(ancienne)
+            except OSError:
+                pass
+    limiter_ombres(os.path.dirname(ombre), garder=ombre)
+
+
+def limiter_ombres(dossier, garder=None, taille_max=None):
+    """
+    Supprime les ombres les moins récemment utilisées (date de modification, mise à jour à chaque
+    lecture) jusqu'à ce que le dossier ne dépasse plus la taille maximale.
+    :param garder: Ombre à ne pas supprimer (ex: celle qui vient d'être écrite)
+    :param taille_max: Taille maximale en octets (par défaut taille_max_ombres())
+    """
+    taille_max = taille_max_ombres() if taille_max is None else taille_max
+    ombres = []
+    for chemin in glob.glob(os.path.join(dossier, "*.nii")):
+        try:
+            stat = os.stat(chemin)
+        except OSError:
+            continue
+        ombres.append((stat.st_mtime_ns, stat.st_size, chemin))
+    total = sum(taille for _, taille, _ in ombres)
+    for _, taille, chemin in sorted(ombres):
+        if total <= taille_max:
+            break
+        if chemin == garder:
+            continue
+        try:
+            os.remove(chemin)
+        except OSError:
+            continue
+        total -= taille
+
+
+def charger_nifti(chemin, ombre=False):
+    """
+    Charge une image NIfTI, en passant par son ombre non compressée si ombre est True.
+    :param chemin: Chemin du fichier NIfTI (.nii.gz ou .nii) ou d'un masque compact (.msk)
+    :param ombre: True pour les fichiers du dataset relus d'une exécution à l'autre (GT, labels,
+                  prédictions analysées) : l'ombre est créée au besoin. False (par défaut) pour
+                  les fichiers lus une seule fois (fichiers intermédiaires, images anatomiques).
+    :return: Image nibabel dont dataobj donne les données dans leur type natif (memmap si possible),
+             ou MasqueCompact pour un fichier .msk
+    """
+    if chemin.endswith(EXTENSION_COMPACT):
+        return MasqueCompact(chemin)
+    chemin_o = chemin_ombre(chemin) if ombre else None
+    if chemin_o is None:
+        return nib.load(chemin, mmap=True)
+    if os.path.exists(chemin_o):
+        try:
+            # Date de modification mise à jour : l'ombre devient la plus récemment utilisée
+            os.utime(chemin_o)
+            return nib.load(chemin_o, mmap=True)
+        except OSError:
+            pass  # Ombre supprimée entre-temps (limite de taille) : elle est recréée
+    try:
+        ecrire_ombre(nib.load(chemin), chemin_o)
+        return nib.load(chemin_o, mmap=True)
+    except (OSError, HeaderDataError) as e:
+        print(f"Impossible d'écrire l'ombre de {chemin} : {e}")
+        return nib.load(chemin)
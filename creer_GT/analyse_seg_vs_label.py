@@ -15,16 +15,39 @@ Il permet de :
    - `recapitulatif.csv` : tableau récapitulatif des statistiques.
    - `gt_negatif.csv` : sujets avec une valeur de GT inférieure à 5.
 
+ANALYSE DE PLUSIEURS MÉTHODES (`-multi` ou `-db`) :
+--------------------------------------------------
+Au lieu des deux colonnes propseg et GT, toutes les méthodes sont analysées en une seule passe,
+à partir des résultats au format long (base SQLite de resultats.py avec `-db`, ou CSV large
+de seg_vs_label.py avec `-f`, converti au format long). Pour chaque méthode :
+  - nombre de sujets, nombre de valeurs manquantes (N/A), moyenne, médiane, écart-type, min et max ;
+  - pour chaque seuil de `-seuils`, nombre de sujets dont la valeur est inférieure au seuil.
+Les statistiques viennent d'un seul groupby sur les méthodes, et les comparaisons aux seuils sont
+faites pour tous les seuils à la fois. Deux fichiers sont écrits :
+   - `recapitulatif_methodes.csv` : une ligne par méthode (colonnes `sous_<seuil>` pour les seuils) ;
+   - `sujets_sous_seuil.csv`     : Sujet, methode, seuil, valeur pour chaque sujet sous un seuil
+                                   (l'équivalent de gt_negatif.csv pour toutes les méthodes).
+
 UTILISATION :
 -------------
 Ce script peut être exécuté depuis la ligne de commande avec les arguments suivants :
 
     python analyse_gt_propseg.py -f chemin/vers/fichier.csv -o chemin/vers/dossier_output
 
+Pour analyser toutes les méthodes de la base de résultats avec plusieurs seuils :
+
+    python analyse_seg_vs_label.py -db resultats.sqlite -seuils 0 5 10 -o resultats_analyses
+
 ARGUMENTS :
 -----------
 - `-f` : chemin du fichier CSV contenant les colonnes "Sujet", "GT", "propseg".
 - `-o` : chemin du dossier de sortie où seront écrits les fichiers de résultats.
+- `-multi`    : (Optionnel) analyser toutes les méthodes du CSV (`-f`) au lieu de propseg et GT.
+- `-db`       : (Optionnel) base SQLite des résultats (voir resultats.py), à la place de `-f` ;
+                implique `-multi`.
+- `-run`      : (Optionnel) avec `-db`, seul run analysé (par défaut la valeur la plus récente).
+- `-methodes` : (Optionnel) méthodes analysées (par défaut toutes).
+- `-seuils`   : (Optionnel) seuils d'écart (slices) ; défaut : 5.
 
 EXEMPLE :
 ---------
@@ -38,8 +61,80 @@ Mélisende St-Amour-Bilodeau
 Date : Avril 2025
 """
 
+import os
 import pandas as pd
+import numpy as np
 import argparse
+from resultats import lire_long, depuis_large
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Analyse un fichier de GT_vs_label et génère des rapports.")
+    parser.add_argument("-f", type=str, help="Chemin du fichier CSV à analyser")
+    parser.add_argument("-o", type=str, help="Dossier où sauvegarder les résultats")
+    parser.add_argument("-multi", action="store_true", help="Analyser toutes les méthodes du CSV en une seule passe")
+    parser.add_argument("-db", type=str, default=None, help="Base SQLite des résultats (voir resultats.py), à la place de -f")
+    parser.add_argument("-run", type=str, default=None, help="Avec -db, seul run analysé")
+    parser.add_argument("-methodes", type=str, nargs="+", default=None, help="Méthodes analysées (par défaut toutes)")
+    parser.add_argument("-seuils", type=float, nargs="+", default=[5], help="Seuils d'écart en slices (défaut : 5)")
+    return parser
+
+
+def charger_long(file_path=None, db=None, run=None, methodes=None):
+    """
+    Charge les écarts au format long, depuis la base de résultats ou depuis un CSV large.
+    :return: DataFrame (Sujet, methode, valeur), Sujet au format de seg_vs_label.py (ex: sub-amu01T1w)
+    """
+    if db:
+        df = lire_long(db, methodes=methodes, run=run)
+    else:
+        df = depuis_large(pd.read_csv(file_path))
+        if methodes is not None:
+            df = df[df["methode"].isin(methodes)]
+    df = df.assign(Sujet=df["sujet"] + df["contraste"], valeur=pd.to_numeric(df["valeur"], errors="coerce"))
+    return df[["Sujet", "methode", "valeur"]]
+
+
+def analyser_methodes(df_long, seuils):
+    """
+    Statistiques et comparaison aux seuils pour toutes les méthodes à la fois.
+    :param df_long: DataFrame (Sujet, methode, valeur)
+    :param seuils: Liste de seuils d'écart
+    :return: Tuple (récapitulatif par méthode, DataFrame des sujets sous un seuil)
+    """
+    seuils = sorted(seuils)
+    groupes = df_long.groupby("methode", sort=False)["valeur"]
+    recap = groupes.agg(nb_sujets="size", nb_valeurs="count", moyenne="mean", mediane="median",
+                        ecart_type="std", min="min", max="max")
+    recap.insert(2, "nb_manquants", recap["nb_sujets"] - recap["nb_valeurs"])
+
+    # Comparaison de toutes les valeurs à tous les seuils en une seule opération (NaN -> False)
+    sous = df_long["valeur"].to_numpy()[:, None] < np.asarray(seuils, dtype=float)[None, :]
+    noms = [f"sous_{seuil:g}" for seuil in seuils]
+    comptes = pd.DataFrame(sous, columns=noms, index=df_long.index).groupby(df_long["methode"], sort=False).sum()
+    recap = recap.join(comptes).reset_index()
+
+    lignes, colonnes = np.nonzero(sous)
+    sujets_sous_seuil = pd.DataFrame({
+        "Sujet": df_long["Sujet"].to_numpy()[lignes],
+        "methode": df_long["methode"].to_numpy()[lignes],
+        "seuil": np.asarray(seuils)[colonnes],
+        "valeur": df_long["valeur"].to_numpy()[lignes],
+    }).sort_values(["methode", "seuil", "Sujet"])
+    return recap, sujets_sous_seuil
+
+
+def analyser_multi(output_path, file_path=None, db=None, run=None, methodes=None, seuils=(5,)):
+    """
+    Analyse toutes les méthodes et écrit recapitulatif_methodes.csv et sujets_sous_seuil.csv.
+    """
+    df_long = charger_long(file_path, db, run, methodes)
+    recap, sujets_sous_seuil = analyser_methodes(df_long, seuils)
+    recap.to_csv(os.path.join(output_path, "recapitulatif_methodes.csv"), index=False)
+    sujets_sous_seuil.to_csv(os.path.join(output_path, "sujets_sous_seuil.csv"), index=False)
+    print(f"Analyse de {len(recap)} méthode(s) terminée. Résultats sauvegardés dans {output_path}.")
+    return recap, sujets_sous_seuil
+
 
 def analyze_segmentation(file_path, output_path):
     # Charger le fichier CSV
@@ -81,10 +176,10 @@ def analyze_segmentation(file_path, output_path):
     print("Analyse terminée. Résultats sauvegardés dans le dossier spécifié.")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Analyse un fichier de GT_vs_label et génère des rapports.")
-    parser.add_argument("-f", type=str, help="Chemin du fichier CSV à analyser")
-    parser.add_argument("-o", type=str, help="Dossier où sauvegarder les résultats")
-    
+    parser = get_parser()
     args = parser.parse_args()
-    
-    analyze_segmentation(args.f, args.o)
+
+    if args.multi or args.db:
+        analyser_multi(args.o, args.f, args.db, args.run, args.methodes, args.seuils)
+    else:
+        analyze_segmentation(args.f, args.o)
@@ -18,7 +18,9 @@ FONCTIONNEMENT :
 2. Pour chaque sujet :
    - Charge la segmentation d’entrée au format `.nii.gz`.
    - Applique un **zoom isotrope slice par slice (XY)** avec recentrage basé sur le centre de masse.
-   - Sauvegarde la nouvelle segmentation mise à l’échelle.
+     Les centres de masse de toutes les slices sont calculés en une fois et le zoom est fait en
+     une seule interpolation (plus proche voisin) limitée à la boîte englobante de la segmentation.
+   - Sauvegarde la nouvelle segmentation mise à l’échelle (uint8).
 3. Les images sont sauvegardées dans un dossier de sortie avec le suffixe `_seg_corrige.nii.gz`.
 
 STRUCTURE ATTENDUE DES DONNÉES :
@@ -52,95 +54,113 @@ import nibabel as nib
 import numpy as np
 import pandas as pd
 import os
-from scipy.ndimage import zoom
-from scipy.ndimage import center_of_mass
+from scipy.ndimage import map_coordinates
+from outils_nifti import boite_englobante, boite_depuis_bornes, appliquer_dans_boite
+from acces_nifti import charger_nifti
 
 # === PARAMÈTRES ===
 csv_path = "test_2004/facteurs_echelle_2004.csv" # À modifier selon le nom du fichier CSV contenant les facteurs d'échelle
 input_seg_dir = "test_2004/output_modif/anat"  # À modifier selon le chemin contenant les segmentations auxquelles appliquer le facteur d'échelle
 output_seg_dir = "test_2004/propseg_echelle_2004"  # À modifier selon là où on veut enregistrer les segmentations modifiées
-os.makedirs(output_seg_dir, exist_ok=True)
 
-def scale_segmentation_per_slice(input_path, output_path, scale_factor):
-    img = nib.load(input_path)
-    data = img.get_fdata()
-    affine = img.affine
-
-    output = np.zeros_like(data)
-
-    for z in range(data.shape[2]):
-        slice_bin = data[:, :, z]
-        if np.sum(slice_bin) == 0:
-            continue
-
-        # Zoom de la slice (scaling)
-        zoomed_img = zoom(slice_bin, zoom=(scale_factor, scale_factor), order=0)
-
-        # Calcul du centre de masse original et zoomé
-        original_com = center_of_mass(slice_bin)
-        zoomed_com = center_of_mass(zoomed_img)
-
-        # Décalage requis pour recentrer
-        shift_x = int(round(original_com[0] - zoomed_com[0]))
-        shift_y = int(round(original_com[1] - zoomed_com[1]))
 
-        # Dimensions
-        h, w = slice_bin.shape
-        zh, zw = zoomed_img.shape
+def zoomer_slices(bloc, scale_factor):
+    """
+    Zoom 2D (XY) de facteur scale_factor de chaque slice d'un masque, autour du centre de masse de
+    la slice, en une seule interpolation (plus proche voisin) sur tout le bloc.
+    Le pixel (x, y) de la slice z de la sortie prend la valeur du pixel d'entrée
+    (cx + (x - cx) / facteur, cy + (y - cy) / facteur), où (cx, cy) est le centre de masse de la slice z.
+    :param bloc: Masque 3D binaire
+    :param scale_factor: Facteur d'échelle appliqué dans le plan de chaque slice
+    :return: Masque zoomé (uint8), de même dimension que bloc
+    """
+    bloc = (np.asarray(bloc) > 0).astype(np.uint8)
+
+    # Centres de masse de toutes les slices en une seule fois
+    aire = bloc.sum(axis=(0, 1), dtype=np.float64)
+    aire_sure = np.where(aire > 0, aire, 1)
+    cx = (bloc.sum(axis=1) * np.arange(bloc.shape[0])[:, None]).sum(axis=0) / aire_sure
+    cy = (bloc.sum(axis=0) * np.arange(bloc.shape[1])[:, None]).sum(axis=0) / aire_sure
+
+    gx = np.arange(bloc.shape[0], dtype=np.float64)[:, None, None]
+    gy = np.arange(bloc.shape[1], dtype=np.float64)[None, :, None]
+    coords = np.empty((3,) + bloc.shape, dtype=np.float64)
+    coords[0] = cx + (gx - cx) / scale_factor
+    coords[1] = cy + (gy - cy) / scale_factor
+    coords[2] = np.arange(bloc.shape[2], dtype=np.float64)[None, None, :]
+
+    # 'grid-constant' : les points entre le centre d'un voxel de bord et le bord du bloc gardent
+    # la valeur de ce voxel ('constant' les mettait à 0 et la première/dernière rangée était perdue)
+    return map_coordinates(bloc, coords, output=np.uint8, order=0, mode='grid-constant', cval=0)
+
+
+def mettre_a_echelle(data, scale_factor):
+    """
+    Applique un zoom 2D (XY) de facteur scale_factor à chaque slice non vide d'un masque binaire,
+    autour du centre de masse de la slice (voir zoomer_slices). Le zoom n'est calculé que sur la
+    boîte englobante de la segmentation, agrandie en XY du déplacement maximal dû au zoom.
+    :param data: Masque 3D (tableau numpy)
+    :param scale_factor: Facteur d'échelle appliqué dans le plan de chaque slice
+    :return: Masque mis à l'échelle (uint8), de même dimension que data
+    """
+    masque = np.asarray(data) > 0
+    boite = boite_englobante(masque)
+    if boite is None:
+        return np.zeros(masque.shape, dtype=np.uint8)
+
+    marge = int(np.ceil(max(scale_factor - 1, 0) * max(boite[0].stop - boite[0].start,
+                                                       boite[1].stop - boite[1].start))) + 1
+    bornes = [(b.start, b.stop) for b in boite]
+    boite = boite_depuis_bornes(bornes, masque.shape, marge, axes=(0, 1))
+    return appliquer_dans_boite(masque, lambda bloc: zoomer_slices(bloc, scale_factor),
+                                boite=boite, dtype=np.uint8)
 
-        # Création de la nouvelle slice vide
-        zoomed_resized = np.zeros_like(slice_bin)
 
-        # Coordonnées de placement (dans la slice d’origine)
-        x_start = max(0, shift_x)
-        y_start = max(0, shift_y)
-        x_end = min(h, shift_x + zh)
-        y_end = min(w, shift_y + zw)
-
-        # Coordonnées de découpe (dans l’image zoomée)
-        zoom_x_start = max(0, -shift_x)
-        zoom_y_start = max(0, -shift_y)
-        zoom_x_end = zoom_x_start + (x_end - x_start)
-        zoom_y_end = zoom_y_start + (y_end - y_start)
-
-        # Insertion de l’image zoomée dans la slice finale
-        zoomed_resized[x_start:x_end, y_start:y_end] = zoomed_img[zoom_x_start:zoom_x_end, zoom_y_start:zoom_y_end]
+def scale_segmentation_per_slice(input_path, output_path, scale_factor):
+    img = charger_nifti(input_path)
+    # Lecture dans le type natif (pas de conversion en float64)
+    data = np.asanyarray(img.dataobj)
 
-        output[:, :, z] = zoomed_resized
+    output = mettre_a_echelle(data, scale_factor)
 
-    nib.save(nib.Nifti1Image(output, affine), output_path)
+    output_img = nib.Nifti1Image(output, img.affine, img.header)
+    output_img.set_data_dtype(np.uint8)
+    nib.save(output_img, output_path)
     print(f"Sauvegardé : {output_path}")
 
 
 # === LECTURE CSV ET TRAITEMENT ===
-df = pd.read_csv(csv_path)
+if __name__ == '__main__':
+    os.makedirs(output_seg_dir, exist_ok=True)
 
-for idx, row in df.iterrows():
-    subject_contrast = row["Sujet"]
-    csa_propseg = row["CSA_PropSeg"]
-    csa_gt = row["CSA_GT"]
-    facteur = row["Facteur_Echelle"]
-    sujet, contraste = subject_contrast.split('_')
+    df = pd.read_csv(csv_path)
 
-     # Skip si facteur est vide ou NaN
-    if pd.isna(facteur):
-        print(f"Facteur vide ou NaN pour {subject_contrast}, skip...")
-        continue
+    for idx, row in df.iterrows():
+        subject_contrast = row["Sujet"]
+        csa_propseg = row["CSA_PropSeg"]
+        csa_gt = row["CSA_GT"]
+        facteur = row["Facteur_Echelle"]
+        sujet, contraste = subject_contrast.split('_')
 
-    try:
-        facteur = float(facteur)
-    except:
-        print(f"Facteur non convertible pour {subject_contrast}, skip...")
-        continue
+         # Skip si facteur est vide ou NaN
+        if pd.isna(facteur):
+            print(f"Facteur vide ou NaN pour {subject_contrast}, skip...")
+            continue
 
-    input_seg = os.path.join(input_seg_dir, f"{sujet}_{contraste}_propseg.nii.gz")
-    output_seg = os.path.join(output_seg_dir, f"{subject_contrast}_seg_corrige.nii.gz")
+        try:
+            facteur = float(facteur)
+        except:
+            print(f"Facteur non convertible pour {subject_contrast}, skip...")
+            continue
+
+        input_seg = os.path.join(input_seg_dir, f"{sujet}_{contraste}_propseg.nii.gz")
+        output_seg = os.path.join(output_seg_dir, f"{subject_contrast}_seg_corrige.nii.gz")
 
-    if not os.path.exists(input_seg):
-        print(f"Fichier manquant : {input_seg}")
-        continue
+        if not os.path.exists(input_seg):
+            print(f"Fichier manquant : {input_seg}")
+            continue
 
-    print(f"Traitement de {subject_contrast} avec facteur {facteur}")
-    scale_segmentation_per_slice(input_seg, output_seg, facteur)
+        print(f"Traitement de {subject_contrast} avec facteur {facteur}")
+        scale_segmentation_per_slice(input_seg, output_seg, facteur)
 
-print("Terminé.")
\ No newline at end of file
+    print("Terminé.")
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Cache persistant des métadonnées dérivées des fichiers NIfTI (segmentations et labels).
+
+OBJECTIF :
+----------
+Plusieurs étapes du pipeline (seg_vs_label.py, crop_above_C1.sh, fusion_seg.sh, couverture_C1.py)
+ouvrent les mêmes fichiers pour recalculer les mêmes informations (ex: la slice Z de C1 dans
+`label-discs_dlabel.nii.gz`, la dernière slice non vide d'une segmentation). Ce module garde ces
+informations dans une base SQLite afin que les relances du pipeline n'aient plus à décompresser
+les fichiers qui n'ont pas changé.
+
+INFORMATIONS STOCKÉES PAR FICHIER :
+-----------------------------------
+- `orientation` : orientation de l'image (ex: "RPI")
+- `forme`       : dimensions du volume
+- `z_max_ras`   : slice Z (repère RAS) non vide la plus haute (voir outils_nifti.z_max_ras)
+- `z_min`, `z_max` : première et dernière slice non vide le long de l'axe voxel Z (axe 2, sans réorientation)
+- `boite`       : boîte englobante des voxels non nuls, [début, fin[ pour chaque axe
+- `labels`      : coordonnées voxel et valeurs [x, y, z, valeur] des voxels non nuls, seulement
+                  pour les fichiers de labels (au plus MAX_POINTS_LABELS voxels non nuls)
+
+FONCTIONNEMENT :
+----------------
+- Chaque entrée est identifiée par le chemin absolu du fichier et validée par sa date de
+  modification (mtime) et sa taille. Si la taille est identique mais que la date a changé
+  (ex: fichier recopié), le hash SHA-256 du fichier est comparé avant d'invalider l'entrée.
+  Ce hash n'est calculé (puis gardé) que dans ce cas : une nouvelle entrée n'a pas de hash, et
+  la première modification de date de même taille recalcule donc ses informations.
+- Les informations ne sont calculées que lorsqu'elles sont demandées, puis ajoutées à l'entrée.
+- L'emplacement de la base peut être modifié avec la variable d'environnement EXTEND_SEG_CACHE.
+  Si cette variable est vide (EXTEND_SEG_CACHE=""), le cache est désactivé et les informations
+  sont recalculées à chaque appel.
+
+UTILISATION :
+-------------
+Depuis Python :
+
+    from cache_metadonnees import obtenir_metadonnees
+    z_c1 = obtenir_metadonnees(label_file, ["z_max"])["z_max"]
+
+Depuis un script bash (une valeur par fichier, vide si le volume est vide) :
+
+    python3 creer_GT/cache_metadonnees.py -i fichier.nii.gz -champ z_max
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+import numpy as np
+from nibabel.orientations import aff2axcodes
+from outils_nifti import z_max_ras, boite_englobante
+
+CHEMIN_CACHE_DEFAUT = os.path.join(os.path.expanduser("~"), ".cache", "extend-seg-upper-cord", "metadonnees.sqlite")
+
+# À incrémenter si la façon de calculer les informations change, pour invalider les anciennes entrées
+VERSION_FAITS = 2
+
+# Au-delà de ce nombre de voxels non nuls, le fichier n'est pas considéré comme un fichier de labels
+MAX_POINTS_LABELS = 100
+
+_connexions = threading.local()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Affiche une information du cache de métadonnées pour un ou plusieurs fichiers NIfTI.")
+    parser.add_argument("-i", type=str, action="append", required=True, help="Fichier NIfTI (peut être répété)")
+    parser.add_argument("-champ", type=str, required=True, help="Information à afficher (ex: z_max, z_max_ras, orientation)")
+    return parser
+
+
+def chemin_cache():
+    """
+    Retourne le chemin de la base SQLite, ou None si le cache est désactivé.
+    """
+    chemin = os.environ.get("EXTEND_SEG_CACHE", CHEMIN_CACHE_DEFAUT)
+    return chemin or None
+
+
+def _connexion(chemin_db):
+    """
+    Retourne une connexion SQLite propre au fil d'exécution courant (une par base).
+    """
+    connexions = getattr(_connexions, "parchemin", None)
+    if connexions is None:
+        connexions = _connexions.parchemin = {}
+    if chemin_db not in connexions:
+        os.makedirs(os.path.dirname(os.path.abspath(chemin_db)), exist_ok=True)
+        con = sqlite3.connect(chemin_db, timeout=60)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS metadonnees ("
+            "chemin TEXT PRIMARY KEY, mtime_ns INTEGER, taille INTEGER, sha256 TEXT, "
+            "version INTEGER, faits TEXT)"
+        )
+        con.commit()
+        connexions[chemin_db] = con
+    return connexions[chemin_db]
+
+
+def hash_fichier(chemin, taille_bloc=1 << 20):
+    """
+    Calcule le hash SHA-256 du contenu (compressé) d'un fichier.
+    """
+    h = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def _faits_entete(img):
+    return {
+        "orientation": "".join(aff2axcodes(img.affine)),
+        "forme": [int(n) for n in img.shape],
+    }
+
+
+def _faits_z_max_ras(img):
+    return {"z_max_ras": z_max_ras(img)}
+
+
+def _faits_contenu(img):
+    """
+    Lit le volume une seule fois dans son type natif pour l'étendue en Z et les labels.
+    """
+    data = np.asanyarray(img.dataobj)
+    masque = data > 0
+    tranches = np.flatnonzero(np.any(masque, axis=(0, 1)))
+    boite = boite_englobante(masque)
+    faits = {
+        "z_min": int(tranches[0]) if tranches.size else None,
+        "z_max": int(tranches[-1]) if tranches.size else None,
+        "boite": None if boite is None else [[b.start, b.stop] for b in boite],
+        "labels": None,
+    }
+    if np.count_nonzero(masque) <= MAX_POINTS_LABELS:
+        coords = np.argwhere(masque)
+        faits["labels"] = [[int(x), int(y), int(z), float(data[x, y, z])] for x, y, z in coords]
+    return faits
+
+
+# Fonction de calcul associée à chaque information
+CALCULS = {
+    "orientation": _faits_entete,
+    "forme": _faits_entete,
+    "z_max_ras": _faits_z_max_ras,
+    "z_min": _faits_contenu,
+    "z_max": _faits_contenu,
+    "boite": _faits_contenu,
+    "labels": _faits_contenu,
+}
+
+
+def _calculer(chemin, champs, faits=None):
+    """
+    Complète le dictionnaire faits avec les informations manquantes parmi champs.
+    """
+    faits = dict(faits or {})
+    img = None
+    for champ in champs:
+        if champ in faits:
+            continue
+        if champ not in CALCULS:
+            raise ValueError(f"Information inconnue : {champ}")
+        if img is None:
+            # Import local : acces_nifti utilise lui-même chemin_cache de ce module
+            from acces_nifti import charger_nifti
+            img = charger_nifti(chemin)
+        faits.update(CALCULS[champ](img))
+    return faits
+
+
+def obtenir_metadonnees(chemin, champs=("orientation", "forme")):
+    """
+    Retourne les informations demandées pour un fichier NIfTI, à partir du cache si le fichier
+    n'a pas changé depuis le dernier calcul.
+    :param chemin: Chemin du fichier NIfTI
+    :param champs: Liste des informations voulues (voir CALCULS)
+    :return: Dictionnaire contenant au moins les informations demandées
+    """
+    chemin_db = chemin_cache()
+    if chemin_db is None:
+        return _calculer(chemin, champs)
+
+    chemin_abs = os.path.abspath(chemin)
+    stat = os.stat(chemin_abs)
+    con = _connexion(chemin_db)
+    ligne = con.execute(
+        "SELECT mtime_ns, taille, sha256, version, faits FROM metadonnees WHERE chemin = ?", (chemin_abs,)
+    ).fetchone()
+
+    # Le hash n'est calculé que si la date a changé sans changement de taille (NULL sinon)
+    faits, sha256, a_jour = {}, None, False
+    if ligne is not None:
+        mtime_ns, taille, sha256_cache, version, faits_json = ligne
+        if version == VERSION_FAITS and taille == stat.st_size:
+            if mtime_ns == stat.st_mtime_ns:
+                faits, sha256, a_jour = json.loads(faits_json), sha256_cache, True
+            else:
+                # Même taille mais date différente : comparer le contenu avant d'invalider
+                sha256 = hash_fichier(chemin_abs)
+                if sha256_cache is not None and sha256 == sha256_cache:
+                    faits = json.loads(faits_json)
+
+    if a_jour and all(champ in faits for champ in champs):
+        return faits
+
+    faits = _calculer(chemin_abs, champs, faits)
+    con.execute(
+        "INSERT OR REPLACE INTO metadonnees (chemin, mtime_ns, taille, sha256, version, faits) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (chemin_abs, stat.st_mtime_ns, stat.st_size, sha256, VERSION_FAITS, json.dumps(faits)),
+    )
+    con.commit()
+    return faits
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+
+    for chemin in args.i:
+        valeur = obtenir_metadonnees(chemin, [args.champ])[args.champ]
+        print("" if valeur is None else valeur)
+
+
+if __name__ == '__main__':
+    main()
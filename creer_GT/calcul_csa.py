@@ -0,0 +1,197 @@
+"""
+Calcul des facteurs d'échelle entre les segmentations PropSeg et le GT de contrast-agnostic,
+sans appeler Spinal Cord Toolbox.
+
+OBJECTIF :
+----------
+Ce script remplace les appels à `sct_image` et `sct_process_segmentation` de
+calcul_facteurs_echelle.sh. Pour chaque segmentation PropSeg, il calcule directement à partir des
+voxels la surface de section de la moelle (CSA) slice par slice entre les niveaux C2 et C4, pour la
+segmentation PropSeg et pour le GT, puis le facteur d'échelle = moyenne_CSA_GT / moyenne_CSA_PropSeg.
+Tous les sujets sont traités dans un seul processus et le tableau est écrit en une fois.
+
+FONCTIONNEMENT :
+----------------
+1. Les GT et les labels vertébraux sont retrouvés avec l'index du dataset (voir index_dataset.py).
+2. Les deux segmentations sont chargées une seule fois chacune et mises dans l'orientation RAS
+   (l'axe Z va vers le haut). Les coordonnées des labels viennent du cache de métadonnées.
+3. Les slices des niveaux C2 à C4 sont déduites des labels des disques : le niveau N est compris
+   entre le label de valeur N (haut de la vertèbre) et le label de valeur N+1 (bas de la vertèbre),
+   comme pour C1 dans couverture_C1.py (entre les labels 1 et 2).
+4. La CSA d'une slice est la somme des valeurs du masque multipliée par la surface d'un pixel (mm²).
+   Avec `-angle_corr 1` (défaut, comme `sct_process_segmentation`), la CSA est multipliée par le
+   cosinus de l'angle entre la ligne centrale et l'axe Z. La ligne centrale est obtenue par un
+   ajustement polynomial des centres de masse des slices (approximation du lissage de SCT).
+5. Le CSV de sortie a les mêmes colonnes que celui de calcul_facteurs_echelle.sh :
+       Sujet, CSA_PropSeg, CSA_GT, Facteur_Echelle
+
+UTILISATION :
+-------------
+    python creer_GT/calcul_csa.py \
+        -d_propseg test_2004/output_modif/anat \
+        -o facteurs_echelle_2004.csv
+
+ARGUMENTS :
+-----------
+- `-d_propseg`  : dossier contenant les segmentations PropSeg (sub-XXX_contraste_propseg.nii.gz)
+- `-o`          : fichier CSV de sortie
+- `-d_gt`       : (Optionnel) dossier des GT (défaut : data-multi-subject/derivatives/labels_softseg_bin)
+- `-d_label`    : (Optionnel) dossier des labels (défaut : data-multi-subject/derivatives/labels)
+- `-vert`       : (Optionnel) niveaux vertébraux, format début:fin (défaut : 2:4)
+- `-angle_corr` : (Optionnel) 1 pour corriger la CSA selon l'angle de la moelle, 0 sinon (défaut : 1)
+"""
+
+import os
+import glob
+import argparse
+import nibabel as nib
+import numpy as np
+import pandas as pd
+from nibabel.orientations import io_orientation
+from cache_metadonnees import obtenir_metadonnees
+from index_dataset import obtenir_index
+from acces_nifti import charger_nifti
+
+# Degré du polynôme utilisé pour lisser la ligne centrale lors de la correction d'angle
+DEGRE_LIGNE_CENTRALE = 5
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Calcule les facteurs d'échelle CSA_GT / CSA_PropSeg entre C2 et C4 sans SCT.")
+    parser.add_argument("-d_propseg", type=str, required=True, help="Dossier contenant les segmentations PropSeg")
+    parser.add_argument("-o", type=str, required=True, help="Fichier CSV de sortie")
+    parser.add_argument("-d_gt", type=str, default="data-multi-subject/derivatives/labels_softseg_bin", help="Dossier des segmentations GT")
+    parser.add_argument("-d_label", type=str, default="data-multi-subject/derivatives/labels", help="Dossier des labels vertébraux")
+    parser.add_argument("-vert", type=str, default="2:4", help="Niveaux vertébraux, format début:fin (défaut : 2:4)")
+    parser.add_argument("-angle_corr", type=int, default=1, choices=[0, 1], help="Correction de la CSA selon l'angle de la moelle (défaut : 1)")
+    return parser
+
+
+def coords_labels_ras(label_file):
+    """
+    Retourne les labels vertébraux sous forme de dictionnaire {valeur: z} dans le repère RAS
+    (même repère que nib.as_closest_canonical), à partir du cache de métadonnées.
+    """
+    faits = obtenir_metadonnees(label_file, ["labels", "forme"])
+    if faits["labels"] is None:
+        return {}
+
+    img = charger_nifti(label_file, ombre=True)
+    ornt = io_orientation(img.affine)
+    forme = faits["forme"]
+    labels = {}
+    for x, y, z, valeur in faits["labels"]:
+        coords_ras = [0, 0, 0]
+        for axe, coord in enumerate((x, y, z)):
+            axe_ras, sens = int(ornt[axe, 0]), ornt[axe, 1]
+            coords_ras[axe_ras] = coord if sens > 0 else forme[axe] - 1 - coord
+        labels[int(round(valeur))] = coords_ras[2]
+    return labels
+
+
+def slices_niveaux(labels, niveau_debut, niveau_fin):
+    """
+    Trouve les slices Z (repère RAS) comprises entre le haut de la vertèbre niveau_debut et le bas
+    de la vertèbre niveau_fin.
+    :param labels: Dictionnaire {valeur du label: z}
+    :return: Tuple (z_bas, z_haut) inclusif, ou None si un des labels nécessaires est absent
+    """
+    if niveau_debut not in labels or niveau_fin + 1 not in labels:
+        return None
+    z_haut, z_bas = labels[niveau_debut], labels[niveau_fin + 1]
+    return min(z_bas, z_haut), max(z_bas, z_haut)
+
+
+def csa_par_slice(data, zooms, correction_angle=True):
+    """
+    Calcule la surface de section (mm²) de chaque slice Z d'un masque en orientation RAS.
+    :param data: Masque 3D (valeurs entre 0 et 1)
+    :param zooms: Taille des voxels (mm) selon X, Y et Z
+    :param correction_angle: Si True, multiplie la CSA par le cosinus de l'angle entre la ligne
+                             centrale et l'axe Z
+    :return: Tableau de la CSA de chaque slice (NaN pour les slices vides)
+    """
+    data = np.clip(np.asarray(data, dtype=np.float32), 0, 1)
+    dx, dy, dz = (float(z) for z in zooms[:3])
+
+    somme = data.sum(axis=(0, 1), dtype=np.float64)
+    csa = np.where(somme > 0, somme * dx * dy, np.nan)
+
+    if correction_angle:
+        z_non_vides = np.flatnonzero(somme > 0)
+        if z_non_vides.size > 1:
+            # Centres de masse (mm) de toutes les slices non vides en une fois
+            cx = (data.sum(axis=1) * np.arange(data.shape[0])[:, None]).sum(axis=0)[z_non_vides] / somme[z_non_vides] * dx
+            cy = (data.sum(axis=0) * np.arange(data.shape[1])[:, None]).sum(axis=0)[z_non_vides] / somme[z_non_vides] * dy
+            z_mm = z_non_vides * dz
+
+            # Ligne centrale lissée et sa dérivée par rapport à Z
+            degre = min(DEGRE_LIGNE_CENTRALE, z_non_vides.size - 1)
+            derivee_x = np.polyval(np.polyder(np.polyfit(z_mm, cx, degre)), z_mm)
+            derivee_y = np.polyval(np.polyder(np.polyfit(z_mm, cy, degre)), z_mm)
+            csa[z_non_vides] *= 1 / np.sqrt(1 + derivee_x ** 2 + derivee_y ** 2)
+    return csa
+
+
+def csa_moyenne(seg_file, z_bas, z_haut, correction_angle=True, ombre=False):
+    """
+    Charge une segmentation une seule fois et retourne sa CSA moyenne entre z_bas et z_haut (RAS).
+    :param ombre: True pour une segmentation du dataset (lue par charger_nifti avec une ombre)
+    """
+    img = nib.as_closest_canonical(charger_nifti(seg_file, ombre=ombre))
+    csa = csa_par_slice(np.asanyarray(img.dataobj), img.header.get_zooms(), correction_angle)
+    return np.nanmean(csa[z_bas:z_haut+1]) if np.any(~np.isnan(csa[z_bas:z_haut+1])) else np.nan
+
+
+def calculer_facteur(propseg_path, gt_path, label_path, niveaux=(2, 4), correction_angle=True):
+    """
+    Calcule CSA_PropSeg, CSA_GT et le facteur d'échelle pour un sujet.
+    :return: Tuple (csa_propseg, csa_gt, facteur), NaN si le calcul est impossible
+    """
+    bornes = slices_niveaux(coords_labels_ras(label_path), *niveaux)
+    if bornes is None:
+        return np.nan, np.nan, np.nan
+
+    csa_prop = csa_moyenne(propseg_path, *bornes, correction_angle=correction_angle)
+    csa_gt = csa_moyenne(gt_path, *bornes, correction_angle=correction_angle, ombre=True)
+    if np.isnan(csa_prop) or np.isnan(csa_gt) or csa_prop == 0:
+        return csa_prop, csa_gt, np.nan
+    return csa_prop, csa_gt, round(csa_gt / csa_prop, 4)
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    niveaux = tuple(int(n) for n in args.vert.split(":"))
+
+    # Indexer une seule fois les GT et les labels
+    gt_index = obtenir_index(args.d_gt)
+    label_index = obtenir_index(args.d_label)
+
+    results = []
+    for propseg_path in sorted(glob.glob(os.path.join(args.d_propseg, "sub-*_propseg.nii.gz"))):
+        sujet, contraste = os.path.basename(propseg_path).split("_")[:2]
+        gt_path = gt_index.get((sujet, contraste, "desc-softseg_label-SC_seg"))
+        label_path = label_index.get((sujet, contraste, "label-discs_dlabel"))
+
+        if gt_path is None or label_path is None:
+            print(f"Fichiers manquants pour {sujet}, saut...")
+            continue
+
+        print(f"Traitement de {sujet}_{contraste}")
+        csa_prop, csa_gt, facteur = calculer_facteur(propseg_path, gt_path, label_path, niveaux,
+                                                     correction_angle=bool(args.angle_corr))
+        results.append({
+            "Sujet": f"{sujet}_{contraste}",
+            "CSA_PropSeg": csa_prop,
+            "CSA_GT": csa_gt,
+            "Facteur_Echelle": facteur
+        })
+
+    pd.DataFrame(results, columns=["Sujet", "CSA_PropSeg", "CSA_GT", "Facteur_Echelle"]).to_csv(args.o, index=False)
+    print(f"Terminé ! Résultats enregistrés dans {args.o}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Version parallèle de calcul_facteurs_echelle.sh : calcul des facteurs d'échelle entre les
+segmentations PropSeg et le GT de contrast-agnostic pour tous les sujets.
+
+OBJECTIF :
+----------
+Ce script fait le même calcul que calcul_facteurs_echelle.sh (CSA moyenne entre C2 et C4 avec
+`sct_process_segmentation`, puis facteur = moyenne_CSA_GT / moyenne_CSA_PropSeg), mais répartit
+les sujets sur plusieurs processus au lieu de les traiter un à un.
+
+FONCTIONNEMENT :
+----------------
+1. Les GT et les labels vertébraux sont retrouvés avec l'index du dataset (voir index_dataset.py).
+2. Chaque sujet est un travail indépendant, exécuté dans son propre dossier temporaire (les noms
+   fixes `tmp_propseg_${sujet}_${contraste}.csv` du script bash entreraient en collision) :
+      - `sct_image -setorient RPI` sur le fichier de labels ;
+      - `sct_process_segmentation` sur la segmentation PropSeg et sur le GT ;
+      - lecture des deux CSV et calcul du facteur.
+   Le dossier temporaire est supprimé à la fin du travail. Si une commande SCT échoue, les
+   dernières lignes de sa sortie d'erreur sont affichées et la ligne du sujet contient l'erreur.
+3. Les résultats de tous les sujets sont triés par sujet et écrits en une fois dans le CSV de
+   sortie (fichier temporaire puis renommage, donc le CSV n'est jamais à moitié écrit).
+
+Avec `-backend python`, la CSA est calculée sans SCT par calcul_csa.py.
+
+UTILISATION :
+-------------
+    python creer_GT/calcul_facteurs_echelle.py \
+        -d_propseg test_2004/output_modif/anat \
+        -o facteurs_echelle_2004.csv \
+        -jobs 8
+
+ARGUMENTS :
+-----------
+- `-d_propseg` : dossier contenant les segmentations PropSeg (sub-XXX_contraste_propseg.nii.gz)
+- `-o`         : fichier CSV de sortie
+- `-d_gt`      : (Optionnel) dossier des GT (défaut : data-multi-subject/derivatives/labels_softseg_bin)
+- `-d_label`   : (Optionnel) dossier des labels (défaut : data-multi-subject/derivatives/labels)
+- `-jobs`      : (Optionnel) nombre de sujets traités en parallèle (défaut : nombre de coeurs)
+- `-threads`   : (Optionnel) nombre de fils d'exécution par processus SCT (défaut : 1)
+- `-backend`   : (Optionnel) `sct` (défaut) ou `python` (calcul_csa.py, sans SCT)
+"""
+
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from index_dataset import obtenir_index
+from outils_processus import environnement_limite
+from calcul_csa import calculer_facteur
+
+COLONNES = ["Sujet", "CSA_PropSeg", "CSA_GT", "Facteur_Echelle"]
+
+# Nombre de dernières lignes de la sortie d'erreur de SCT gardées en cas d'échec
+LIGNES_ERREUR = 5
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Calcule en parallèle les facteurs d'échelle CSA_GT / CSA_PropSeg entre C2 et C4.")
+    parser.add_argument("-d_propseg", type=str, required=True, help="Dossier contenant les segmentations PropSeg")
+    parser.add_argument("-o", type=str, required=True, help="Fichier CSV de sortie")
+    parser.add_argument("-d_gt", type=str, default="data-multi-subject/derivatives/labels_softseg_bin", help="Dossier des segmentations GT")
+    parser.add_argument("-d_label", type=str, default="data-multi-subject/derivatives/labels", help="Dossier des labels vertébraux")
+    parser.add_argument("-jobs", type=int, default=os.cpu_count(), help="Nombre de sujets traités en parallèle (défaut : nombre de coeurs)")
+    parser.add_argument("-threads", type=int, default=1, help="Nombre de fils d'exécution par processus SCT (défaut : 1)")
+    parser.add_argument("-backend", type=str, default="sct", choices=["sct", "python"], help="Calcul de la CSA avec SCT ou en Python (calcul_csa.py)")
+    return parser
+
+
+def facteur_sct(sujet_contraste, propseg_path, gt_path, label_path, threads=1):
+    """
+    Calcule le facteur d'échelle d'un sujet avec SCT, dans un dossier temporaire propre au travail.
+    :return: Ligne du CSV de sortie (dictionnaire)
+    """
+    env = environnement_limite(threads)
+    # Les commandes sont lancées dans le dossier temporaire : tous les chemins doivent être absolus
+    propseg_path, gt_path, label_path = (os.path.abspath(p) for p in (propseg_path, gt_path, label_path))
+    tmp_dir = os.path.abspath(tempfile.mkdtemp(prefix=f"csa_{sujet_contraste}_"))
+    try:
+        label_rpi = os.path.join(tmp_dir, "label_RPI.nii.gz")
+        tmp_csa_propseg = os.path.join(tmp_dir, "csa_propseg.csv")
+        tmp_csa_gt = os.path.join(tmp_dir, "csa_gt.csv")
+
+        # Réorienter les labels, puis CSA PropSeg et CSA GT
+        commandes = [
+            ["sct_image", "-i", label_path, "-setorient", "RPI", "-o", label_rpi],
+            ["sct_process_segmentation", "-i", propseg_path, "-perslice", "1", "-vert", "2:4",
+             "-vertfile", label_rpi, "-o", tmp_csa_propseg, "-v", "0"],
+            ["sct_process_segmentation", "-i", gt_path, "-perslice", "1", "-vert", "2:4",
+             "-vertfile", label_rpi, "-o", tmp_csa_gt, "-v", "0"],
+        ]
+        for cmd in commandes:
+            resultat = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                                      env=env, cwd=tmp_dir)
+            if resultat.returncode != 0:
+                fin_erreur = resultat.stderr.strip().splitlines()[-LIGNES_ERREUR:]
+                print(f"Erreur de {cmd[0]} pour {sujet_contraste} (code {resultat.returncode}) :\n"
+                      + "\n".join(fin_erreur))
+                return {"Sujet": sujet_contraste,
+                        "CSA_PropSeg": f"Erreur {cmd[0]} (code {resultat.returncode})"
+                                       + (f" : {fin_erreur[-1]}" if fin_erreur else "")}
+
+        if not (os.path.exists(tmp_csa_propseg) and os.path.getsize(tmp_csa_propseg) > 0
+                and os.path.exists(tmp_csa_gt) and os.path.getsize(tmp_csa_gt) > 0):
+            return {"Sujet": sujet_contraste, "CSA_PropSeg": "Fichier CSV vide"}
+
+        try:
+            csa_prop = pd.read_csv(tmp_csa_propseg)['MEAN(area)'].mean()
+            csa_gt = pd.read_csv(tmp_csa_gt)['MEAN(area)'].mean()
+            facteur = round(csa_gt / csa_prop, 4)
+        except Exception:
+            csa_prop, csa_gt, facteur = np.nan, np.nan, np.nan
+        return {"Sujet": sujet_contraste, "CSA_PropSeg": csa_prop, "CSA_GT": csa_gt, "Facteur_Echelle": facteur}
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def facteur_python(sujet_contraste, propseg_path, gt_path, label_path):
+    """
+    Calcule le facteur d'échelle d'un sujet sans SCT (voir calcul_csa.py).
+    """
+    csa_prop, csa_gt, facteur = calculer_facteur(propseg_path, gt_path, label_path)
+    return {"Sujet": sujet_contraste, "CSA_PropSeg": csa_prop, "CSA_GT": csa_gt, "Facteur_Echelle": facteur}
+
+
+def lister_travaux(propseg_dir, gt_dir, label_dir):
+    """
+    Associe chaque segmentation PropSeg à son GT et à son fichier de labels.
+    :return: Liste de tuples (sujet_contraste, propseg_path, gt_path, label_path)
+    """
+    gt_index = obtenir_index(gt_dir)
+    label_index = obtenir_index(label_dir)
+
+    travaux = []
+    for propseg_path in sorted(glob.glob(os.path.join(propseg_dir, "sub-*_propseg.nii.gz"))):
+        sujet, contraste = os.path.basename(propseg_path).split("_")[:2]
+        gt_path = gt_index.get((sujet, contraste, "desc-softseg_label-SC_seg"))
+        label_path = label_index.get((sujet, contraste, "label-discs_dlabel"))
+        if gt_path is None or label_path is None:
+            print(f"Fichiers manquants pour {sujet}, saut...")
+            continue
+        travaux.append((f"{sujet}_{contraste}", propseg_path, gt_path, label_path))
+    return travaux
+
+
+def ecrire_resultats(results, output_csv):
+    """
+    Écrit les résultats triés par sujet, de façon atomique (fichier temporaire puis renommage).
+    """
+    df = pd.DataFrame(results, columns=COLONNES).sort_values("Sujet")
+    tmp = f"{output_csv}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, output_csv)
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+
+    travaux = lister_travaux(args.d_propseg, args.d_gt, args.d_label)
+
+    if args.backend == "sct":
+        executor = ThreadPoolExecutor(max_workers=args.jobs)
+        futures = [executor.submit(facteur_sct, *travail, args.threads) for travail in travaux]
+    else:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+        futures = [executor.submit(facteur_python, *travail) for travail in travaux]
+
+    results = []
+    with executor:
+        for travail, future in zip(travaux, futures):
+            try:
+                results.append(future.result())
+                print(f"Traitement de {travail[0]} terminé")
+            except Exception as e:
+                print(f"Erreur pour {travail[0]} : {e}")
+                results.append({"Sujet": travail[0], "CSA_PropSeg": np.nan, "CSA_GT": np.nan, "Facteur_Echelle": np.nan})
+
+    ecrire_resultats(results, args.o)
+    print(f"Terminé ! Résultats enregistrés dans {args.o}")
+
+
+if __name__ == '__main__':
+    main()
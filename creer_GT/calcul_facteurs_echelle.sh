@@ -20,7 +20,8 @@
 # ORGANISATION DES FICHIERS :
 # ---------------------------
 # - Les segmentations PropSeg sont attendues dans le dossier spécifié par `propseg_dir`.
-# - Les segmentations GT et les labels sont cherchés automatiquement dans `data-multi-subject/derivatives/`.
+# - Les segmentations GT et les labels sont cherchés automatiquement dans `data-multi-subject/derivatives/`
+#   (un seul parcours de chaque dossier avec index_dataset.py).
 # - Chaque sujet est identifié par un nom de fichier de type : sub-XXX_contraste.nii.gz
 #
 # UTILISATION :
@@ -41,10 +42,18 @@
 ###############################################################################
 
 # Dossiers
+script_dir="$(cd "$(dirname "$0")" && pwd)"
 propseg_dir="test_2004/output_modif/anat" # À adapter dépendemment de l'emplacement des segmentations propseg
 output_csv="facteurs_echelle_2004.csv" # À adapter dépendemment du nom du fichier CSV de sortie voulu
 echo "Sujet,CSA_PropSeg,CSA_GT,Facteur_Echelle" > "$output_csv"
 
+# Indexer une seule fois les GT et les labels (voir index_dataset.py)
+declare -A gt_paths label_paths
+while IFS=$'\t' read -r s c p; do gt_paths["${s}_${c}"]="$p"; done < <(
+    python3 "$script_dir/index_dataset.py" -d data-multi-subject/derivatives/labels_softseg_bin -suffixe desc-softseg_label-SC_seg)
+while IFS=$'\t' read -r s c p; do label_paths["${s}_${c}"]="$p"; done < <(
+    python3 "$script_dir/index_dataset.py" -d data-multi-subject/derivatives/labels -suffixe label-discs_dlabel)
+
 # Pour chaque fichier PropSeg
 for propseg_path in "$propseg_dir"/sub-*_propseg.nii.gz; do
     propseg_file=$(basename "$propseg_path")
@@ -55,10 +64,10 @@ for propseg_path in "$propseg_dir"/sub-*_propseg.nii.gz; do
     echo $contraste
 
     # Rechercher le GT correspondant (premier match)
-    gt_path=$(find data-multi-subject/derivatives/labels_softseg_bin/ -path "*/${sujet}/anat/${sujet}_${contraste}_desc-softseg_label-SC_seg.nii.gz" | head -n 1)
+    gt_path="${gt_paths[${sujet}_${contraste}]}"
 
     # Rechercher le fichier de labels
-    label_path=$(find data-multi-subject/derivatives/labels/ -path "*/${sujet}/anat/${sujet}_${contraste}_label-discs_dlabel.nii.gz" | head -n 1)
+    label_path="${label_paths[${sujet}_${contraste}]}"
 
     # Réorienter
     label_rpi="${sujet}_${contraste}_label_RPI.nii.gz"
@@ -21,7 +21,8 @@
 # ----------------
 # Pour chaque segmentation fusionnée :
 #   1. Identifie le sujet et le contraste.
-#   2. Charge le fichier de labels vertébraux et localise la slice Z correspondant à C1 (valeur label != 0).
+#   2. Localise la slice Z correspondant à C1 (valeur label != 0) dans le fichier de labels vertébraux
+#      (valeur conservée dans le cache de métadonnées, voir cache_metadonnees.py).
 #   3. Définit une position de découpe `z_max = z_c1 + 10`.
 #   4. Applique un masque conservant uniquement les slices de Z = 0 jusqu’à Z = z_max.
 #   5. Sauvegarde la nouvelle image segmentée avec le suffixe `_fusion_cropped.nii.gz`.
@@ -36,6 +37,7 @@
 # Avril 2025
 ###############################################################################
 
+script_dir="$(cd "$(dirname "$0")" && pwd)"
 fusion_dir="test_2004/output_fusion_2004" # Adapter selon l'emplacement des segmentation que l'on veut crop
 label_dir="data-multi-subject/derivatives/labels"
 output_dir="test_2004/output_fusion_cropped_2004" # Adapter selon l'emplacement désiré des fichiers résultants
@@ -60,32 +62,36 @@ for fusion_seg in "$fusion_dir"/*_fusion.nii.gz; do
 import nibabel as nib
 import numpy as np
 import os
+import sys
 
-label_img = nib.load("$label_file")
-label_data = label_img.get_fdata()
+sys.path.insert(0, "$script_dir")
+from cache_metadonnees import obtenir_metadonnees
+from outils_nifti import boite_englobante, appliquer_dans_boite
+from acces_nifti import charger_nifti
 
-# Trouver l'index Z du label C1 (valeur == 1)
-indices = np.where(label_data != 0)[2]
-if indices.size == 0:
+# Trouver l'index Z du label C1 (valeur == 1), à partir du cache de métadonnées si le
+# fichier de labels n'a pas changé depuis le dernier calcul
+z_c1 = obtenir_metadonnees("$label_file", ["z_max"])["z_max"]
+if z_c1 is None:
     print("C1 introuvable pour $subj_name")
     exit()
 
-z_c1 = np.max(indices)
 z_max = z_c1 + 10
 
 # Charger la segmentation fusionnée
-seg_img = nib.load("$fusion_seg")
-seg_data = seg_img.get_fdata()
+seg_img = charger_nifti("$fusion_seg")
 
 # Vérification des dimensions
-if z_c1 >= seg_data.shape[2]:
+if z_c1 >= seg_img.shape[2]:
     print(f"C1 est hors des dimensions de la segmentation pour $subj_name")
     exit()
 
-# Masquage des slices au-dessus de z_max
-masked_data = np.zeros_like(seg_data)
-masked_data[:, :, :z_max] = seg_data[:, :, :z_max]
-masked_img = nib.Nifti1Image(masked_data.astype(np.uint8), seg_img.affine, seg_img.header)
+# Masquage des slices au-dessus de z_max : la segmentation (fichier intermédiaire, lu une seule
+# fois) n'est copiée que dans sa boîte englobante sous z_max, le reste du volume reste à 0.
+seg_data = np.asanyarray(seg_img.dataobj)
+masked_data = appliquer_dans_boite(seg_data, lambda bloc: bloc,
+                                   boite=boite_englobante(seg_data[:, :, :z_max]), dtype=np.uint8)
+masked_img = nib.Nifti1Image(masked_data, seg_img.affine, seg_img.header)
 
 output_path = os.path.join("$output_dir", f"${subj_name}_fusion_cropped.nii.gz")
 nib.save(masked_img, output_path)
@@ -0,0 +1,218 @@
+"""
+Traitement en flux, sujet par sujet : mise à l'échelle -> fusion -> crop au-dessus de C1 -> métriques.
+
+OBJECTIF :
+----------
+Avec les scripts séparés (appliquer_facteur_echelle.py, fusion.py, crop_above_C1.sh), chaque
+étape traite tous les sujets avant que la suivante commence : les volumes intermédiaires de tous
+les sujets sont écrits sur le disque puis relus, et le sujet le plus lent d'une étape retarde
+tous les autres. Ici, chaque sujet passe par toute la chaîne en mémoire et seul le GT final
+(`_fusion_cropped.nii.gz`) est écrit, avec une ligne de métriques.
+
+FONCTIONNEMENT :
+----------------
+La chaîne est une suite de générateurs : chaque étape reçoit les sujets un à un de l'étape
+précédente, les transforme et les passe à la suivante. Un sujet n'est chargé que lorsque la fin
+de la chaîne demande le suivant et ses volumes sont libérés dès que sa sortie est écrite : la
+mémoire utilisée est celle de quelques volumes par chaîne, quelle que soit la taille du dataset.
+  1. `charger`   : segmentation PropSeg et GT contrast-agnostic, binarisés en uint8 (type natif).
+  2. `echelle`   : zoom XY slice par slice (mettre_a_echelle de appliquer_facteur_echelle.py).
+  3. `fusion`    : GT en bas, PropSeg mis à l'échelle en haut (fusionner de fusion.py).
+  4. `crop`      : mise à 0 au-dessus de C1 + marge (rogner_au_dessus_c1 de fusion.py).
+  5. `mesure`    : écart entre le haut du GT final et C1 (comme seg_vs_label.py), Dice et volumes
+                   par rapport au GT contrast-agnostic.
+  6. `ecriture`  : sauvegarde du GT final en uint8, puis libération des volumes du sujet.
+Une erreur sur un sujet est notée dans sa ligne de métriques et n'arrête pas la chaîne.
+Avec `-jobs N`, les sujets sont répartis entre N chaînes lancées dans des processus séparés.
+
+Le tableau `metriques_flux.csv` est écrit dans le dossier de sortie, avec les colonnes :
+    Sujet, Facteur_Echelle, Ecart_C1, Dice_GT, Volume_GT_mm3, Volume_final_mm3, Erreur
+
+UTILISATION :
+-------------
+    python creer_GT/flux.py \
+        -d_propseg test_2004/output_modif/anat \
+        -facteurs test_2004/facteurs_echelle_2004.csv \
+        -o test_2004/output_fusion_cropped_2004
+
+ARGUMENTS :
+-----------
+- `-d_propseg` : dossier des segmentations PropSeg (sub-XXX_contraste_propseg.nii.gz)
+- `-facteurs`  : CSV des facteurs d'échelle (sortie de calcul_facteurs_echelle ou calcul_csa.py)
+- `-o`         : dossier de sortie des GT finaux
+- `-d_gt`      : (Optionnel) dossier des GT contrast-agnostic (défaut : data-multi-subject/derivatives/labels_softseg_bin)
+- `-d_label`   : (Optionnel) dossier des labels (défaut : data-multi-subject/derivatives/labels)
+- `-decalage`  : (Optionnel) nombre de slices sous le haut du GT où se fait la fusion (défaut : 5)
+- `-marge_c1`  : (Optionnel) nombre de slices gardées au-dessus de C1 (défaut : 10)
+- `-jobs`      : (Optionnel) nombre de chaînes lancées en parallèle (défaut : nombre de coeurs)
+"""
+
+import os
+import argparse
+import nibabel as nib
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from index_dataset import obtenir_index
+from cache_metadonnees import obtenir_metadonnees
+from outils_nifti import z_max_ras
+from appliquer_facteur_echelle import mettre_a_echelle
+from fusion import charger_masque, derniere_slice_non_vide, fusionner, rogner_au_dessus_c1, sauver_masque
+
+COLONNES = ["Sujet", "Facteur_Echelle", "Ecart_C1", "Dice_GT", "Volume_GT_mm3", "Volume_final_mm3", "Erreur"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Mise à l'échelle, fusion, crop au-dessus de C1 et métriques en mémoire, sujet par sujet.")
+    parser.add_argument("-d_propseg", type=str, required=True, help="Dossier des segmentations PropSeg")
+    parser.add_argument("-facteurs", type=str, required=True, help="CSV des facteurs d'échelle")
+    parser.add_argument("-o", type=str, required=True, help="Dossier de sortie des GT finaux")
+    parser.add_argument("-d_gt", type=str, default="data-multi-subject/derivatives/labels_softseg_bin", help="Dossier des GT contrast-agnostic")
+    parser.add_argument("-d_label", type=str, default="data-multi-subject/derivatives/labels", help="Dossier des labels vertébraux")
+    parser.add_argument("-decalage", type=int, default=5, help="Nombre de slices sous le haut du GT où se fait la fusion (défaut : 5)")
+    parser.add_argument("-marge_c1", type=int, default=10, help="Nombre de slices gardées au-dessus de C1 (défaut : 10)")
+    parser.add_argument("-jobs", type=int, default=os.cpu_count(), help="Nombre de chaînes lancées en parallèle (défaut : nombre de coeurs)")
+    return parser
+
+
+def appliquer(flux, fonction, **options):
+    """
+    Étape de la chaîne : applique fonction(sujet, **options) à chaque sujet du flux et le passe à
+    l'étape suivante. Les sujets déjà en erreur sont passés sans être modifiés.
+    """
+    for sujet in flux:
+        if sujet["Erreur"] is None:
+            try:
+                fonction(sujet, **options)
+            except Exception as e:
+                sujet["Erreur"] = f"{fonction.__name__} : {e}"
+        yield sujet
+
+
+def charger(sujet):
+    img_gt, sujet["gt"] = charger_masque(sujet["gt_path"])
+    sujet["img"] = img_gt
+    _, sujet["propseg"] = charger_masque(sujet["propseg_path"])
+
+
+def echelle(sujet):
+    sujet["propseg"] = mettre_a_echelle(sujet["propseg"], sujet["facteur"])
+
+
+def fusion(sujet, decalage=5):
+    zmax = derniere_slice_non_vide(sujet["gt"])
+    zsplit = (zmax if zmax is not None else 0) - decalage
+    if zsplit < 0:
+        raise ValueError(f"Z max trop petit (z={zmax})")
+    # Le GT n'est pas modifié : il sert encore aux métriques
+    sujet["final"] = fusionner(sujet["gt"], sujet.pop("propseg"), zsplit)
+
+
+def crop(sujet, marge_c1=10):
+    z_c1 = obtenir_metadonnees(sujet["label_path"], ["z_max"])["z_max"]
+    if z_c1 is None:
+        raise ValueError("C1 introuvable")
+    rogner_au_dessus_c1(sujet["final"], z_c1, marge_c1)
+
+
+def mesure(sujet):
+    final, gt, img = sujet["final"], sujet["gt"], sujet["img"]
+    volume_voxel = float(np.prod(img.header.get_zooms()[:3]))
+    n_final, n_gt = np.count_nonzero(final), np.count_nonzero(gt)
+    intersection = np.count_nonzero(final & gt)
+
+    # Écart en Z (repère RAS) entre le haut du GT final et le label de C1, comme seg_vs_label.py
+    z_haut = z_max_ras(nib.Nifti1Image(final, img.affine))
+    z_c1 = obtenir_metadonnees(sujet["label_path"], ["z_max_ras"])["z_max_ras"]
+
+    sujet["Ecart_C1"] = z_haut - z_c1 if z_haut is not None and z_c1 is not None else np.nan
+    sujet["Dice_GT"] = round(2 * intersection / (n_final + n_gt), 4) if n_final + n_gt else np.nan
+    sujet["Volume_GT_mm3"] = round(n_gt * volume_voxel, 2)
+    sujet["Volume_final_mm3"] = round(n_final * volume_voxel, 2)
+
+
+def ecriture(sujet, output_dir):
+    sauver_masque(sujet["final"], sujet["img"], os.path.join(output_dir, f"{sujet['Sujet']}_fusion_cropped.nii.gz"))
+
+
+def chaine(travaux, output_dir, decalage=5, marge_c1=10):
+    """
+    Construit la chaîne de générateurs pour une liste de travaux. Rien n'est calculé avant que la
+    chaîne ne soit parcourue ; chaque élément produit est la ligne de métriques d'un sujet, dont
+    les volumes ont déjà été libérés.
+    :param travaux: Liste de tuples (sujet_contraste, propseg_path, gt_path, label_path, facteur)
+    """
+    flux = ({"Sujet": s, "propseg_path": p, "gt_path": g, "label_path": l, "facteur": f,
+             "Facteur_Echelle": f, "Erreur": None} for s, p, g, l, f in travaux)
+    flux = appliquer(flux, charger)
+    flux = appliquer(flux, echelle)
+    flux = appliquer(flux, fusion, decalage=decalage)
+    flux = appliquer(flux, crop, marge_c1=marge_c1)
+    flux = appliquer(flux, mesure)
+    flux = appliquer(flux, ecriture, output_dir=output_dir)
+    for sujet in flux:
+        yield {colonne: sujet.get(colonne, np.nan) for colonne in COLONNES}
+
+
+def traiter_lot(travaux, output_dir, decalage=5, marge_c1=10):
+    """
+    Parcourt une chaîne complète pour une liste de travaux (un processus du pool).
+    :return: Liste des lignes de métriques
+    """
+    lignes = []
+    for ligne in chaine(travaux, output_dir, decalage, marge_c1):
+        print(f"{ligne['Sujet']} : " + (ligne["Erreur"] or "GT final enregistré"))
+        lignes.append(ligne)
+    return lignes
+
+
+def lister_travaux(propseg_dir, facteurs_csv, gt_dir, label_dir):
+    """
+    Associe chaque sujet du CSV des facteurs à sa segmentation PropSeg, son GT et ses labels.
+    :return: Liste de tuples (sujet_contraste, propseg_path, gt_path, label_path, facteur)
+    """
+    gt_index = obtenir_index(gt_dir)
+    label_index = obtenir_index(label_dir)
+
+    travaux = []
+    for _, row in pd.read_csv(facteurs_csv).iterrows():
+        sujet_contraste = row["Sujet"]
+        facteur = pd.to_numeric(row["Facteur_Echelle"], errors="coerce")
+        if pd.isna(facteur):
+            print(f"Facteur vide ou NaN pour {sujet_contraste}, skip...")
+            continue
+        sujet, contraste = sujet_contraste.split("_")
+        propseg_path = os.path.join(propseg_dir, f"{sujet_contraste}_propseg.nii.gz")
+        gt_path = gt_index.get((sujet, contraste, "desc-softseg_label-SC_seg"))
+        label_path = label_index.get((sujet, contraste, "label-discs_dlabel"))
+        if not os.path.exists(propseg_path) or gt_path is None or label_path is None:
+            print(f"Fichiers manquants pour {sujet_contraste}, saut...")
+            continue
+        travaux.append((sujet_contraste, propseg_path, gt_path, label_path, float(facteur)))
+    return travaux
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    os.makedirs(args.o, exist_ok=True)
+
+    travaux = lister_travaux(args.d_propseg, args.facteurs, args.d_gt, args.d_label)
+
+    # Répartition des sujets entre les chaînes (une chaîne par processus)
+    jobs = max(1, min(args.jobs, len(travaux)))
+    lots = [travaux[i::jobs] for i in range(jobs)]
+    lignes = []
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(traiter_lot, lot, args.o, args.decalage, args.marge_c1) for lot in lots]
+        for future in futures:
+            lignes.extend(future.result())
+
+    output_csv = os.path.join(args.o, "metriques_flux.csv")
+    pd.DataFrame(lignes, columns=COLONNES).sort_values("Sujet").to_csv(output_csv, index=False)
+    print(f"\n Terminé ! Métriques enregistrées dans {output_csv}")
+
+
+if __name__ == '__main__':
+    main()
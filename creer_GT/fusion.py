@@ -0,0 +1,233 @@
+"""
+Fusion des segmentations contrast-agnostic et PropSeg corrigées, pour tous les sujets.
+
+OBJECTIF :
+----------
+Ce script fait la fusion de fusion_seg.sh sans lancer d'interpréteur Python par sujet :
+  - la segmentation contrast-agnostic est gardée pour la partie inférieure ;
+  - la segmentation PropSeg corrigée est gardée pour la partie supérieure.
+La découpe se fait le long de l'axe Z, `decalage` slices (5 par défaut) sous la dernière slice
+non vide de la segmentation contrast-agnostic.
+
+FONCTIONNEMENT :
+----------------
+Pour chaque fichier `sub-XXX_contraste_seg_corrige.nii.gz` du dossier PropSeg :
+  1. Retrouve la segmentation contrast-agnostic correspondante avec l'index du dataset
+     (voir index_dataset.py).
+  2. Charge chaque segmentation une seule fois, dans son type natif.
+  3. Trouve la dernière slice non vide de contrast-agnostic en une seule réduction sur le volume.
+  4. Remplace directement, dans le masque PropSeg, les slices [0:zsplit] par celles de
+     contrast-agnostic (pas de copie par concaténation).
+  5. Sauvegarde la fusion en uint8 avec le suffixe `_fusion.nii.gz`.
+Les sujets sont traités en parallèle (`-jobs` processus).
+
+FUSION ET CROP EN UNE SEULE ÉTAPE :
+-----------------------------------
+Avec `-d_label`, le crop de crop_above_C1.sh est fait dans la même passe, avant l'écriture :
+les slices au-dessus de `z_c1 + marge_c1` (10 par défaut) sont mises à 0, où `z_c1` est la slice
+du label le plus haut (C1, valeur conservée dans le cache de métadonnées). Seul le GT final
+`_fusion_cropped.nii.gz` est écrit, ce qui évite d'écrire puis de relire la fusion compressée.
+La fusion intermédiaire `_fusion.nii.gz` n'est écrite que si `-garder_fusion` est donné.
+Les segmentations d'entrée peuvent aussi être des masques compacts .msk.
+
+UTILISATION :
+-------------
+    python creer_GT/fusion.py \
+        -d_propseg test_2004/propseg_echelle_2004 \
+        -o test_2004/output_fusion_2004
+
+Pour produire directement le GT final (fusion + crop au-dessus de C1) :
+
+    python creer_GT/fusion.py \
+        -d_propseg test_2004/propseg_echelle_2004 \
+        -d_label data-multi-subject/derivatives/labels \
+        -o test_2004/output_fusion_cropped_2004
+
+ARGUMENTS :
+-----------
+- `-d_propseg`  : dossier des segmentations PropSeg corrigées (suffixe `_seg_corrige.nii.gz`)
+- `-o`          : dossier de sortie des segmentations fusionnées
+- `-d_contrast` : (Optionnel) dossier des segmentations contrast-agnostic
+                  (défaut : data-multi-subject/derivatives/labels_softseg_bin)
+- `-decalage`   : (Optionnel) nombre de slices sous la dernière slice non vide de
+                  contrast-agnostic où se fait la découpe (défaut : 5)
+- `-jobs`       : (Optionnel) nombre de sujets traités en parallèle (défaut : nombre de coeurs)
+- `-d_label`    : (Optionnel) dossier des labels vertébraux ; si donné, la fusion est croppée
+                  au-dessus de C1 et sauvegardée avec le suffixe `_fusion_cropped.nii.gz`
+- `-marge_c1`   : (Optionnel) nombre de slices gardées au-dessus de C1 (défaut : 10)
+- `-garder_fusion` : (Optionnel) avec `-d_label`, écrire aussi la fusion avant le crop
+- `-compact`    : (Optionnel) écrire les sorties au format compact .msk (voir masque_compact.py)
+                  au lieu de .nii.gz ; à reconvertir en .nii.gz pour les outils SCT (sct_qc...)
+"""
+
+import os
+import glob
+import argparse
+import nibabel as nib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from index_dataset import obtenir_index
+from cache_metadonnees import obtenir_metadonnees
+from acces_nifti import charger_nifti
+from outils_nifti import appliquer_dans_boite
+from masque_compact import ecrire_compact, EXTENSION as EXTENSION_COMPACT
+
+SUFFIXE_PROPSEG = "_seg_corrige.nii.gz"
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Fusionne les segmentations contrast-agnostic (bas) et PropSeg corrigées (haut).")
+    parser.add_argument("-d_propseg", type=str, required=True, help="Dossier des segmentations PropSeg corrigées")
+    parser.add_argument("-o", type=str, required=True, help="Dossier de sortie des segmentations fusionnées")
+    parser.add_argument("-d_contrast", type=str, default="data-multi-subject/derivatives/labels_softseg_bin", help="Dossier des segmentations contrast-agnostic")
+    parser.add_argument("-decalage", type=int, default=5, help="Nombre de slices sous la dernière slice non vide de contrast-agnostic (défaut : 5)")
+    parser.add_argument("-jobs", type=int, default=os.cpu_count(), help="Nombre de sujets traités en parallèle (défaut : nombre de coeurs)")
+    parser.add_argument("-d_label", type=str, default=None, help="Dossier des labels vertébraux : si donné, la fusion est croppée au-dessus de C1")
+    parser.add_argument("-marge_c1", type=int, default=10, help="Nombre de slices gardées au-dessus de C1 (défaut : 10)")
+    parser.add_argument("-garder_fusion", action="store_true", help="Avec -d_label, écrire aussi la fusion avant le crop")
+    parser.add_argument("-compact", action="store_true", help="Écrire les sorties au format compact .msk au lieu de .nii.gz")
+    return parser
+
+
+def charger_masque(chemin):
+    """
+    Charge un masque une seule fois, dans son type natif, et le binarise en uint8 (sans passer par
+    float64). La binarisation n'est faite que dans la boîte englobante du masque.
+    :return: Tuple (image nibabel, masque uint8 modifiable)
+    """
+    img = charger_nifti(chemin)
+    masque = appliquer_dans_boite(np.asanyarray(img.dataobj), lambda bloc: bloc > 0, dtype=np.uint8)
+    return img, masque
+
+
+def derniere_slice_non_vide(masque):
+    """
+    Retourne l'indice de la dernière slice Z non vide, ou None si le masque est vide.
+    """
+    non_vides = np.flatnonzero(masque.any(axis=(0, 1)))
+    return int(non_vides[-1]) if non_vides.size else None
+
+
+def fusionner(masque_contrast, masque_propseg, zsplit):
+    """
+    Remplace, dans masque_propseg (modifié sur place), les slices [0:zsplit] par celles de
+    masque_contrast.
+    :return: masque_propseg
+    """
+    if masque_contrast.shape != masque_propseg.shape:
+        raise ValueError(f"Dimensions mismatch: contrast={masque_contrast.shape}, propseg={masque_propseg.shape}")
+    masque_propseg[:, :, :zsplit+1] = masque_contrast[:, :, :zsplit+1]
+    return masque_propseg
+
+
+def rogner_au_dessus_c1(masque, z_c1, marge_c1=10):
+    """
+    Met à 0, sur place, les slices au-dessus de z_c1 + marge_c1 (comme crop_above_C1.sh).
+    :return: masque
+    """
+    if z_c1 >= masque.shape[2]:
+        raise ValueError(f"C1 (z={z_c1}) est hors des dimensions de la segmentation {masque.shape}")
+    masque[:, :, z_c1 + marge_c1:] = 0
+    return masque
+
+
+def sauver_masque(masque, img_ref, output_path):
+    """
+    Sauvegarde un masque en uint8 avec la géométrie de l'image de référence (au format compact si
+    output_path se termine par .msk).
+    """
+    if output_path.endswith(EXTENSION_COMPACT):
+        ecrire_compact(masque, img_ref, output_path)
+        return
+    img = nib.Nifti1Image(masque, img_ref.affine, img_ref.header)
+    img.set_data_dtype(np.uint8)
+    nib.save(img, output_path)
+
+
+def fusionner_sujet(sujet_contraste, contrast_path, propseg_path, output_dir, decalage=5,
+                    label_path=None, marge_c1=10, garder_fusion=False, extension=".nii.gz"):
+    """
+    Charge une paire de segmentations une seule fois, les fusionne et sauvegarde le résultat.
+    Si label_path est donné, la fusion est croppée au-dessus de C1 avant d'être sauvegardée.
+    :param extension: Extension des fichiers de sortie (.nii.gz ou .msk)
+    :return: Message décrivant le résultat
+    """
+    fusion_path = os.path.join(output_dir, f"{sujet_contraste}_fusion{extension}")
+    cropped_path = os.path.join(output_dir, f"{sujet_contraste}_fusion_cropped{extension}")
+
+    z_c1 = None
+    if label_path is not None:
+        z_c1 = obtenir_metadonnees(label_path, ["z_max"])["z_max"]
+        if z_c1 is None:
+            return f"C1 introuvable pour {sujet_contraste}"
+
+    img_contrast, masque_contrast = charger_masque(contrast_path)
+
+    zmax = derniere_slice_non_vide(masque_contrast)
+    zsplit = (zmax if zmax is not None else 0) - decalage
+    if zsplit < 0:
+        return f"Z max trop petit pour {sujet_contraste} (z={zmax})"
+
+    _, masque_propseg = charger_masque(propseg_path)
+    fused = fusionner(masque_contrast, masque_propseg, zsplit)
+
+    if label_path is None or garder_fusion:
+        sauver_masque(fused, img_contrast, fusion_path)
+    if label_path is None:
+        return f"Fusion enregistrée : {fusion_path}"
+
+    sauver_masque(rogner_au_dessus_c1(fused, z_c1, marge_c1), img_contrast, cropped_path)
+    return f"Fusion croppée enregistrée : {cropped_path}"
+
+
+def lister_paires(propseg_dir, contrast_dir, label_dir=None):
+    """
+    Associe chaque segmentation PropSeg corrigée à sa segmentation contrast-agnostic (et à son
+    fichier de labels si label_dir est donné).
+    :return: Liste de tuples (sujet_contraste, contrast_path, propseg_path, label_path)
+    """
+    contrast_index = obtenir_index(contrast_dir)
+    label_index = obtenir_index(label_dir) if label_dir else {}
+    paires = []
+    for propseg_path in sorted(glob.glob(os.path.join(propseg_dir, f"*{SUFFIXE_PROPSEG}"))):
+        sujet_contraste = os.path.basename(propseg_path)[:-len(SUFFIXE_PROPSEG)]
+        sujet, contraste = sujet_contraste.split("_")[:2]
+        contrast_path = contrast_index.get((sujet, contraste, "desc-softseg_label-SC_seg"))
+        if contrast_path is None:
+            print(f"Contrast-agnostic manquant pour {sujet_contraste}")
+            continue
+        label_path = None
+        if label_dir:
+            label_path = label_index.get((sujet, contraste, "label-discs_dlabel"))
+            if label_path is None:
+                print(f"Label manquant pour {sujet_contraste}")
+                continue
+        paires.append((sujet_contraste, contrast_path, propseg_path, label_path))
+    return paires
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    os.makedirs(args.o, exist_ok=True)
+
+    print("\n========== Début fusion contrast-agnostic + propseg corrigée ==========\n")
+
+    paires = lister_paires(args.d_propseg, args.d_contrast, args.d_label)
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(fusionner_sujet, sujet_contraste, contrast_path, propseg_path, args.o,
+                                   args.decalage, label_path, args.marge_c1, args.garder_fusion,
+                                   EXTENSION_COMPACT if args.compact else ".nii.gz")
+                   for sujet_contraste, contrast_path, propseg_path, label_path in paires]
+        for paire, future in zip(paires, futures):
+            try:
+                print(future.result())
+            except Exception as e:
+                print(f"Erreur de fusion pour {paire[0]} : {e}")
+
+    print("\n Toutes les fusions sont terminées.")
+
+
+if __name__ == '__main__':
+    main()
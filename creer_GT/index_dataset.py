@@ -0,0 +1,213 @@
+"""
+Index des fichiers NIfTI d'un dataset organisé selon BIDS (ex: data-multi-subject et ses derivatives).
+
+OBJECTIF :
+----------
+Les scripts du pipeline cherchent les fichiers d'un sujet avec `glob` + regex ou avec un appel à
+`find` par sujet, ce qui reparcourt tout l'arbre à chaque sujet. Ce module parcourt l'arbre une
+seule fois avec `os.scandir`, associe chaque fichier à son sujet, son contraste et son suffixe,
+puis permet de retrouver un fichier directement à partir de ces trois informations.
+
+FONCTIONNEMENT :
+----------------
+1. Parcours récursif du dossier donné (les dossiers cachés et ceux de `exclure` sont ignorés).
+2. Tous les fichiers .nii.gz / .nii / .msk (masque compact, voir masque_compact.py) sont gardés.
+   Le nom de chacun est découpé selon la convention BIDS, par exemple :
+       sub-amu01_T1w_desc-softseg_label-SC_seg.nii.gz
+       -> sujet = sub-amu01, contraste = T1w, suffixe = desc-softseg_label-SC_seg
+       sub-amu01_T1w.nii.gz
+       -> sujet = sub-amu01, contraste = T1w, suffixe = "" (image anatomique)
+   Le contraste est le premier élément après le sujet qui n'est pas une entité BIDS (clé-valeur).
+   Les fichiers dont le nom ne suit pas la convention restent dans l'index, sans sujet ni contraste.
+3. L'index est sauvegardé en JSON à côté du cache de métadonnées (voir cache_metadonnees.py) avec
+   la date de modification de chaque dossier parcouru. Il est réutilisé tant qu'aucun dossier n'a
+   été modifié (ajout, suppression ou renommage de fichier), sinon il est reconstruit.
+
+UTILISATION :
+-------------
+Depuis Python :
+
+    from index_dataset import obtenir_index
+    index = obtenir_index("data-multi-subject/derivatives/labels")
+    label_file = index.get(("sub-amu01", "T1w", "label-discs_dlabel"))
+
+    # Tous les fichiers, y compris ceux qui ont la même clé ou un nom hors convention BIDS
+    from index_dataset import lister_fichiers
+    fichiers = lister_fichiers("data-multi-subject/derivatives/labels_softseg_bin")
+
+Depuis un script bash, l'index est écrit sur la sortie standard (sujet, contraste, chemin séparés
+par des tabulations) pour remplir un tableau associatif une seule fois :
+
+    python3 creer_GT/index_dataset.py -d data-multi-subject/derivatives/labels -suffixe label-discs_dlabel
+
+ARGUMENTS :
+-----------
+- `-d`        : dossier racine à indexer
+- `-suffixe`  : suffixe des fichiers à afficher ("" pour les images anatomiques)
+- `-exclure`  : (Optionnel) noms de dossiers à ignorer (ex: derivatives), peut être répété
+"""
+
+import os
+import json
+import hashlib
+import argparse
+from cache_metadonnees import chemin_cache
+
+VERSION_INDEX = 3
+
+EXTENSIONS = (".nii.gz", ".nii", ".msk")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Indexe les fichiers NIfTI d'un dataset BIDS et affiche ceux ayant le suffixe demandé.")
+    parser.add_argument("-d", type=str, required=True, help="Dossier racine à indexer")
+    parser.add_argument("-suffixe", type=str, required=True, help="Suffixe des fichiers à afficher (\"\" pour les images anatomiques)")
+    parser.add_argument("-exclure", type=str, action="append", default=[], help="Nom de dossier à ignorer (peut être répété)")
+    return parser
+
+
+def decouper_nom_bids(nom_fichier):
+    """
+    Découpe un nom de fichier BIDS en (sujet, contraste, suffixe).
+    :param nom_fichier: Nom du fichier (sans dossier), ex: sub-amu01_T1w_label-discs_dlabel.nii.gz
+    :return: Tuple (sujet, contraste, suffixe), ou None si le nom ne suit pas la convention
+    """
+    for extension in EXTENSIONS:
+        if nom_fichier.endswith(extension):
+            nom = nom_fichier[:-len(extension)]
+            break
+    else:
+        return None
+
+    elements = nom.split("_")
+    if not elements[0].startswith("sub-"):
+        return None
+
+    for i, element in enumerate(elements[1:], start=1):
+        if "-" not in element:
+            return elements[0], element, "_".join(elements[i + 1:])
+    return None
+
+
+def parcourir(racine, exclure=()):
+    """
+    Parcourt l'arbre une seule fois avec os.scandir.
+    :param racine: Dossier racine
+    :param exclure: Noms de dossiers à ignorer
+    :return: Tuple (fichiers, repertoires) où fichiers est une liste triée de
+             [sujet, contraste, suffixe, chemin relatif] (sujet, contraste et suffixe à None si le
+             nom ne suit pas la convention BIDS) et repertoires un dictionnaire
+             {chemin relatif: date de modification en ns}
+    """
+    fichiers = []
+    repertoires = {}
+    a_visiter = [""]
+    while a_visiter:
+        relatif = a_visiter.pop()
+        chemin = os.path.join(racine, relatif)
+        repertoires[relatif] = os.stat(chemin).st_mtime_ns
+        with os.scandir(chemin) as entrees:
+            for entree in entrees:
+                if entree.name.startswith("."):
+                    continue
+                chemin_relatif = os.path.join(relatif, entree.name)
+                if entree.is_dir():
+                    if entree.name not in exclure:
+                        a_visiter.append(chemin_relatif)
+                elif entree.is_file() and entree.name.endswith(EXTENSIONS):
+                    entites = decouper_nom_bids(entree.name) or (None, None, None)
+                    fichiers.append([*entites, chemin_relatif])
+    fichiers.sort(key=lambda f: f[3])
+    return fichiers, repertoires
+
+
+def _chemin_index(racine, exclure):
+    """
+    Chemin du fichier JSON de l'index, à côté du cache de métadonnées (None si le cache est désactivé).
+    """
+    chemin_db = chemin_cache()
+    if chemin_db is None:
+        return None
+    cle = json.dumps([os.path.abspath(racine), sorted(exclure)])
+    nom = "index_" + hashlib.sha1(cle.encode()).hexdigest()[:16] + ".json"
+    return os.path.join(os.path.dirname(os.path.abspath(chemin_db)), nom)
+
+
+def _index_a_jour(index, racine):
+    """
+    Vérifie qu'aucun des dossiers parcourus n'a été modifié depuis la création de l'index.
+    """
+    if index.get("version") != VERSION_INDEX:
+        return False
+    for relatif, mtime_ns in index["repertoires"].items():
+        try:
+            if os.stat(os.path.join(racine, relatif)).st_mtime_ns != mtime_ns:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _charger_index(racine, exclure=()):
+    """
+    Charge l'index sauvegardé d'un dossier s'il est encore à jour, sinon le reconstruit.
+    :return: Dictionnaire {version, repertoires, fichiers} (voir parcourir)
+    """
+    chemin_index = _chemin_index(racine, exclure)
+    index = None
+    if chemin_index is not None and os.path.exists(chemin_index):
+        with open(chemin_index) as f:
+            index = json.load(f)
+        if not _index_a_jour(index, racine):
+            index = None
+
+    if index is None:
+        fichiers, repertoires = parcourir(racine, exclure)
+        index = {"version": VERSION_INDEX, "repertoires": repertoires, "fichiers": fichiers}
+        if chemin_index is not None:
+            os.makedirs(os.path.dirname(chemin_index), exist_ok=True)
+            tmp = f"{chemin_index}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp, chemin_index)
+    return index
+
+
+def obtenir_index(racine, exclure=()):
+    """
+    Retourne l'index d'un dossier, en réutilisant l'index sauvegardé s'il est encore à jour.
+    :param racine: Dossier racine à indexer
+    :param exclure: Noms de dossiers à ignorer
+    :return: Dictionnaire {(sujet, contraste, suffixe): chemin}, trié par chemin. Si plusieurs
+             fichiers ont la même clé (ex: .nii et .nii.gz), le premier dans l'ordre alphabétique
+             est retourné ; lister_fichiers donne tous les fichiers.
+    """
+    resultat = {}
+    for sujet, contraste, suffixe, relatif in _charger_index(racine, exclure)["fichiers"]:
+        if sujet is not None:
+            resultat.setdefault((sujet, contraste, suffixe), os.path.join(racine, relatif))
+    return resultat
+
+
+def lister_fichiers(racine, exclure=()):
+    """
+    Retourne tous les fichiers NIfTI / .msk d'un dossier, à partir du même index qu'obtenir_index
+    (y compris les fichiers de même clé et ceux dont le nom ne suit pas la convention BIDS).
+    :return: Liste des chemins, triée
+    """
+    return [os.path.join(racine, relatif) for *_, relatif in _charger_index(racine, exclure)["fichiers"]]
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+
+    index = obtenir_index(args.d, args.exclure)
+    for (sujet, contraste, suffixe), chemin in index.items():
+        if suffixe == args.suffixe:
+            print(f"{sujet}\t{contraste}\t{chemin}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""
+Format compact pour les masques binaires (segmentations), avec accès direct à chaque slice Z.
+
+OBJECTIF :
+----------
+Les segmentations binaires sont enregistrées en .nii.gz (uint8 ou float) : pour lire quelques
+slices ou trouver l'étendue en Z du masque, tout le volume doit être décompressé. Le format `.msk`
+garde chaque slice Z séparément, compressée, avec un index des positions des slices dans le
+fichier :
+  - seules les slices demandées sont lues et décompressées ;
+  - les slices vides ne prennent aucune place, et l'étendue en Z du masque (première et dernière
+    slice non vide) se lit directement dans l'index, sans décompresser de données ;
+  - chaque slice est stockée sur 1 bit par voxel (np.packbits) puis compressée (deflate), et
+    l'en-tête et l'index sont compressés ensemble. Pour une segmentation de la moelle
+    (320 x 320 x 60), le .msk fait environ 4 ko contre 30 ko pour le .nii.gz en uint8 et 110 ko
+    en float ; pour de très petits masques, les tailles sont comparables.
+
+STRUCTURE DU FICHIER :
+----------------------
+    "MSK2"                          signature (4 octets)
+    taille de l'en-tête             uint32 : taille du bloc suivant, compressé avec zlib
+    en-tête compressé               en-tête NIfTI-1 (348 octets : géométrie, dimensions, taille
+                                    des voxels) suivi de l'index : (nz + 1) entiers uint32, début
+                                    de chaque slice dans les données (la slice z va de index[z] à
+                                    index[z+1], vide si égaux)
+    données                         slices compressées (deflate sans en-tête zlib), dans l'ordre
+                                    des Z
+
+Les masques sont binarisés (voxels > 0) à l'écriture et relus en uint8 (0 ou 1).
+
+INTÉGRATION :
+-------------
+charger_nifti (acces_nifti.py) ouvre directement les fichiers .msk : l'objet retourné s'utilise
+comme une image nibabel (`affine`, `header`, `shape`, `dataobj[:, :, z1:z2]`, `np.asanyarray`),
+donc seg_vs_label.py, fusion.py (fusion et crop au-dessus de C1), couverture_C1.py, metriques.py
+et le cache de métadonnées peuvent lire des .msk sans modification. z_max_ras (outils_nifti.py)
+utilise l'index du fichier.
+
+UTILISATION :
+-------------
+Conversion dans un sens ou dans l'autre (selon l'extension du fichier d'entrée) :
+
+    python creer_GT/masque_compact.py -i sub-XXX_T1w_fusion_cropped.nii.gz -o sub-XXX_T1w_fusion_cropped.msk
+    python creer_GT/masque_compact.py -i sub-XXX_T1w_fusion_cropped.msk -o sub-XXX_T1w_fusion_cropped.nii.gz
+
+ARGUMENTS :
+-----------
+- `-i` : fichier d'entrée (.nii.gz / .nii ou .msk)
+- `-o` : fichier de sortie (.msk ou .nii.gz / .nii)
+"""
+
+import io
+import os
+import zlib
+import argparse
+import nibabel as nib
+import numpy as np
+
+SIGNATURE = b"MSK2"
+TAILLE_ENTETE = 348
+EXTENSION = ".msk"
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Convertit un masque binaire entre le format NIfTI et le format compact .msk.")
+    parser.add_argument("-i", type=str, required=True, help="Fichier d'entrée (.nii.gz, .nii ou .msk)")
+    parser.add_argument("-o", type=str, required=True, help="Fichier de sortie (.msk, .nii.gz ou .nii)")
+    return parser
+
+
+class MasqueCompact:
+    """
+    Lecture d'un fichier .msk. S'utilise comme une image nibabel et comme son dataobj : seules les
+    slices Z demandées par l'indexation sont lues.
+    """
+
+    dtype = np.dtype(np.uint8)
+    ndim = 3
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        with open(chemin, "rb") as f:
+            if f.read(len(SIGNATURE)) != SIGNATURE:
+                raise ValueError(f"{chemin} n'est pas un fichier {EXTENSION}")
+            taille = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+            entete = zlib.decompress(f.read(taille))
+        self.header = nib.Nifti1Header.from_fileobj(io.BytesIO(entete[:TAILLE_ENTETE]))
+        self.index = np.frombuffer(entete, dtype="<u4", offset=TAILLE_ENTETE).astype(np.uint64)
+        self.debut_donnees = len(SIGNATURE) + 4 + taille
+        self.shape = tuple(int(n) for n in self.header.get_data_shape()[:3])
+        self.affine = self.header.get_best_affine()
+
+    @property
+    def dataobj(self):
+        return self
+
+    def get_filename(self):
+        return self.chemin
+
+    def get_data_dtype(self):
+        return self.dtype
+
+    def slices_non_vides(self):
+        """
+        Indices des slices Z non vides, lus dans l'index (aucune donnée n'est décompressée).
+        """
+        return np.flatnonzero(np.diff(self.index) > 0)
+
+    def etendue_z(self):
+        """
+        Première et dernière slice Z non vide, ou None si le masque est vide.
+        """
+        non_vides = self.slices_non_vides()
+        return (int(non_vides[0]), int(non_vides[-1])) if non_vides.size else None
+
+    def lire_slices(self, debut, fin):
+        """
+        Lit et décompresse les slices Z [debut, fin[.
+        :return: Tableau uint8 de forme (nx, ny, fin - debut)
+        """
+        nx, ny = self.shape[:2]
+        sortie = np.zeros((nx, ny, max(fin - debut, 0)), dtype=np.uint8)
+        if fin <= debut:
+            return sortie
+        with open(self.chemin, "rb") as f:
+            f.seek(self.debut_donnees + int(self.index[debut]))
+            bloc = f.read(int(self.index[fin] - self.index[debut]))
+        for z in range(debut, fin):
+            a, b = int(self.index[z] - self.index[debut]), int(self.index[z + 1] - self.index[debut])
+            if b > a:
+                bits = np.frombuffer(zlib.decompress(bloc[a:b], -zlib.MAX_WBITS), dtype=np.uint8)
+                sortie[:, :, z - debut] = np.unpackbits(bits, count=nx * ny).reshape(nx, ny)
+        return sortie
+
+    def __getitem__(self, cle):
+        if not isinstance(cle, tuple):
+            cle = (cle,)
+        # `...` est remplacé par autant de slices complètes que nécessaire (ex: dataobj[..., z])
+        ellipses = [i for i, c in enumerate(cle) if c is Ellipsis]
+        if ellipses:
+            i = ellipses[0]
+            cle = cle[:i] + (slice(None),) * (3 - len(cle) + 1) + cle[i + 1:]
+        cle = cle + (slice(None),) * (3 - len(cle))
+        cle_z = cle[2]
+        if isinstance(cle_z, (int, np.integer)):
+            z = int(cle_z) % self.shape[2]
+            return self.lire_slices(z, z + 1)[cle[0], cle[1], 0]
+        indices = range(*cle_z.indices(self.shape[2]))
+        if not indices:
+            return self.lire_slices(0, 0)[cle[0], cle[1]]
+        # Lire seulement les slices couvertes (dans l'ordre croissant), puis appliquer le pas
+        # (négatif : ordre inversé) sur le dernier axe, qui reste Z après les clés X et Y
+        debut, fin = min(indices[0], indices[-1]), max(indices[0], indices[-1]) + 1
+        return self.lire_slices(debut, fin)[cle[0], cle[1]][..., ::indices.step]
+
+    def __array__(self, dtype=None, copy=None):
+        data = self.lire_slices(0, self.shape[2])
+        return data if dtype is None else data.astype(dtype)
+
+
+def ecrire_compact(masque, img_ref, chemin):
+    """
+    Écrit un masque (binarisé, voxels > 0) au format .msk, avec la géométrie de l'image de référence.
+    :param masque: Tableau 3D
+    :param img_ref: Image nibabel (ou MasqueCompact) dont l'affine et l'en-tête sont repris
+    :param chemin: Fichier de sortie
+    """
+    masque = np.asarray(masque) > 0
+    header = nib.Nifti1Image(masque.astype(np.uint8), img_ref.affine, img_ref.header).header
+    header.set_data_dtype(np.uint8)
+    header.set_slope_inter(1, 0)
+    header.extensions.clear()
+
+    index = [0]
+    donnees = []
+    for z in range(masque.shape[2]):
+        tranche = masque[:, :, z]
+        compresse = b""
+        if tranche.any():
+            compresseur = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+            compresse = compresseur.compress(np.packbits(tranche).tobytes()) + compresseur.flush()
+        donnees.append(compresse)
+        index.append(index[-1] + len(compresse))
+    entete = zlib.compress(header.binaryblock[:TAILLE_ENTETE] + np.asarray(index, dtype="<u4").tobytes(), 9)
+
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(SIGNATURE)
+        f.write(np.uint32(len(entete)).astype("<u4").tobytes())
+        f.write(entete)
+        for compresse in donnees:
+            f.write(compresse)
+    os.replace(tmp, chemin)
+
+
+def nifti_vers_compact(chemin_nifti, chemin_msk):
+    """
+    Convertit un masque NIfTI en fichier .msk.
+    """
+    img = nib.load(chemin_nifti)
+    ecrire_compact(np.asanyarray(img.dataobj), img, chemin_msk)
+
+
+def compact_vers_nifti(chemin_msk, chemin_nifti):
+    """
+    Convertit un fichier .msk en masque NIfTI uint8.
+    """
+    masque = MasqueCompact(chemin_msk)
+    img = nib.Nifti1Image(np.asarray(masque), masque.affine, masque.header)
+    img.set_data_dtype(np.uint8)
+    nib.save(img, chemin_nifti)
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.i.endswith(EXTENSION):
+        compact_vers_nifti(args.i, args.o)
+    else:
+        nifti_vers_compact(args.i, args.o)
+    print(f"Converti : {args.i} -> {args.o}")
+
+
+if __name__ == '__main__':
+    main()
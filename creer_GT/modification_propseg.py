@@ -20,6 +20,34 @@ FONCTIONNEMENT :
 3. Extraction du chemin de l’image anatomique à partir de l’arborescence `data-multi-subject/derivatives/data_preprocessed`.
 4. Application de `sct_propseg` avec des paramètres adaptés.
 5. (Optionnel) Journalisation dans un CSV des paramètres utilisés pour chaque image traitée.
+   Le CSV est écrit au fur et à mesure que les segmentations se terminent. Lors d'une reprise,
+   les segmentations sautées (à jour) gardent leur ligne de l'exécution précédente.
+
+Les appels à `sct_propseg` sont lancés en parallèle (`-jobs` processus à la fois, par défaut le
+nombre de coeurs), chacun limité à `-threads` fils d'exécution. La sortie de chaque appel est
+enregistrée dans le dossier `-logs` (`<image>_propseg.out` et `<image>_propseg.err`) et la durée
+de chaque segmentation est ajoutée au CSV de journalisation (`wall_time_s`).
+
+REPRISE ET SEGMENTATIONS À JOUR :
+---------------------------------
+Un manifeste (`.manifest_propseg.json` dans le dossier de sortie) conserve, pour chaque
+segmentation produite, le hash de l'image d'entrée et les paramètres utilisés. Lors d'une
+relance, une segmentation n'est refaite que si le fichier de sortie est absent, si l'image
+d'entrée a changé ou si les paramètres sont différents. Le manifeste est mis à jour dès qu'une
+segmentation se termine, donc une exécution interrompue reprend là où elle s'était arrêtée.
+L'option `-force` refait toutes les segmentations.
+
+RECHERCHE DES PARAMÈTRES (`-recherche`) :
+----------------------------------------
+Au lieu d'un seul jeu de paramètres choisi selon la valeur `propseg`, tous les jeux de
+`CANDIDATS` sont lancés en même temps pour chaque image, chacun dans son propre dossier
+temporaire. Dès qu'un candidat se termine, l'écart entre le haut de sa segmentation et le label
+de C1 (comme seg_vs_label.py) est calculé ; le premier candidat dont l'écart atteint `-cible`
+(5 par défaut) est gardé et les candidats encore en cours sont arrêtés. Si aucun candidat
+n'atteint la cible, celui qui monte le plus haut est gardé. Les paramètres gagnants, l'écart
+obtenu et si la cible est atteinte sont ajoutés au CSV de journalisation et au manifeste.
+Avec `-recherche`, `-jobs` reste le nombre maximal de processus sct_propseg en même temps :
+`jobs // len(CANDIDATS)` images (au moins une) sont traitées à la fois.
 
 LOGIQUE DE PARAMÈTRES ADAPTATIFS :  
 ----------------------------------
@@ -48,6 +76,17 @@ ARGUMENTS :
 - `-f` : Chemin vers le fichier CSV contenant les sujets et leurs valeurs `propseg`.
 - `-o` : Répertoire de sortie pour enregistrer les nouvelles segmentations (défaut : ".").
 - `--log` : (Optionnel) Fichier CSV pour enregistrer les paramètres utilisés pour chaque sujet.
+- `-jobs` : (Optionnel) Nombre de segmentations lancées en parallèle (défaut : nombre de coeurs).
+           Avec `-recherche`, nombre total de processus sct_propseg.
+- `-threads` : (Optionnel) Nombre de fils d'exécution par segmentation (défaut : 1).
+- `-logs` : (Optionnel) Dossier des sorties de chaque segmentation (défaut : `<-o>/logs`).
+- `-force` : (Optionnel) Refaire toutes les segmentations, même celles qui sont à jour.
+- `-recherche` : (Optionnel) Lancer tous les jeux de paramètres de `CANDIDATS` en parallèle et
+                 garder le premier qui atteint C1.
+- `-cible` : (Optionnel) Avec `-recherche`, écart minimal (slices) entre le haut de la
+             segmentation et C1 pour qu'un candidat soit gardé (défaut : 5).
+- `-d_label` : (Optionnel) Avec `-recherche`, dossier des labels vertébraux
+               (défaut : data-multi-subject/derivatives/labels).
 
 AUTEUR :
 --------
@@ -58,9 +97,30 @@ Date : Avril 2025
 import argparse
 import pandas as pd
 import os
+import csv
 import glob
 import re
+import json
+import time
+import shutil
+import signal
+import tempfile
 import subprocess
+import nibabel as nib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache_metadonnees import hash_fichier, obtenir_metadonnees
+from index_dataset import obtenir_index
+from outils_nifti import z_max_ras
+from outils_processus import environnement_limite
+
+MANIFEST_FILE = ".manifest_propseg.json"
+
+# Jeux de paramètres (max_area, max_deformation, min_contrast) essayés avec -recherche, des
+# paramètres par défaut de PropSeg aux plus permissifs
+CANDIDATS = [(120, 2.5, 50), (200, 4, 40), (300, 5, 30), (400, 6, 20), (500, 8, 10)]
+
+# Intervalle (secondes) entre deux vérifications des candidats en cours
+INTERVALLE_RECHERCHE = 0.5
 
 
 def get_parser():
@@ -70,9 +130,32 @@ def get_parser():
     parser.add_argument("-f", type=str, required=True, help="Fichier CSV contenant le nom des sujets à analyser")
     parser.add_argument("--log", type=str, default=None, help="Fichier CSV pour enregistrer les paramètres utilisés")
     parser.add_argument("-o", type=str, default=".", help="Répertoire de sortie pour les segmentations")
+    parser.add_argument("-jobs", type=int, default=os.cpu_count(), help="Nombre de segmentations lancées en parallèle (défaut : nombre de coeurs)")
+    parser.add_argument("-threads", type=int, default=1, help="Nombre de fils d'exécution par segmentation (défaut : 1)")
+    parser.add_argument("-logs", type=str, default=None, help="Dossier des sorties de chaque segmentation (défaut : <-o>/logs)")
+    parser.add_argument("-force", action="store_true", help="Refaire toutes les segmentations, même celles qui sont à jour")
+    parser.add_argument("-recherche", action="store_true", help="Lancer tous les jeux de paramètres en parallèle et garder le premier qui atteint C1")
+    parser.add_argument("-cible", type=int, default=5, help="Avec -recherche, écart minimal (slices) entre le haut de la segmentation et C1 (défaut : 5)")
+    parser.add_argument("-d_label", type=str, default="data-multi-subject/derivatives/labels", help="Avec -recherche, dossier des labels vertébraux")
     return parser
 
 
+def parametres_propseg(propseg_value):
+    """
+    Choisit les paramètres de sct_propseg selon l'écart entre le haut de la segmentation
+    propseg par défaut et le label de C1.
+    :return: Tuple (max_area, max_deformation, min_contrast)
+    """
+    # Si la valeur est supérieure à 5, simplement garder les valeurs par défaut.
+    if propseg_value > 5:
+        return 120, 2.5, 50
+    # Définir des paramètres dynamiques si la valeur de propseg est inférieure ou égale à 5.
+    elif propseg_value > 2:
+        return 300, 5, 30
+    else:
+        return 400, 6, 20
+
+
 def generer_liste_images(csv_path, output_dir):
     df = pd.read_csv(csv_path)
     df_filtered = df[(df['propseg'].notna())]
@@ -109,26 +192,14 @@ def generer_liste_images(csv_path, output_dir):
         if not matched_files:
             print(f"Aucun fichier trouvé pour {sujet} ({contrast}) pattern: {file_pattern}")
         
-        # Si la valeur est supérieure à 5, simplement garder les valeurs par défaut.
-        if propseg_value > 5:
-            max_area = 120
-            max_deformation = 2.5
-            min_contrast = 50
-        # Définir des paramètres dynamiques si la valeur de propseg est inférieure ou égale à 5. 
-        elif propseg_value > 2:
-            max_area = 300
-            max_deformation = 5
-            min_contrast = 30
-        else:
-            max_area = 400
-            max_deformation = 6
-            min_contrast = 20
+        max_area, max_deformation, min_contrast = parametres_propseg(propseg_value)
 
         for file_path in matched_files:
             output_path = os.path.join(output_dir, f"{sujet}_{nom_contraste}_propseg.nii.gz")
             image_param_list.append({
                 'path': file_path,
                 'subject': sujet,
+                'nom_contraste': nom_contraste,
                 'contrast': contrast,
                 'propseg_value': propseg_value,
                 'max_area': max_area,
@@ -140,58 +211,345 @@ def generer_liste_images(csv_path, output_dir):
     return image_param_list
 
 
-def run_propseg(image_param_list, log_file=None):
-    if log_file:
-        log_entries = []
+# Colonnes du CSV de journalisation
+LOG_FIELDS = ['subject', 'image', 'contrast', 'propseg_value', 'max_area', 'max_deformation',
+              'min_contrast', 'output_path', 'wall_time_s', 'ecart_c1', 'cible_atteinte']
 
+
+def preparer_recherche(image_param_list, label_dir, cible=5, candidats=CANDIDATS):
+    """
+    Prépare les images pour la recherche des paramètres : ajoute le fichier de labels, la cible et
+    les candidats à chaque image. Les images sans fichier de labels sont retirées.
+    :return: Liste des images à segmenter
+    """
+    label_index = obtenir_index(label_dir)
+    images = []
     for img in image_param_list:
-        image_path = img['path']
-        contrast = img['contrast']
-        max_area = img['max_area']
-        max_deformation = img['max_deformation']
-        min_contrast = img['min_contrast']
-        sujet = img['subject']
-        output_path = img['output_path']
-
-        print(f"\n Segmenting: {image_path}")
-        print(f"   Params: max_area={max_area}, max_deformation={max_deformation}, min_contrast={min_contrast}")
-
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-        cmd = [
-            "sct_propseg",
-            "-i", image_path,
-            "-c", contrast,
-            "-o", output_path,
-            "-max-area", str(max_area),
-            "-max-deformation", str(max_deformation),
-            "-min-contrast", str(min_contrast),
-        ]
+        label_path = label_index.get((img['subject'], img['nom_contraste'], "label-discs_dlabel"))
+        if label_path is None:
+            print(f"Label manquant pour {img['subject']}_{img['nom_contraste']}, recherche impossible")
+            continue
+        img.update(label_path=label_path, cible=cible, candidats=[list(c) for c in candidats])
+        images.append(img)
+    return images
+
 
+def commande_propseg(img, output_path, max_area, max_deformation, min_contrast):
+    """
+    Construit la commande sct_propseg pour une image et un jeu de paramètres.
+    """
+    return [
+        "sct_propseg",
+        "-i", img['path'],
+        "-c", img['contrast'],
+        "-o", output_path,
+        "-max-area", str(max_area),
+        "-max-deformation", str(max_deformation),
+        "-min-contrast", str(min_contrast),
+    ]
+
+
+def executer_propseg(img, threads=1, log_dir=None):
+    """
+    Lance sct_propseg pour une image et attend la fin du processus.
+    :param img: Dictionnaire de paramètres (voir generer_liste_images)
+    :param threads: Nombre de fils d'exécution permis pour le processus
+    :param log_dir: Dossier où écrire la sortie standard et la sortie d'erreur du processus
+    :return: Tuple (succès, durée en secondes)
+    """
+    output_path = img['output_path']
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    cmd = commande_propseg(img, output_path, img['max_area'], img['max_deformation'], img['min_contrast'])
+    env = environnement_limite(threads)
+
+    nom = os.path.basename(output_path).replace(".nii.gz", "")
+    log_dir = log_dir or os.path.join(os.path.dirname(output_path) or ".", "logs")
+    os.makedirs(log_dir, exist_ok=True)
+
+    debut = time.monotonic()
+    with open(os.path.join(log_dir, f"{nom}.out"), "w") as out, \
+            open(os.path.join(log_dir, f"{nom}.err"), "w") as err:
+        resultat = subprocess.run(cmd, stdout=out, stderr=err, env=env)
+    return resultat.returncode == 0, time.monotonic() - debut
+
+
+def ecart_c1(seg_path, label_path):
+    """
+    Écart (slices, repère RAS) entre le haut d'une segmentation et le label de C1, comme
+    seg_vs_label.py. La segmentation n'est pas mise dans le cache de métadonnées (fichier temporaire).
+    :return: Écart, ou None si la segmentation ou les labels sont vides
+    """
+    z_seg = z_max_ras(nib.load(seg_path))
+    z_c1 = obtenir_metadonnees(label_path, ["z_max_ras"])["z_max_ras"]
+    if z_seg is None or z_c1 is None:
+        return None
+    return z_seg - z_c1
+
+
+def arreter_processus(processus, delai=5):
+    """
+    Arrête des processus encore en cours et leurs sous-processus (SIGTERM, puis SIGKILL après
+    `delai` secondes). Chaque processus doit avoir été lancé dans son propre groupe.
+    """
+    for proc in processus:
+        if proc.poll() is None:
+            signaler_groupe(proc, signal.SIGTERM)
+    for proc in processus:
         try:
-            subprocess.run(cmd, check=True)
-            print(f"Done: {output_path}")
-            if log_file:
-                log_entries.append({
-                    'subject': sujet,
-                    'image': os.path.basename(image_path),
-                    'contrast': contrast,
-                    'propseg_value': img['propseg_value'],
-                    'max_area': max_area,
-                    'max_deformation': max_deformation,
-                    'min_contrast': min_contrast,
-                    'output_path': output_path
-                })
-        except subprocess.CalledProcessError as e:
-            print(f"Error with {image_path}: {e}")
+            proc.wait(timeout=delai)
+        except subprocess.TimeoutExpired:
+            signaler_groupe(proc, signal.SIGKILL)
+            proc.wait()
+
+
+def signaler_groupe(proc, signal_envoye):
+    """
+    Envoie un signal au groupe de processus de proc (sct_propseg lance lui-même isct_propseg).
+    """
+    try:
+        os.killpg(proc.pid, signal_envoye)
+    except ProcessLookupError:
+        pass
 
+
+def rechercher_parametres(img, threads=1, log_dir=None):
+    """
+    Lance sct_propseg avec tous les candidats de l'image en même temps et garde le premier dont la
+    segmentation atteint la cible au-dessus de C1 (ou, à défaut, celle qui monte le plus haut).
+    Les candidats encore en cours sont arrêtés dès qu'un gagnant est trouvé. Les paramètres
+    gagnants, l'écart obtenu et `cible_atteinte` sont écrits dans img.
+    :param img: Dictionnaire de paramètres préparé par preparer_recherche
+    :return: Tuple (succès, durée en secondes)
+    """
+    output_path = img['output_path']
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    nom = os.path.basename(output_path).replace(".nii.gz", "")
+    log_dir = log_dir or os.path.join(output_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    env = environnement_limite(threads)
+
+    # Un dossier temporaire par candidat : les fichiers annexes de sct_propseg ne se mélangent pas
+    dossier_tmp = tempfile.mkdtemp(prefix=f".{nom}_", dir=output_dir)
+    debut = time.monotonic()
+    en_cours = {}
+    fichiers = []
+    try:
+        for i, parametres in enumerate(img['candidats']):
+            sortie = os.path.join(dossier_tmp, f"c{i}", os.path.basename(output_path))
+            os.makedirs(os.path.dirname(sortie))
+            out = open(os.path.join(log_dir, f"{nom}_c{i}.out"), "w")
+            err = open(os.path.join(log_dir, f"{nom}_c{i}.err"), "w")
+            fichiers += [out, err]
+            proc = subprocess.Popen(commande_propseg(img, sortie, *parametres), stdout=out, stderr=err, env=env,
+                                    start_new_session=True)
+            en_cours[proc] = (parametres, sortie)
+
+        gagnant, meilleur = None, None
+        while en_cours and gagnant is None:
+            time.sleep(INTERVALLE_RECHERCHE)
+            for proc in [p for p in en_cours if p.poll() is not None]:
+                parametres, sortie = en_cours.pop(proc)
+                if proc.returncode != 0 or not os.path.exists(sortie):
+                    continue
+                try:
+                    ecart = ecart_c1(sortie, img['label_path'])
+                except Exception as e:
+                    print(f"Candidat {parametres} illisible pour {nom} : {e}")
+                    continue
+                print(f"   {nom} : candidat {parametres} terminé, écart avec C1 = {ecart}")
+                if ecart is None:
+                    continue
+                if meilleur is None or ecart > meilleur[0]:
+                    meilleur = (ecart, parametres, sortie)
+                if ecart >= img['cible']:
+                    gagnant = meilleur = (ecart, parametres, sortie)
+                    break
+        arreter_processus(list(en_cours))
+
+        if meilleur is None:
+            return False, time.monotonic() - debut
+        ecart, (max_area, max_deformation, min_contrast), sortie = meilleur
+        os.replace(sortie, output_path)
+        img.update(max_area=max_area, max_deformation=max_deformation, min_contrast=min_contrast,
+                   ecart_c1=ecart, cible_atteinte=gagnant is not None)
+        return True, time.monotonic() - debut
+    finally:
+        arreter_processus(list(en_cours))
+        for f in fichiers:
+            f.close()
+        shutil.rmtree(dossier_tmp, ignore_errors=True)
+
+
+def charger_manifest(manifest_path):
+    """
+    Charge le manifeste des segmentations déjà produites ({output_path: signature}).
+    """
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+
+def sauver_manifest(manifest, manifest_path):
+    """
+    Écrit le manifeste de façon atomique (fichier temporaire puis renommage).
+    """
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp = f"{manifest_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+
+
+def signature_job(img, ancienne=None):
+    """
+    Calcule la signature d'une segmentation : hash de l'image d'entrée et paramètres utilisés
+    (avec -recherche : la cible et la liste des candidats).
+    Le hash n'est pas recalculé si la taille et la date de l'image sont celles de l'ancienne signature.
+    """
+    stat = os.stat(img['path'])
+    if ancienne and ancienne.get('taille') == stat.st_size and ancienne.get('mtime_ns') == stat.st_mtime_ns:
+        hash_entree = ancienne['hash_entree']
+    else:
+        hash_entree = hash_fichier(img['path'])
+    return {
+        'hash_entree': hash_entree,
+        'taille': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'parametres': ([img['contrast'], 'recherche', img['cible'], img['candidats']] if 'candidats' in img
+                       else [img['contrast'], img['max_area'], img['max_deformation'], img['min_contrast']]),
+    }
+
+
+def est_a_jour(img, signature, manifest):
+    """
+    Vérifie si la segmentation existe déjà avec la même image d'entrée et les mêmes paramètres.
+    """
+    ancienne = manifest.get(img['output_path'])
+    return (os.path.exists(img['output_path']) and ancienne is not None
+            and ancienne['hash_entree'] == signature['hash_entree']
+            and ancienne['parametres'] == signature['parametres'])
+
+
+def ligne_log(img, duree=None, signature=None):
+    """
+    Ligne du CSV de journalisation pour une segmentation. Pour une segmentation sautée (duree
+    None), les paramètres gagnants d'une recherche sont repris de sa signature dans le manifeste.
+    """
+    if signature and 'gagnant' in signature:
+        img = dict(img, max_area=signature['gagnant'][0], max_deformation=signature['gagnant'][1],
+                   min_contrast=signature['gagnant'][2])
+    return {
+        'subject': img['subject'],
+        'image': os.path.basename(img['path']),
+        'contrast': img['contrast'],
+        'propseg_value': img['propseg_value'],
+        'max_area': img['max_area'],
+        'max_deformation': img['max_deformation'],
+        'min_contrast': img['min_contrast'],
+        'output_path': img['output_path'],
+        'wall_time_s': '' if duree is None else round(duree, 2),
+        'ecart_c1': img.get('ecart_c1', ''),
+        'cible_atteinte': img.get('cible_atteinte', '')
+    }
+
+
+def lire_log(log_file):
+    """
+    Lit les lignes d'un CSV de journalisation existant ({output_path: ligne}).
+    """
+    if not log_file or not os.path.exists(log_file):
+        return {}
+    with open(log_file, newline='') as f:
+        return {ligne['output_path']: {k: ligne.get(k) or '' for k in LOG_FIELDS} for ligne in csv.DictReader(f)}
+
+
+def run_propseg(image_param_list, log_file=None, jobs=None, threads=1, log_dir=None,
+                manifest_path=None, force=False):
+    """
+    Lance sct_propseg sur toutes les images, jusqu'à `jobs` processus à la fois (avec la recherche,
+    jobs // nombre de candidats images à la fois). Si log_file est
+    donné, une ligne y est écrite dès qu'une segmentation se termine avec succès.
+    Si manifest_path est donné, les segmentations déjà à jour sont sautées (sauf si force=True)
+    et le manifeste est mis à jour après chaque segmentation réussie. Les segmentations sautées
+    gardent leur ligne du CSV de journalisation de l'exécution précédente (ou une ligne refaite à
+    partir du manifeste, sans durée).
+    Les images préparées par preparer_recherche passent par rechercher_parametres.
+    """
+    manifest = charger_manifest(manifest_path)
+    anciennes_lignes = lire_log(log_file)
+    jobs = jobs or os.cpu_count()
+    candidats_max = max((len(img['candidats']) for img in image_param_list if 'candidats' in img), default=1)
+    # Chaque recherche lance tous ses candidats en même temps : limiter le nombre d'images à la fois
+    images_a_la_fois = max(1, jobs // candidats_max)
+    log_f, writer = None, None
     if log_file:
-        keys = log_entries[0].keys()
-        with open(log_file, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(log_entries)
-        print(f"\nParamètres enregistrés dans: {log_file}")
+        log_f = open(log_file, 'w', newline='')
+        writer = csv.DictWriter(log_f, fieldnames=LOG_FIELDS)
+        writer.writeheader()
+        log_f.flush()
+
+    try:
+        with ThreadPoolExecutor(max_workers=images_a_la_fois) as executor:
+            futures = {}
+            signatures = {}
+            for img in image_param_list:
+                if manifest_path:
+                    signature = signature_job(img, manifest.get(img['output_path']))
+                    signatures[img['output_path']] = signature
+                    if not force and est_a_jour(img, signature, manifest):
+                        print(f"\n À jour, segmentation sautée: {img['output_path']}")
+                        if writer:
+                            writer.writerow(anciennes_lignes.get(img['output_path'])
+                                            or ligne_log(img, signature=manifest[img['output_path']]))
+                            log_f.flush()
+                        continue
+
+                print(f"\n Segmenting: {img['path']}")
+                if 'candidats' in img:
+                    print(f"   Recherche parmi {len(img['candidats'])} jeux de paramètres (cible : {img['cible']} slices au-dessus de C1)")
+                    futures[executor.submit(rechercher_parametres, img, threads, log_dir)] = img
+                    continue
+                print(f"   Params: max_area={img['max_area']}, max_deformation={img['max_deformation']}, min_contrast={img['min_contrast']}")
+                futures[executor.submit(executer_propseg, img, threads, log_dir)] = img
+
+            for future in as_completed(futures):
+                img = futures[future]
+                try:
+                    succes, duree = future.result()
+                except Exception as e:
+                    # Une erreur sur une image (commande introuvable, segmentation illisible...)
+                    # n'arrête pas les autres segmentations
+                    print(f"Error with {img['path']}: {e}")
+                    if manifest.pop(img['output_path'], None) is not None:
+                        sauver_manifest(manifest, manifest_path)
+                    continue
+
+                if not succes:
+                    print(f"Error with {img['path']} ({duree:.1f} s), voir les logs de {img['output_path']}")
+                    if manifest.pop(img['output_path'], None) is not None:
+                        sauver_manifest(manifest, manifest_path)
+                    continue
+
+                print(f"Done: {img['output_path']} ({duree:.1f} s)")
+                if 'candidats' in img:
+                    print(f"   Paramètres gardés: max_area={img['max_area']}, max_deformation={img['max_deformation']}, "
+                          f"min_contrast={img['min_contrast']} (écart avec C1 = {img['ecart_c1']}"
+                          f"{'' if img['cible_atteinte'] else ', cible non atteinte'})")
+                if manifest_path:
+                    manifest[img['output_path']] = signatures[img['output_path']]
+                    if 'candidats' in img:
+                        manifest[img['output_path']]['gagnant'] = [img['max_area'], img['max_deformation'], img['min_contrast']]
+                    sauver_manifest(manifest, manifest_path)
+                if writer:
+                    writer.writerow(ligne_log(img, duree))
+                    log_f.flush()
+    finally:
+        if log_f:
+            log_f.close()
+            print(f"\nParamètres enregistrés dans: {log_file}")
 
 
 if __name__ == '__main__':
@@ -199,7 +557,10 @@ if __name__ == '__main__':
     args = parser.parse_args()
 
     images = generer_liste_images(args.f, args.o)
+    if args.recherche:
+        images = preparer_recherche(images, args.d_label, args.cible)
     if not images:
         print("Aucun fichier image trouvé pour segmentation. Vérifie le CSV et les chemins.")
 
-    run_propseg(images, log_file=args.log)
\ No newline at end of file
+    run_propseg(images, log_file=args.log, jobs=args.jobs, threads=args.threads, log_dir=args.logs,
+                manifest_path=os.path.join(args.o, MANIFEST_FILE), force=args.force)
\ No newline at end of file
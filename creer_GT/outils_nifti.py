@@ -0,0 +1,196 @@
+"""
+Fonctions utilitaires partagées pour la lecture des fichiers NIfTI (segmentations et labels).
+
+OBJECTIF :
+----------
+Ce module regroupe les fonctions utilisées par plusieurs scripts du pipeline pour trouver
+l'étendue en Z d'un masque (segmentation ou labels) sans charger tout le volume en float64.
+
+FONCTIONNEMENT :
+----------------
+- Les données sont lues directement à partir du `dataobj` de nibabel, dans leur type natif
+  (uint8, int16, float32...), sans la conversion en float64 de `get_fdata()`.
+- La recherche de la tranche la plus haute se fait par blocs de tranches (« slabs »), en partant
+  du haut de l'axe Z et en s'arrêtant au premier bloc non vide.
+- L'orientation est déduite de la matrice affine : on trouve l'axe voxel orienté S/I et son sens,
+  sans créer de copie réorientée de l'image. Les indices retournés par `z_max_ras` sont exprimés
+  dans le repère RAS (comme après une réorientation avec `as_reoriented`).
+
+Le module fournit aussi des fonctions pour limiter les opérations volumiques à la boîte englobante
+des voxels non nuls (`boite_englobante`, `appliquer_dans_boite`) : la moelle n'occupe qu'une petite
+partie du champ de vue, donc le temps de calcul et la mémoire dépendent de la taille de la moelle
+plutôt que de celle de l'image.
+
+Pour les masques au format compact .msk (voir masque_compact.py), l'étendue en Z est lue dans
+l'index des slices du fichier, sans lire de données.
+
+Pour les fichiers .nii.gz, la lecture par blocs n'est avantageuse que si `indexed_gzip` est
+installé (sinon chaque retour en arrière dans le fichier recommence la décompression). Sans
+`indexed_gzip`, le volume est lu une seule fois dans son type natif et la recherche se fait en mémoire.
+
+UTILISATION :
+-------------
+    from outils_nifti import z_max_ras, appliquer_dans_boite
+
+    img = nib.load("sub-XXX_T1w_label-discs_dlabel.nii.gz")
+    z_c1 = z_max_ras(img)
+
+    # Opération limitée à la boîte englobante du masque (agrandie de 2 voxels)
+    sortie = appliquer_dans_boite(data, fonction, marge=2)
+"""
+
+import numpy as np
+from nibabel.orientations import aff2axcodes
+from masque_compact import MasqueCompact
+
+try:
+    import indexed_gzip  # noqa: F401
+    HAVE_INDEXED_GZIP = True
+except ImportError:
+    HAVE_INDEXED_GZIP = False
+
+# Nombre de tranches lues à la fois lors de la recherche de la tranche la plus haute
+EPAISSEUR_SLAB = 8
+
+
+def axe_superieur(img):
+    """
+    Trouve l'axe voxel orienté selon l'axe supérieur/inférieur à partir de la matrice affine.
+    :param img: Image NIfTI chargée avec nibabel
+    :return: Tuple (axe, vers_le_haut) où vers_le_haut est True si les indices croissants
+             vont vers le haut (S) et False s'ils vont vers le bas (I)
+    """
+    codes = aff2axcodes(img.affine)
+    for axe, code in enumerate(codes):
+        if code in ('S', 'I'):
+            return axe, code == 'S'
+    raise ValueError(f"Aucun axe S/I trouvé dans l'orientation {codes}")
+
+
+def acces_par_tranches(img):
+    """
+    Indique si la lecture d'un bloc de tranches est peu coûteuse pour cette image
+    (fichier non compressé ou indexed_gzip disponible).
+    """
+    fichier = img.get_filename()
+    return fichier is None or not str(fichier).endswith('.gz') or HAVE_INDEXED_GZIP
+
+
+def derniere_tranche_non_vide(data, axe=2, vers_le_haut=True, epaisseur=EPAISSEUR_SLAB):
+    """
+    Trouve la tranche non vide (voxels > 0) la plus éloignée le long d'un axe, en lisant les
+    données par blocs et en s'arrêtant au premier bloc non vide.
+    :param data: Tableau numpy ou proxy nibabel (img.dataobj)
+    :param axe: Axe voxel le long duquel chercher
+    :param vers_le_haut: True pour chercher l'indice le plus grand, False pour le plus petit
+    :param epaisseur: Nombre de tranches lues à la fois
+    :return: Indice (dans le repère voxel natif) de la tranche, ou None si le volume est vide
+    """
+    n = data.shape[axe]
+    autres_axes = tuple(i for i in range(len(data.shape)) if i != axe)
+
+    if vers_le_haut:
+        bornes = [(max(0, fin - epaisseur), fin) for fin in range(n, 0, -epaisseur)]
+    else:
+        bornes = [(debut, min(n, debut + epaisseur)) for debut in range(0, n, epaisseur)]
+
+    for debut, fin in bornes:
+        slicer = [slice(None)] * len(data.shape)
+        slicer[axe] = slice(debut, fin)
+        slab = np.asanyarray(data[tuple(slicer)])
+        non_vides = np.flatnonzero(np.any(slab > 0, axis=autres_axes))
+        if non_vides.size:
+            return debut + int(non_vides[-1] if vers_le_haut else non_vides[0])
+    return None
+
+
+def z_max_ras(img, epaisseur=EPAISSEUR_SLAB):
+    """
+    Trouve l'indice Z (repère RAS) de la tranche non vide la plus haute d'une image.
+    Équivalent à np.max(np.where(data > 0)[2]) après réorientation en RAS, sans réorienter
+    l'image ni la convertir en float64.
+    :param img: Image NIfTI chargée avec nibabel
+    :param epaisseur: Nombre de tranches lues à la fois
+    :return: Indice Z de la tranche la plus haute, ou None si l'image est vide
+    """
+    axe, vers_le_haut = axe_superieur(img)
+    if isinstance(img, MasqueCompact) and axe == 2:
+        etendue = img.etendue_z()
+        if etendue is None:
+            return None
+        return etendue[1] if vers_le_haut else img.shape[axe] - 1 - etendue[0]
+
+    data = img.dataobj if acces_par_tranches(img) else np.asanyarray(img.dataobj)
+
+    indice = derniere_tranche_non_vide(data, axe, vers_le_haut=vers_le_haut, epaisseur=epaisseur)
+    if indice is None:
+        return None
+    return indice if vers_le_haut else img.shape[axe] - 1 - indice
+
+
+def boite_englobante(data, marge=0):
+    """
+    Calcule la boîte englobante des voxels non nuls (> 0) d'un volume.
+    :param data: Tableau numpy
+    :param marge: Nombre de voxels ajoutés de chaque côté (limité aux dimensions du volume)
+    :return: Tuple de slices (un par axe) utilisable comme data[boite], ou None si le volume est vide
+    """
+    masque = np.asarray(data) > 0
+    bornes = []
+    for axe in range(masque.ndim):
+        autres_axes = tuple(a for a in range(masque.ndim) if a != axe)
+        non_vides = np.flatnonzero(np.any(masque, axis=autres_axes))
+        if non_vides.size == 0:
+            return None
+        bornes.append((int(non_vides[0]), int(non_vides[-1]) + 1))
+    return boite_depuis_bornes(bornes, masque.shape, marge)
+
+
+def boite_depuis_bornes(bornes, forme, marge=0, axes=None):
+    """
+    Construit une boîte (tuple de slices) à partir de bornes [début, fin[ par axe, par exemple
+    celles conservées dans le cache de métadonnées, en ajoutant une marge sur les axes donnés.
+    :param bornes: Liste de paires (début, fin) par axe
+    :param forme: Dimensions du volume
+    :param marge: Nombre de voxels ajoutés de chaque côté
+    :param axes: Axes sur lesquels ajouter la marge (par défaut tous)
+    :return: Tuple de slices
+    """
+    axes = range(len(forme)) if axes is None else axes
+    boite = []
+    for axe, (debut, fin) in enumerate(bornes):
+        m = marge if axe in axes else 0
+        boite.append(slice(max(0, debut - m), min(forme[axe], fin + m)))
+    return tuple(boite)
+
+
+def union_boites(*boites):
+    """
+    Retourne la plus petite boîte contenant toutes les boîtes données (les None sont ignorées).
+    """
+    boites = [b for b in boites if b is not None]
+    if not boites:
+        return None
+    return tuple(slice(min(b[axe].start for b in boites), max(b[axe].stop for b in boites))
+                 for axe in range(len(boites[0])))
+
+
+def appliquer_dans_boite(data, fonction, marge=0, boite=None, dtype=None):
+    """
+    Applique une opération seulement sur la boîte englobante des voxels non nuls, puis recolle le
+    résultat dans un volume vide de la taille d'origine. L'opération doit conserver la forme du
+    sous-volume et laisser le fond à 0.
+    :param data: Tableau numpy ou proxy nibabel (img.dataobj) ; seule la boîte est lue si boite est donnée
+    :param fonction: Opération appliquée au sous-volume
+    :param marge: Nombre de voxels ajoutés autour de la boîte (ex: pour un zoom qui agrandit le masque)
+    :param boite: Boîte déjà connue (ex: à partir du cache de métadonnées), calculée sinon
+    :param dtype: Type du volume de sortie (par défaut celui de data)
+    :return: Volume de la même forme que data
+    """
+    if boite is None:
+        data = np.asanyarray(data)
+        boite = boite_englobante(data, marge)
+    sortie = np.zeros(data.shape, dtype=dtype or data.dtype)
+    if boite is not None:
+        sortie[boite] = fonction(np.asanyarray(data[boite]))
+    return sortie
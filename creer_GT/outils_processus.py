@@ -0,0 +1,30 @@
+"""
+Fonctions utilitaires partagées pour lancer les commandes externes (SCT) depuis les scripts Python.
+
+OBJECTIF :
+----------
+Plusieurs scripts du pipeline (modification_propseg.py, calcul_facteurs_echelle.py,
+qc_fusion_all.py, pipeline.py) lancent des commandes SCT en parallèle. Chaque commande SCT utilise
+par défaut tous les coeurs de la machine (OpenMP, ITK, BLAS) : lancer N commandes en même temps
+surcharge alors les coeurs. Ce module regroupe ce qui est commun à ces scripts.
+
+UTILISATION :
+-------------
+    from outils_processus import environnement_limite
+
+    subprocess.run(["sct_qc", ...], env=environnement_limite(1))
+"""
+
+import os
+
+
+def environnement_limite(threads=1):
+    """
+    Copie de l'environnement limitant le nombre de fils d'exécution d'un processus SCT, pour ne
+    pas surcharger les coeurs quand plusieurs processus tournent en parallèle.
+    """
+    env = dict(os.environ)
+    for variable in ("OMP_NUM_THREADS", "ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS",
+                     "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        env[variable] = str(threads)
+    return env
@@ -0,0 +1,457 @@
+"""
+Pipeline complet de création des GT, décrit par un seul fichier de configuration (pipeline.yml).
+
+OBJECTIF :
+----------
+Ce script enchaîne, sujet par sujet, les étapes qui sont sinon lancées une à une à la main en
+modifiant les chemins dans chaque script :
+    seg_vs_label.py -> analyse_seg_vs_label.py -> modification_propseg.py
+    -> calcul_facteurs_echelle -> appliquer_facteur_echelle.py -> fusion + crop (fusion.py)
+    -> qc_fusion_all.sh
+Tous les chemins et paramètres sont dans le fichier de configuration.
+
+FONCTIONNEMENT :
+----------------
+Chaque sujet (sub-XXX_contraste) suit la même chaîne d'étapes. Les sujets sont indépendants et
+sont traités en parallèle (`jobs` processus) : un sujet peut être à l'étape de fusion pendant
+qu'un autre est encore dans sct_propseg. Les étapes d'un sujet sont :
+  1. `ecarts`   : écart entre le haut du GT / de la segmentation propseg par défaut et le label de
+                  C1 (process_segmentation de seg_vs_label.py). Le sujet n'est gardé que si l'écart
+                  du GT est inférieur à `seuil_gt` (comme gt_negatif.csv).
+  2. `propseg`  : sct_propseg avec les paramètres choisis selon l'écart de propseg
+                  (parametres_propseg de modification_propseg.py).
+  3. `facteur`  : facteur d'échelle CSA_GT / CSA_PropSeg entre C2 et C4 (calcul_csa.py ou SCT).
+  4. `echelle`  : application du facteur à la segmentation propseg (appliquer_facteur_echelle.py).
+  5. `fusion`   : fusion avec le GT et crop au-dessus de C1 en une passe (fusion.py).
+  6. `qc`       : rapports sct_qc (sct_deepseg_sc et sct_label_vertebrae), un sujet à la fois.
+L'étape `flux` remplace `echelle` et `fusion` : mise à l'échelle, fusion, crop et métriques sont
+faits en mémoire (voir flux.py) et seul le GT final est écrit, avec ses métriques dans
+`<sortie>/metriques/`. Exemple : `etapes: [ecarts, propseg, facteur, flux, qc]`.
+Une étape est sautée si ses sorties existent et sont plus récentes que toutes ses entrées (comme
+`make`). L'option `-force` refait toutes les étapes.
+
+À la fin, les tableaux habituels sont écrits dans le dossier de sortie (`ecarts.csv` au format de
+seg_vs_label.py, `facteurs_echelle.csv` et, avec l'étape `flux`, `metriques_flux.csv`) ainsi que `rapport_etapes.csv` (état et durée de chaque
+étape pour chaque sujet). Le temps total et le temps moyen de chaque étape sont affichés.
+
+ORGANISATION DU DOSSIER DE SORTIE :
+-----------------------------------
+    <sortie>/ecarts/sub-XXX_contraste.json
+    <sortie>/propseg/sub-XXX_contraste_propseg.nii.gz
+    <sortie>/facteurs/sub-XXX_contraste.json
+    <sortie>/propseg_echelle/sub-XXX_contraste_seg_corrige.nii.gz
+    <sortie>/fusion/sub-XXX_contraste_fusion_cropped.nii.gz
+    <sortie>/metriques/sub-XXX_contraste.json           (étape flux)
+    <sortie>/logs/propseg/
+    <qc.dossier>/
+
+UTILISATION :
+-------------
+    python creer_GT/pipeline.py -c creer_GT/pipeline.yml
+
+ARGUMENTS :
+-----------
+- `-c`      : fichier de configuration YAML (voir pipeline.yml)
+- `-jobs`   : (Optionnel) nombre de sujets traités en parallèle (remplace `jobs` de la configuration)
+- `-force`  : (Optionnel) refaire toutes les étapes, même celles qui sont à jour
+"""
+
+import os
+import json
+import time
+import fcntl
+import argparse
+import subprocess
+import yaml
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from index_dataset import obtenir_index
+from seg_vs_label import traiter_paire, trouver_nom_sujet_contraste
+from modification_propseg import parametres_propseg, executer_propseg
+from outils_processus import environnement_limite
+from calcul_facteurs_echelle import facteur_sct, facteur_python, COLONNES
+from appliquer_facteur_echelle import scale_segmentation_per_slice
+from fusion import fusionner_sujet
+from flux import traiter_lot, COLONNES as COLONNES_FLUX
+
+# Valeurs utilisées pour les clés absentes du fichier de configuration
+CONFIG_DEFAUT = {
+    "dataset": "data-multi-subject",
+    "sortie": "resultats_pipeline",
+    "jobs": os.cpu_count(),
+    "contrastes": ["T1w", "T2w"],
+    "sujets": [],
+    "etapes": ["ecarts", "propseg", "facteur", "echelle", "fusion", "qc"],
+    "gt": {"dossier": "data-multi-subject/derivatives/labels_softseg_bin", "suffixe": "desc-softseg_label-SC_seg"},
+    "propseg_defaut": {"dossier": "propseg", "suffixe": "propseg"},
+    "labels": {"dossier": "data-multi-subject/derivatives/labels", "suffixe": "label-discs_dlabel"},
+    "seuil_gt": 5,
+    "propseg": {"threads": 1},
+    "facteur": {"backend": "python", "threads": 1},
+    "fusion": {"decalage": 5, "marge_c1": 10},
+    "qc": {"dossier": "qc_report"},
+}
+
+# États possibles d'une étape
+EXECUTEE = "exécutée"
+A_JOUR = "à jour"
+ARRET = "arrêt"
+ERREUR = "erreur"
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Lance toute la chaîne de création des GT, sujet par sujet, à partir d'un fichier de configuration.")
+    parser.add_argument("-c", type=str, required=True, help="Fichier de configuration YAML (voir pipeline.yml)")
+    parser.add_argument("-jobs", type=int, default=None, help="Nombre de sujets traités en parallèle (remplace celui de la configuration)")
+    parser.add_argument("-force", action="store_true", help="Refaire toutes les étapes, même celles qui sont à jour")
+    return parser
+
+
+def charger_config(chemin):
+    """
+    Lit le fichier de configuration et complète les clés absentes avec CONFIG_DEFAUT
+    (les sections sont complétées clé par clé).
+    """
+    with open(chemin) as f:
+        lue = yaml.safe_load(f) or {}
+    config = {}
+    for cle, defaut in CONFIG_DEFAUT.items():
+        valeur = lue.get(cle, defaut)
+        config[cle] = {**defaut, **(valeur or {})} if isinstance(defaut, dict) else valeur
+    inconnues = set(lue) - set(CONFIG_DEFAUT)
+    if inconnues:
+        print(f"Clés inconnues ignorées dans {chemin} : {', '.join(sorted(inconnues))}")
+    return config
+
+
+def a_jour(sorties, entrees):
+    """
+    Vérifie que toutes les sorties existent et sont plus récentes que toutes les entrées.
+    """
+    if not all(os.path.exists(s) for s in sorties):
+        return False
+    return min(os.stat(s).st_mtime_ns for s in sorties) >= max(os.stat(e).st_mtime_ns for e in entrees)
+
+
+def ecrire_json(donnees, chemin):
+    """
+    Écrit un fichier JSON de façon atomique (fichier temporaire puis renommage).
+    """
+    tmp = f"{chemin}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(donnees, f, indent=2)
+    os.replace(tmp, chemin)
+
+
+def lire_json(chemin):
+    with open(chemin) as f:
+        return json.load(f)
+
+
+def chemin_sortie(config, dossier, nom):
+    """
+    Chemin d'un fichier dans un sous-dossier du dossier de sortie (créé au besoin).
+    """
+    dossier = os.path.join(config["sortie"], dossier)
+    os.makedirs(dossier, exist_ok=True)
+    return os.path.join(dossier, nom)
+
+
+def etape_ecarts(ctx, config):
+    """
+    Écarts du GT et de la segmentation propseg par défaut par rapport au label de C1.
+    """
+    sortie = chemin_sortie(config, "ecarts", f"{ctx['sujet_contraste']}.json")
+    entrees = [ctx["gt"], ctx["propseg_defaut"], ctx["label"]]
+    ctx["ecarts"] = sortie
+
+    etat = A_JOUR
+    if config["force"] or not a_jour([sortie], entrees):
+        ecarts = {methode: traiter_paire(seg, ctx["label"], methode)[methode]
+                  for methode, seg in (("GT", ctx["gt"]), ("propseg", ctx["propseg_defaut"]))}
+        ecrire_json(ecarts, sortie)
+        etat = EXECUTEE
+
+    ecarts = lire_json(sortie)
+    ctx["ecart_propseg"] = ecarts["propseg"]
+    if ecarts["GT"] == "N/A" or ecarts["propseg"] == "N/A":
+        return ARRET, "écart impossible à calculer"
+    if ecarts["GT"] >= config["seuil_gt"]:
+        return ARRET, f"GT assez haut (écart = {ecarts['GT']})"
+    return etat, ""
+
+
+def etape_propseg(ctx, config):
+    """
+    sct_propseg avec les paramètres adaptés à l'écart de la segmentation propseg par défaut.
+    """
+    sortie = chemin_sortie(config, "propseg", f"{ctx['sujet_contraste']}_propseg.nii.gz")
+    ctx["propseg"] = sortie
+    if not config["force"] and a_jour([sortie], [ctx["anat"], ctx["ecarts"]]):
+        return A_JOUR, ""
+
+    max_area, max_deformation, min_contrast = parametres_propseg(ctx["ecart_propseg"])
+    img = {
+        'path': ctx["anat"],
+        'contrast': {"T1w": "t1", "T2w": "t2"}[ctx["contraste"]],
+        'max_area': max_area,
+        'max_deformation': max_deformation,
+        'min_contrast': min_contrast,
+        'output_path': sortie,
+    }
+    succes, _ = executer_propseg(img, config["propseg"]["threads"], os.path.join(config["sortie"], "logs", "propseg"))
+    if not succes:
+        # Une sortie partielle serait considérée à jour à la prochaine exécution
+        if os.path.exists(sortie):
+            os.remove(sortie)
+        raise RuntimeError("sct_propseg a échoué, voir les logs")
+    return EXECUTEE, f"max_area={max_area}, max_deformation={max_deformation}, min_contrast={min_contrast}"
+
+
+def etape_facteur(ctx, config):
+    """
+    Facteur d'échelle CSA_GT / CSA_PropSeg entre C2 et C4.
+    """
+    sortie = chemin_sortie(config, "facteurs", f"{ctx['sujet_contraste']}.json")
+    ctx["facteur"] = sortie
+
+    etat = A_JOUR
+    if config["force"] or not a_jour([sortie], [ctx["propseg"], ctx["gt"], ctx["label"]]):
+        travail = (ctx["sujet_contraste"], ctx["propseg"], ctx["gt"], ctx["label"])
+        if config["facteur"]["backend"] == "sct":
+            resultat = facteur_sct(*travail, config["facteur"]["threads"])
+        else:
+            resultat = facteur_python(*travail)
+        ecrire_json(resultat, sortie)
+        etat = EXECUTEE
+
+    facteur = pd.to_numeric(lire_json(sortie).get("Facteur_Echelle"), errors="coerce")
+    if pd.isna(facteur):
+        return ARRET, "facteur d'échelle vide ou NaN"
+    ctx["valeur_facteur"] = float(facteur)
+    return etat, f"facteur = {facteur}"
+
+
+def etape_echelle(ctx, config):
+    """
+    Application du facteur d'échelle à la segmentation propseg.
+    """
+    sortie = chemin_sortie(config, "propseg_echelle", f"{ctx['sujet_contraste']}_seg_corrige.nii.gz")
+    ctx["seg_corrige"] = sortie
+    if not config["force"] and a_jour([sortie], [ctx["propseg"], ctx["facteur"]]):
+        return A_JOUR, ""
+    scale_segmentation_per_slice(ctx["propseg"], sortie, ctx["valeur_facteur"])
+    return EXECUTEE, ""
+
+
+def etape_fusion(ctx, config):
+    """
+    Fusion avec le GT et crop au-dessus de C1 en une seule passe.
+    """
+    sortie = chemin_sortie(config, "fusion", f"{ctx['sujet_contraste']}_fusion_cropped.nii.gz")
+    ctx["fusion"] = sortie
+    if not config["force"] and a_jour([sortie], [ctx["gt"], ctx["seg_corrige"], ctx["label"]]):
+        return A_JOUR, ""
+    if os.path.exists(sortie):
+        os.remove(sortie)
+    message = fusionner_sujet(ctx["sujet_contraste"], ctx["gt"], ctx["seg_corrige"], os.path.dirname(sortie),
+                              config["fusion"]["decalage"], ctx["label"], config["fusion"]["marge_c1"])
+    if not os.path.exists(sortie):
+        raise RuntimeError(message)
+    return EXECUTEE, ""
+
+
+def etape_flux(ctx, config):
+    """
+    Mise à l'échelle, fusion, crop et métriques en mémoire (flux.py) : seul le GT final est écrit.
+    """
+    sortie = chemin_sortie(config, "fusion", f"{ctx['sujet_contraste']}_fusion_cropped.nii.gz")
+    metriques = chemin_sortie(config, "metriques", f"{ctx['sujet_contraste']}.json")
+    ctx["fusion"] = sortie
+    if not config["force"] and a_jour([sortie, metriques], [ctx["propseg"], ctx["facteur"], ctx["gt"], ctx["label"]]):
+        return A_JOUR, ""
+
+    travail = (ctx["sujet_contraste"], ctx["propseg"], ctx["gt"], ctx["label"], ctx["valeur_facteur"])
+    ligne, = traiter_lot([travail], os.path.dirname(sortie), config["fusion"]["decalage"], config["fusion"]["marge_c1"])
+    if ligne["Erreur"] is not None:
+        raise RuntimeError(ligne["Erreur"])
+    ecrire_json(ligne, metriques)
+    return EXECUTEE, f"écart C1 = {ligne['Ecart_C1']}, Dice = {ligne['Dice_GT']}"
+
+
+def etape_qc(ctx, config):
+    """
+    Rapports sct_qc du GT final. Les rapports d'un même dossier QC partagent des fichiers
+    (index.html, fichiers JSON), donc un seul sujet à la fois écrit dans le dossier (verrou).
+    """
+    qc_dir = config["qc"]["dossier"]
+    os.makedirs(os.path.join(qc_dir, ".fait"), exist_ok=True)
+    # Fichier témoin : sa date indique quand le QC du sujet a été généré
+    temoin = os.path.join(qc_dir, ".fait", ctx["sujet_contraste"])
+    if not config["force"] and a_jour([temoin], [ctx["anat"], ctx["fusion"]]):
+        return A_JOUR, ""
+
+    nom = os.path.basename(ctx["fusion"])
+    env = environnement_limite(1)
+    with open(os.path.join(qc_dir, ".verrou"), "w") as verrou:
+        fcntl.flock(verrou, fcntl.LOCK_EX)
+        for processus in ("sct_deepseg_sc", "sct_label_vertebrae"):
+            resultat = subprocess.run(["sct_qc", "-i", ctx["anat"], "-s", ctx["fusion"], "-p", processus,
+                                       "-qc", qc_dir, "-qc-subject", nom],
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+            if resultat.returncode != 0:
+                raise RuntimeError(f"sct_qc -p {processus} a échoué")
+    open(temoin, "w").close()
+    return EXECUTEE, ""
+
+
+# Étapes disponibles, dans l'ordre de la chaîne
+ETAPES = {
+    "ecarts": etape_ecarts,
+    "propseg": etape_propseg,
+    "facteur": etape_facteur,
+    "echelle": etape_echelle,
+    "fusion": etape_fusion,
+    "flux": etape_flux,
+    "qc": etape_qc,
+}
+
+
+def executer_sujet(ctx, config):
+    """
+    Exécute la chaîne d'étapes d'un sujet. La chaîne s'arrête à la première étape en erreur ou
+    qui écarte le sujet.
+    :return: Liste de tuples (sujet_contraste, étape, état, durée en secondes, message)
+    """
+    rapport = []
+    for nom in config["etapes"]:
+        debut = time.monotonic()
+        try:
+            etat, message = ETAPES[nom](ctx, config)
+        except Exception as e:
+            etat, message = ERREUR, str(e)
+        rapport.append((ctx["sujet_contraste"], nom, etat, time.monotonic() - debut, message))
+        if etat in (ARRET, ERREUR):
+            break
+    return rapport
+
+
+def lister_sujets(config):
+    """
+    Construit le contexte de départ de chaque sujet (fichiers d'entrée), à partir des index du
+    dataset. Les sujets dont un fichier d'entrée manque sont ignorés.
+    :return: Liste de dictionnaires
+    """
+    anat_index = obtenir_index(config["dataset"], exclure=("derivatives",))
+    entrees = {cle: (obtenir_index(config[cle]["dossier"]), config[cle]["suffixe"])
+               for cle in ("gt", "labels", "propseg_defaut")}
+
+    sujets = []
+    gt_index, gt_suffixe = entrees["gt"]
+    for (sujet, contraste, suffixe) in gt_index:
+        if suffixe != gt_suffixe or contraste not in config["contrastes"]:
+            continue
+        if config["sujets"] and sujet not in config["sujets"]:
+            continue
+        ctx = {"sujet_contraste": f"{sujet}_{contraste}", "sujet": sujet, "contraste": contraste,
+               "anat": anat_index.get((sujet, contraste, ""))}
+        for cle, nom in (("gt", "gt"), ("labels", "label"), ("propseg_defaut", "propseg_defaut")):
+            index, suffixe_cle = entrees[cle]
+            ctx[nom] = index.get((sujet, contraste, suffixe_cle))
+        manquants = [nom for nom in ("anat", "gt", "label", "propseg_defaut") if ctx[nom] is None]
+        if manquants:
+            print(f"Fichiers manquants pour {ctx['sujet_contraste']} ({', '.join(manquants)}), saut...")
+            continue
+        sujets.append(ctx)
+    return sorted(sujets, key=lambda ctx: ctx["sujet_contraste"])
+
+
+def ecrire_tableaux(config, sujets):
+    """
+    Regroupe les résultats par sujet dans les tableaux habituels : ecarts.csv (format de
+    seg_vs_label.py), facteurs_echelle.csv (format de calcul_facteurs_echelle) et
+    metriques_flux.csv (format de flux.py).
+    """
+    ecarts, facteurs, metriques = [], [], []
+    for ctx in sujets:
+        chemin = os.path.join(config["sortie"], "ecarts", f"{ctx['sujet_contraste']}.json")
+        if os.path.exists(chemin):
+            ecarts.append({"Sujet": trouver_nom_sujet_contraste(ctx["gt"]), **lire_json(chemin)})
+        chemin = os.path.join(config["sortie"], "facteurs", f"{ctx['sujet_contraste']}.json")
+        if os.path.exists(chemin):
+            facteurs.append(lire_json(chemin))
+        chemin = os.path.join(config["sortie"], "metriques", f"{ctx['sujet_contraste']}.json")
+        if os.path.exists(chemin):
+            metriques.append(lire_json(chemin))
+    if ecarts:
+        pd.DataFrame(ecarts, columns=["Sujet", "GT", "propseg"]).to_csv(
+            os.path.join(config["sortie"], "ecarts.csv"), index=False)
+    if facteurs:
+        pd.DataFrame(facteurs, columns=COLONNES).to_csv(
+            os.path.join(config["sortie"], "facteurs_echelle.csv"), index=False)
+    if metriques:
+        pd.DataFrame(metriques, columns=COLONNES_FLUX).to_csv(
+            os.path.join(config["sortie"], "metriques_flux.csv"), index=False)
+
+
+def afficher_rapport(rapport, etapes, duree_totale):
+    """
+    Affiche, pour chaque étape, le nombre de sujets par état et le temps passé.
+    """
+    df = pd.DataFrame(rapport, columns=["Sujet", "Etape", "Etat", "Duree_s", "Message"])
+    print("\n========== Rapport par étape ==========\n")
+    for etape in etapes:
+        groupe = df[df["Etape"] == etape]
+        if groupe.empty:
+            continue
+        etats = groupe["Etat"].value_counts()
+        executees = groupe.loc[groupe["Etat"] == EXECUTEE, "Duree_s"]
+        print(f"{etape:<10} " + ", ".join(f"{etat}: {n}" for etat, n in etats.items())
+              + f" | total {groupe['Duree_s'].sum():.1f} s"
+              + (f", moyenne {executees.mean():.1f} s / sujet exécuté" if len(executees) else ""))
+    for _, ligne in df[df["Etat"] == ERREUR].iterrows():
+        print(f"Erreur pour {ligne['Sujet']} à l'étape {ligne['Etape']} : {ligne['Message']}")
+    print(f"\nDurée totale : {duree_totale:.1f} s")
+    return df
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+
+    config = charger_config(args.c)
+    config["force"] = args.force
+    if args.jobs:
+        config["jobs"] = args.jobs
+    inconnues = [nom for nom in config["etapes"] if nom not in ETAPES]
+    if inconnues:
+        parser.error(f"Étapes inconnues : {', '.join(inconnues)} (disponibles : {', '.join(ETAPES)})")
+    os.makedirs(config["sortie"], exist_ok=True)
+
+    debut = time.monotonic()
+    sujets = lister_sujets(config)
+    print(f"{len(sujets)} sujets à traiter, {config['jobs']} en parallèle")
+
+    rapport = []
+    with ProcessPoolExecutor(max_workers=config["jobs"]) as executor:
+        futures = {executor.submit(executer_sujet, ctx, config): ctx for ctx in sujets}
+        for future in as_completed(futures):
+            ctx = futures[future]
+            try:
+                lignes = future.result()
+            except Exception as e:
+                # Erreur du pool lui-même (ex: processus tué)
+                lignes = [(ctx["sujet_contraste"], "-", ERREUR, np.nan, str(e))]
+            rapport.extend(lignes)
+            dernier = lignes[-1]
+            print(f"{ctx['sujet_contraste']} : {dernier[1]} {dernier[2]}" + (f" ({dernier[4]})" if dernier[4] else ""))
+
+    ecrire_tableaux(config, sujets)
+    df = afficher_rapport(rapport, config["etapes"], time.monotonic() - debut)
+    df.sort_values(["Sujet"], kind="stable").to_csv(os.path.join(config["sortie"], "rapport_etapes.csv"), index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""
+Génération en parallèle et incrémentale des rapports de qualité (QC) des GT finaux.
+
+OBJECTIF :
+----------
+qc_fusion_all.sh lance `sct_qc` deux fois par sujet (`-p sct_deepseg_sc` et
+`-p sct_label_vertebrae`), un sujet après l'autre, et refait tous les rapports à chaque
+exécution. Ce script fait les mêmes rapports, mais :
+  - plusieurs sujets sont traités en même temps (`-jobs`) ;
+  - les sujets dont la segmentation et l'image anatomique n'ont pas changé depuis leur dernier
+    rapport sont sautés : vérifier un nouveau lot ne coûte que les nouveaux sujets.
+
+FONCTIONNEMENT :
+----------------
+1. Les segmentations `*.nii.gz` du dossier `-d_fusion` sont associées à leur image anatomique
+   avec l'index du dataset (voir index_dataset.py).
+2. Un manifeste (`.manifest_qc.json` dans le dossier QC) conserve, pour chaque segmentation, le
+   hash de la segmentation et de l'image anatomique au moment du dernier rapport. Les sujets dont
+   les deux fichiers n'ont pas changé sont sautés (`-force` pour tout refaire).
+3. Chaque sujet est traité dans son propre dossier QC temporaire (dans le dossier QC) : les deux
+   appels à `sct_qc` d'un sujet n'écrivent jamais dans les fichiers partagés du rapport
+   (index.html, dossier _json) en même temps qu'un autre sujet.
+4. Quand un sujet est terminé, son dossier temporaire est fusionné dans le dossier QC sous un
+   verrou (`.verrou`, le même que l'étape qc de pipeline.py) : les fichiers du sujet sont copiés,
+   puis index.html est reconstruit avec les entrées de tous les rapports du dossier `_json`. Pour
+   cela, le tableau JSON des entrées du sujet est cherché dans l'index.html écrit par sct_qc
+   (en comparant les valeurs décodées, quelle que soit leur mise en forme) et remplacé par les
+   entrées de tout le dossier. Si ce tableau n'est pas trouvé (format de SCT différent), les deux
+   sct_qc du sujet sont relancés sous le verrou directement dans le dossier QC, et SCT met
+   lui-même index.html à jour.
+   Le manifeste est mis à jour après chaque sujet, donc une exécution interrompue reprend là où
+   elle s'était arrêtée.
+
+UTILISATION :
+-------------
+    python creer_GT/qc_fusion_all.py \
+        -d_fusion test_2004/output_fusion_cropped_2004 \
+        -qc qc_report_2104 \
+        -jobs 8
+
+ARGUMENTS :
+-----------
+- `-d_fusion` : dossier des segmentations finales (sub-XXX_contraste_fusion_cropped.nii.gz)
+- `-qc`       : dossier du rapport QC
+- `-d_anat`   : (Optionnel) dossier BIDS des images anatomiques (défaut : data-multi-subject)
+- `-jobs`     : (Optionnel) nombre de sujets traités en parallèle (défaut : nombre de coeurs)
+- `-force`    : (Optionnel) refaire les rapports de tous les sujets
+"""
+
+import os
+import glob
+import json
+import fcntl
+import shutil
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache_metadonnees import hash_fichier
+from index_dataset import obtenir_index
+from outils_processus import environnement_limite
+
+MANIFEST_FILE = ".manifest_qc.json"
+PROCESSUS_QC = ("sct_deepseg_sc", "sct_label_vertebrae")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Génère les rapports sct_qc des segmentations en parallèle, en sautant les sujets déjà à jour.")
+    parser.add_argument("-d_fusion", type=str, default="test_2004/output_fusion_cropped_2004", help="Dossier des segmentations finales")
+    parser.add_argument("-qc", type=str, default="qc_report_2104", help="Dossier du rapport QC")
+    parser.add_argument("-d_anat", type=str, default="data-multi-subject", help="Dossier BIDS des images anatomiques")
+    parser.add_argument("-jobs", type=int, default=os.cpu_count(), help="Nombre de sujets traités en parallèle (défaut : nombre de coeurs)")
+    parser.add_argument("-force", action="store_true", help="Refaire les rapports de tous les sujets")
+    return parser
+
+
+def lister_jobs(fusion_dir, anat_dir):
+    """
+    Associe chaque segmentation du dossier à son image anatomique.
+    :return: Liste de tuples (nom de la segmentation, anat_path, seg_path)
+    """
+    anat_index = obtenir_index(anat_dir, exclure=("derivatives",))
+    jobs = []
+    for seg_path in sorted(glob.glob(os.path.join(fusion_dir, "*.nii.gz"))):
+        nom = os.path.basename(seg_path)
+        sujet, contraste = nom.split("_")[:2]
+        anat_path = anat_index.get((sujet, contraste, ""))
+        if anat_path is None:
+            print(f"Image anatomique non trouvée pour {nom}")
+            continue
+        jobs.append((nom, anat_path, seg_path))
+    return jobs
+
+
+def charger_manifest(manifest_path):
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+    return {}
+
+
+def sauver_manifest(manifest, manifest_path):
+    """
+    Écrit le manifeste de façon atomique (fichier temporaire puis renommage).
+    """
+    tmp = f"{manifest_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+
+
+def signature_fichiers(chemins, ancienne=None):
+    """
+    Signature d'un ensemble de fichiers : hash, taille et date de chacun. Le hash d'un fichier
+    n'est pas recalculé si sa taille et sa date sont celles de l'ancienne signature.
+    :return: Dictionnaire {chemin: {hash, taille, mtime_ns}}
+    """
+    ancienne = ancienne or {}
+    signature = {}
+    for chemin in chemins:
+        stat = os.stat(chemin)
+        avant = ancienne.get(chemin, {})
+        if avant.get("taille") == stat.st_size and avant.get("mtime_ns") == stat.st_mtime_ns:
+            hash_contenu = avant["hash"]
+        else:
+            hash_contenu = hash_fichier(chemin)
+        signature[chemin] = {"hash": hash_contenu, "taille": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return signature
+
+
+def meme_contenu(signature, ancienne):
+    """
+    Vérifie que les fichiers d'une signature ont le même contenu que dans l'ancienne signature.
+    """
+    return (ancienne is not None and signature.keys() == ancienne.keys()
+            and all(signature[c]["hash"] == ancienne[c]["hash"] for c in signature))
+
+
+def lancer_sct_qc(nom, anat_path, seg_path, qc_dir):
+    """
+    Lance les deux sct_qc d'un sujet dans un dossier QC.
+    """
+    env = environnement_limite(1)
+    for processus in PROCESSUS_QC:
+        resultat = subprocess.run(["sct_qc", "-i", anat_path, "-s", seg_path, "-p", processus,
+                                   "-qc", qc_dir, "-qc-subject", nom],
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env)
+        if resultat.returncode != 0:
+            raise RuntimeError(f"sct_qc -p {processus} a échoué : {resultat.stderr.strip()[-500:]}")
+
+
+def generer_qc(nom, anat_path, seg_path, qc_dir):
+    """
+    Lance les deux sct_qc d'un sujet dans un dossier QC temporaire.
+    :return: Dossier temporaire contenant le rapport du sujet
+    """
+    tmp_dir = tempfile.mkdtemp(prefix=".qc_", dir=qc_dir)
+    try:
+        lancer_sct_qc(nom, anat_path, seg_path, tmp_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return tmp_dir
+
+
+def lire_entrees(qc_dir):
+    """
+    Lit les entrées des rapports du dossier _json d'un dossier QC (un fichier JSON par rapport,
+    contenant une entrée ou une liste d'entrées).
+    """
+    entrees = []
+    for chemin in sorted(glob.glob(os.path.join(qc_dir, "_json", "*.json"))):
+        with open(chemin) as f:
+            contenu = json.load(f)
+        entrees.extend(contenu if isinstance(contenu, list) else [contenu])
+    return entrees
+
+
+def trouver_entrees(html, entrees):
+    """
+    Cherche dans index.html le tableau JSON contenant exactement les entrées données. Les valeurs
+    décodées sont comparées, donc la mise en forme du JSON (espaces, ordre des clés) n'a pas
+    d'importance.
+    :return: Tuple (début, fin) du tableau dans html, ou None s'il n'est pas trouvé
+    """
+    decodeur = json.JSONDecoder()
+    debut = html.find("[")
+    while debut != -1:
+        try:
+            valeur, fin = decodeur.raw_decode(html, debut)
+        except ValueError:
+            pass
+        else:
+            if valeur == entrees:
+                return debut, fin
+        debut = html.find("[", debut + 1)
+    return None
+
+
+def fusionner_rapport(tmp_dir, qc_dir, job):
+    """
+    Copie le rapport d'un sujet (dossier temporaire) dans le dossier QC et reconstruit index.html
+    avec les entrées de tous les rapports, sous le verrou du dossier QC. Si les entrées du sujet ne
+    sont pas trouvées dans l'index.html du dossier temporaire, les sct_qc du sujet sont relancés
+    directement dans le dossier QC. Le dossier temporaire est supprimé.
+    :param job: Tuple (nom, anat_path, seg_path) du sujet
+    """
+    try:
+        with open(os.path.join(qc_dir, ".verrou"), "w") as verrou:
+            fcntl.flock(verrou, fcntl.LOCK_EX)
+            html, position = "", None
+            modele = os.path.join(tmp_dir, "index.html")
+            if os.path.exists(modele):
+                with open(modele) as f:
+                    html = f.read()
+                position = trouver_entrees(html, lire_entrees(tmp_dir))
+            if position is None:
+                print(f"Entrées du sujet non trouvées dans index.html, sct_qc relancé dans {qc_dir} : {job[0]}")
+                lancer_sct_qc(*job, qc_dir)
+                return
+
+            # index.html contient la liste des entrées des rapports : celui du dossier temporaire ne
+            # contient que celles du sujet, qui sont remplacées par celles de tout le dossier QC
+            shutil.copytree(tmp_dir, qc_dir, dirs_exist_ok=True, ignore=shutil.ignore_patterns("index.html"))
+            debut, fin = position
+            html = html[:debut] + json.dumps(lire_entrees(qc_dir)) + html[fin:]
+            tmp_index = os.path.join(qc_dir, f"index.html.{os.getpid()}.tmp")
+            with open(tmp_index, "w") as f:
+                f.write(html)
+            os.replace(tmp_index, os.path.join(qc_dir, "index.html"))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    os.makedirs(args.qc, exist_ok=True)
+
+    manifest_path = os.path.join(args.qc, MANIFEST_FILE)
+    manifest = charger_manifest(manifest_path)
+
+    a_faire = []
+    for nom, anat_path, seg_path in lister_jobs(args.d_fusion, args.d_anat):
+        signature = signature_fichiers([anat_path, seg_path], manifest.get(nom))
+        if not args.force and meme_contenu(signature, manifest.get(nom)):
+            print(f"À jour, QC sauté : {nom}")
+            continue
+        a_faire.append((nom, anat_path, seg_path, signature))
+
+    print(f"\n{len(a_faire)} rapport(s) QC à générer dans {args.qc}")
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(generer_qc, nom, anat_path, seg_path, args.qc): (nom, anat_path, seg_path, signature)
+                   for nom, anat_path, seg_path, signature in a_faire}
+        for future in as_completed(futures):
+            nom, anat_path, seg_path, signature = futures[future]
+            try:
+                fusionner_rapport(future.result(), args.qc, (nom, anat_path, seg_path))
+            except Exception as e:
+                print(f"Erreur QC pour {nom} : {e}")
+                continue
+            manifest[nom] = signature
+            sauver_manifest(manifest, manifest_path)
+            print(f"QC généré pour {nom}")
+
+    print(f"\n Tous les QC ont été générés dans: {args.qc}")
+
+
+if __name__ == '__main__':
+    main()
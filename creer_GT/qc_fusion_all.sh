@@ -23,7 +23,7 @@
 # ----------------
 # Pour chaque segmentation dans 'fusion_dir' (spécifié par l'utilisateur) :
 #   1. Identifie le sujet (ex: sub-XXX) et le contraste (T1w/T2w).
-#   2. Recherche l’image anatomique correspondante.
+#   2. Recherche l’image anatomique correspondante (index construit une seule fois avec index_dataset.py).
 #   3. Génère deux types de rapports QC avec la commande 'sct_qc' :
 #        - sct_deepseg_sc
 #        - sct_label_vertebrae
@@ -40,17 +40,23 @@
 ###############################################################################
 
 # Dossiers
+script_dir="$(cd "$(dirname "$0")" && pwd)"
 fusion_dir="test_2004/output_fusion_cropped_2004" # Adapt depending on where your segmentations are
 qc_output="qc_report_2104" # Adapt to what you want your output to be
 
 mkdir -p "$qc_output"
 
+# Indexer une seule fois les images anatomiques (voir index_dataset.py)
+declare -A anat_paths
+while IFS=$'\t' read -r s c p; do anat_paths["${s}_${c}"]="$p"; done < <(
+    python3 "$script_dir/index_dataset.py" -d data-multi-subject -exclure derivatives -suffixe "")
+
 # Boucle sur toutes les segmentations fusionnées
 for fusion_seg in "$fusion_dir"/*.nii.gz; do
     subj_name=$(basename "$fusion_seg")  
     sujet=$(echo "$subj_name" | cut -d'_' -f1)         
     contraste=$(echo "$subj_name" | cut -d'_' -f2)       
-    anat_img=$(find data-multi-subject/$sujet/anat -name "${sujet}_${contraste}.nii.gz" | head -n 1)
+    anat_img="${anat_paths[${sujet}_${contraste}]}"
  
     echo -e "\n Traitement de: $subj_name"
 
@@ -0,0 +1,374 @@
+"""
+Rapport QC léger des GT finaux : mosaïques PNG autour de C1 et page HTML de tri, sans SCT.
+
+OBJECTIF :
+----------
+Pour trier rapidement les GT finaux (`*_fusion_cropped.nii.gz`), il suffit de voir une coupe
+sagittale au milieu de la moelle et quelques coupes axiales autour de C1 avec le masque
+superposé. Chaque appel à `sct_qc` coûte le démarrage de SCT et écrit un rapport HTML complet ;
+ce script produit directement les images en Python, en quelques secondes pour des centaines de
+sujets, et une seule page HTML statique qui exporte `qc_flags.json` au format lu par make_yml.py.
+
+FONCTIONNEMENT :
+----------------
+Pour chaque GT final du dossier `-d_fusion` :
+  1. Retrouve l'image anatomique et les labels vertébraux avec l'index du dataset
+     (voir index_dataset.py). La slice de C1 et la boîte englobante du GT viennent du cache de
+     métadonnées (voir cache_metadonnees.py).
+  2. Lit seulement les slices nécessaires de l'image et du GT (indexation du dataobj, voir
+     acces_nifti.py) : la coupe sagittale au centre du GT et les coupes axiales à
+     `DECALAGES_AXIAUX` slices de C1.
+  3. Réoriente les coupes (haut de l'image = supérieur ; coupes axiales en convention
+     radiologique), ajuste le contraste (percentiles 1-99) et superpose le masque en rouge.
+     Le niveau de C1 est marqué en jaune sur la coupe sagittale.
+  4. Écrit `<sujet>_<contraste>_sag.png` et `<sujet>_<contraste>_ax.png` (coupes axiales côte à
+     côte) avec zlib et struct (pas de dépendance à une bibliothèque d'images).
+Les images déjà plus récentes que le GT, l'image anatomique et les labels ne sont pas refaites
+(`-force` pour tout refaire). Les sujets sont traités en parallèle (`-jobs` processus).
+
+La page `index.html` montre les deux images de chaque sujet et un bouton ✅/❌ par sujet (clic ou
+touches f/y/n sur le sujet sélectionné avec les flèches). Les marques sont gardées dans le
+navigateur et le bouton « Exporter » télécharge `qc_flags.json`, avec des clés de la forme :
+    "2025-04-01 07:02:09_sub-barcelona02_T1w.nii.gz_sct_deepseg_sc_qc": "✅"
+(date de génération de l'image), directement utilisable par make_yml.py.
+
+UTILISATION :
+-------------
+    python creer_GT/qc_mosaique.py \
+        -d_fusion test_2004/output_fusion_cropped_2004 \
+        -o qc_mosaique
+
+ARGUMENTS :
+-----------
+- `-d_fusion` : dossier des GT finaux (sub-XXX_contraste_fusion_cropped.nii.gz)
+- `-o`        : dossier de sortie des images et de index.html (défaut : qc_mosaique)
+- `-d_anat`   : (Optionnel) dossier BIDS des images anatomiques (défaut : data-multi-subject)
+- `-d_label`  : (Optionnel) dossier des labels vertébraux (défaut : data-multi-subject/derivatives/labels)
+- `-jobs`     : (Optionnel) nombre de sujets traités en parallèle (défaut : nombre de coeurs)
+- `-force`    : (Optionnel) refaire toutes les images
+"""
+
+import os
+import glob
+import html
+import zlib
+import struct
+import argparse
+import datetime
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from nibabel.orientations import io_orientation, apply_orientation
+from index_dataset import obtenir_index
+from cache_metadonnees import obtenir_metadonnees
+from acces_nifti import charger_nifti
+from outils_nifti import axe_superieur
+
+SUFFIXE_GT = "_fusion_cropped.nii.gz"
+
+# Coupes axiales affichées, en slices par rapport à C1 (négatif = sous C1)
+DECALAGES_AXIAUX = (-10, -5, 0, 5, 10)
+
+# Taille (voxels) de la fenêtre des coupes axiales, centrée sur le GT
+FENETRE_AXIALE = 48
+
+COULEUR_MASQUE = np.array([255, 0, 0], dtype=np.float32)
+OPACITE_MASQUE = 0.4
+COULEUR_C1 = np.array([255, 220, 0], dtype=np.uint8)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Génère des mosaïques PNG autour de C1 et une page HTML de tri des GT finaux, sans SCT.")
+    parser.add_argument("-d_fusion", type=str, required=True, help="Dossier des GT finaux")
+    parser.add_argument("-o", type=str, default="qc_mosaique", help="Dossier de sortie des images et de index.html")
+    parser.add_argument("-d_anat", type=str, default="data-multi-subject", help="Dossier BIDS des images anatomiques")
+    parser.add_argument("-d_label", type=str, default="data-multi-subject/derivatives/labels", help="Dossier des labels vertébraux")
+    parser.add_argument("-jobs", type=int, default=os.cpu_count(), help="Nombre de sujets traités en parallèle (défaut : nombre de coeurs)")
+    parser.add_argument("-force", action="store_true", help="Refaire toutes les images")
+    return parser
+
+
+def ecrire_png(chemin, rgb):
+    """
+    Écrit une image RGB uint8 (hauteur, largeur, 3) en PNG, avec zlib et struct seulement.
+    """
+    def bloc(type_bloc, donnees):
+        return (struct.pack(">I", len(donnees)) + type_bloc + donnees
+                + struct.pack(">I", zlib.crc32(type_bloc + donnees) & 0xFFFFFFFF))
+
+    hauteur, largeur = rgb.shape[:2]
+    # Chaque ligne commence par l'octet de filtre (0 : aucun filtre)
+    lignes = np.concatenate([np.zeros((hauteur, 1), dtype=np.uint8),
+                             np.ascontiguousarray(rgb, dtype=np.uint8).reshape(hauteur, largeur * 3)], axis=1)
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(bloc(b"IHDR", struct.pack(">IIBBBBB", largeur, hauteur, 8, 2, 0, 0, 0)))
+        f.write(bloc(b"IDAT", zlib.compress(lignes.tobytes(), 6)))
+        f.write(bloc(b"IEND", b""))
+    os.replace(tmp, chemin)
+
+
+def lire_plan_ras(img, ornt, axe, indice):
+    """
+    Lit une seule slice d'une image le long d'un axe voxel et la réoriente en RAS.
+    :return: Tableau 3D en RAS dont l'axe correspondant à `axe` est de taille 1
+    """
+    slicer = [slice(None)] * 3
+    slicer[axe] = slice(indice, indice + 1)
+    return apply_orientation(np.asanyarray(img.dataobj[tuple(slicer)]), ornt)
+
+
+def normaliser(plan):
+    """
+    Ramène les intensités d'une coupe entre 0 et 255 (percentiles 1 et 99).
+    """
+    plan = plan.astype(np.float32)
+    bas, haut = np.percentile(plan, (1, 99))
+    return np.clip((plan - bas) / max(haut - bas, 1e-6) * 255, 0, 255)
+
+
+def superposer(anat, masque, facteurs=(1, 1)):
+    """
+    Superpose un masque en rouge sur une coupe en niveaux de gris et agrandit le résultat (plus
+    proche voisin) pour des voxels non carrés.
+    :param facteurs: Répétition des lignes et des colonnes
+    :return: Image RGB uint8
+    """
+    rgb = np.repeat(normaliser(anat)[..., None], 3, axis=2)
+    rgb[masque > 0] = (1 - OPACITE_MASQUE) * rgb[masque > 0] + OPACITE_MASQUE * COULEUR_MASQUE
+    rgb = np.repeat(np.repeat(rgb, facteurs[0], axis=0), facteurs[1], axis=1)
+    return rgb.astype(np.uint8)
+
+
+def facteurs_affichage(zooms_lignes, zooms_colonnes):
+    """
+    Répétitions des lignes et des colonnes pour afficher des voxels à peu près carrés.
+    """
+    plus_petit = min(zooms_lignes, zooms_colonnes)
+    return max(1, round(zooms_lignes / plus_petit)), max(1, round(zooms_colonnes / plus_petit))
+
+
+def generer_images(nom, anat_path, seg_path, label_path, output_dir):
+    """
+    Écrit la coupe sagittale et la mosaïque axiale d'un sujet.
+    :return: Tuple (chemin de la coupe sagittale, chemin de la mosaïque axiale)
+    """
+    img_anat, img_seg = charger_nifti(anat_path), charger_nifti(seg_path)
+    if img_anat.shape[:3] != img_seg.shape[:3]:
+        raise ValueError(f"Dimensions différentes : image={img_anat.shape}, GT={img_seg.shape}")
+    ornt = io_orientation(img_anat.affine)
+    axes = {int(monde): voxel for voxel, (monde, _) in enumerate(ornt)}
+    zooms = img_anat.header.get_zooms()[:3]
+    zooms_ras = [zooms[axes[monde]] for monde in range(3)]
+    forme_ras = [img_anat.shape[axes[monde]] for monde in range(3)]
+
+    boite = obtenir_metadonnees(seg_path, ["boite"])["boite"]
+    if boite is None:
+        raise ValueError("GT vide")
+    z_c1 = obtenir_metadonnees(label_path, ["z_max_ras"])["z_max_ras"]
+    if z_c1 is None:
+        raise ValueError("C1 introuvable")
+    axe_z, vers_le_haut = axe_superieur(img_anat)
+
+    # Coupe sagittale au centre du GT (axe gauche-droite), haut de l'image = supérieur
+    axe_x = axes[0]
+    x = (boite[axe_x][0] + boite[axe_x][1] - 1) // 2
+    anat = lire_plan_ras(img_anat, ornt, axe_x, x)[0].T[::-1]
+    masque = lire_plan_ras(img_seg, ornt, axe_x, x)[0].T[::-1]
+    facteurs = facteurs_affichage(zooms_ras[2], zooms_ras[1])
+    sagittale = superposer(anat, masque, facteurs)
+    ligne_c1 = (forme_ras[2] - 1 - z_c1) * facteurs[0]
+    sagittale[ligne_c1:ligne_c1 + facteurs[0], ::2] = COULEUR_C1
+
+    # Coupes axiales autour de C1, centrées sur le GT (convention radiologique : droite du
+    # patient à gauche, antérieur en haut)
+    centre = [(boite[axes[m]][0] + boite[axes[m]][1]) // 2 for m in range(2)]
+    if ornt[axes[0], 1] < 0:
+        centre[0] = forme_ras[0] - 1 - centre[0]
+    if ornt[axes[1], 1] < 0:
+        centre[1] = forme_ras[1] - 1 - centre[1]
+    fenetres = [slice(max(0, c - FENETRE_AXIALE // 2), min(n, c + FENETRE_AXIALE // 2))
+                for c, n in zip(centre, forme_ras[:2])]
+    facteurs = facteurs_affichage(zooms_ras[1], zooms_ras[0])
+    coupes = []
+    for decalage in DECALAGES_AXIAUX:
+        z = min(max(z_c1 + decalage, 0), forme_ras[2] - 1)
+        indice = z if vers_le_haut else img_anat.shape[axe_z] - 1 - z
+        anat = lire_plan_ras(img_anat, ornt, axe_z, indice)[fenetres[0], fenetres[1], 0].T[::-1, ::-1]
+        masque = lire_plan_ras(img_seg, ornt, axe_z, indice)[fenetres[0], fenetres[1], 0].T[::-1, ::-1]
+        coupes.append(superposer(anat, masque, facteurs))
+    # Séparation blanche de 2 pixels entre les coupes
+    separation = np.full((coupes[0].shape[0], 2, 3), 255, dtype=np.uint8)
+    axiale = np.concatenate([c for coupe in coupes for c in (coupe, separation)][:-1], axis=1)
+
+    chemin_sag = os.path.join(output_dir, f"{nom}_sag.png")
+    chemin_ax = os.path.join(output_dir, f"{nom}_ax.png")
+    ecrire_png(chemin_sag, sagittale)
+    ecrire_png(chemin_ax, axiale)
+    return chemin_sag, chemin_ax
+
+
+def a_jour(sorties, entrees):
+    """
+    Vrai si toutes les sorties existent et sont plus récentes que toutes les entrées.
+    """
+    if not all(os.path.exists(s) for s in sorties):
+        return False
+    return min(os.path.getmtime(s) for s in sorties) >= max(os.path.getmtime(e) for e in entrees)
+
+
+def traiter_sujet(nom, anat_path, seg_path, label_path, output_dir, force=False):
+    """
+    Génère les images d'un sujet si elles ne sont pas à jour.
+    :return: Tuple (nom, message d'erreur ou None)
+    """
+    sorties = [os.path.join(output_dir, f"{nom}_{vue}.png") for vue in ("sag", "ax")]
+    if not force and a_jour(sorties, [anat_path, seg_path, label_path]):
+        return nom, None
+    try:
+        generer_images(nom, anat_path, seg_path, label_path, output_dir)
+    except Exception as e:
+        return nom, str(e)
+    return nom, None
+
+
+def lister_sujets(fusion_dir, anat_dir, label_dir):
+    """
+    Associe chaque GT final à son image anatomique et à ses labels.
+    :return: Liste de tuples (sujet_contraste, anat_path, seg_path, label_path)
+    """
+    anat_index = obtenir_index(anat_dir, exclure=("derivatives",))
+    label_index = obtenir_index(label_dir)
+    sujets = []
+    for seg_path in sorted(glob.glob(os.path.join(fusion_dir, f"*{SUFFIXE_GT}"))):
+        nom = os.path.basename(seg_path)[:-len(SUFFIXE_GT)]
+        sujet, contraste = nom.split("_")[:2]
+        anat_path = anat_index.get((sujet, contraste, ""))
+        label_path = label_index.get((sujet, contraste, "label-discs_dlabel"))
+        if anat_path is None or label_path is None:
+            print(f"Image anatomique ou labels manquants pour {nom}")
+            continue
+        sujets.append((nom, anat_path, seg_path, label_path))
+    return sujets
+
+
+PAGE_HTML = """<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<title>QC des GT finaux</title>
+<style>
+body {{ font-family: sans-serif; background: #222; color: #eee; }}
+.sujet {{ display: flex; align-items: center; gap: 12px; padding: 6px; border-bottom: 1px solid #444; }}
+.sujet.actif {{ background: #335; }}
+.sujet img {{ image-rendering: pixelated; height: 240px; }}
+.nom {{ width: 220px; }}
+.flag {{ font-size: 28px; width: 48px; cursor: pointer; background: none; border: 1px solid #666; color: #eee; }}
+</style>
+</head>
+<body>
+<p>Clic sur le bouton ou touches f / y / n (flèches haut/bas pour changer de sujet).
+<button id="exporter">Exporter qc_flags.json</button></p>
+{lignes}
+<script>
+const CLE_STOCKAGE = "qc_mosaique_flags";
+const MARQUES = ["", "\\u2705", "\\u274c"];
+const flags = JSON.parse(localStorage.getItem(CLE_STOCKAGE) || "{{}}");
+const sujets = Array.from(document.querySelectorAll(".sujet"));
+let actif = 0;
+function afficher(div) {{ div.querySelector(".flag").textContent = flags[div.dataset.cle] || ""; }}
+function marquer(div, marque) {{
+  if (marque) {{ flags[div.dataset.cle] = marque; }} else {{ delete flags[div.dataset.cle]; }}
+  localStorage.setItem(CLE_STOCKAGE, JSON.stringify(flags));
+  afficher(div);
+}}
+function activer(i) {{
+  sujets[actif].classList.remove("actif");
+  actif = Math.max(0, Math.min(sujets.length - 1, i));
+  sujets[actif].classList.add("actif");
+  sujets[actif].scrollIntoView({{block: "nearest"}});
+}}
+sujets.forEach((div, i) => {{
+  afficher(div);
+  div.querySelector(".flag").addEventListener("click", () => {{
+    activer(i);
+    marquer(div, MARQUES[(MARQUES.indexOf(flags[div.dataset.cle] || "") + 1) % MARQUES.length]);
+  }});
+}});
+document.addEventListener("keydown", (e) => {{
+  if (!sujets.length) return;
+  if (e.key === "ArrowDown") {{ activer(actif + 1); e.preventDefault(); }}
+  else if (e.key === "ArrowUp") {{ activer(actif - 1); e.preventDefault(); }}
+  else if (e.key === "y") {{ marquer(sujets[actif], MARQUES[1]); activer(actif + 1); }}
+  else if (e.key === "n") {{ marquer(sujets[actif], MARQUES[2]); activer(actif + 1); }}
+  else if (e.key === "f") {{
+    const div = sujets[actif];
+    marquer(div, MARQUES[(MARQUES.indexOf(flags[div.dataset.cle] || "") + 1) % MARQUES.length]);
+  }}
+}});
+document.getElementById("exporter").addEventListener("click", () => {{
+  const cles = new Set(sujets.map((div) => div.dataset.cle));
+  const sortie = Object.fromEntries(Object.entries(flags).filter(([cle]) => cles.has(cle)));
+  const lien = document.createElement("a");
+  lien.href = URL.createObjectURL(new Blob([JSON.stringify(sortie, null, 2)], {{type: "application/json"}}));
+  lien.download = "qc_flags.json";
+  lien.click();
+}});
+if (sujets.length) activer(0);
+</script>
+</body>
+</html>
+"""
+
+
+def cle_flag(nom, chemin_image):
+    """
+    Clé de qc_flags.json pour un sujet, au format lu par make_yml.py :
+    "<date>_<sujet>_<contraste>.nii.gz_sct_deepseg_sc_qc" (date de génération de l'image).
+    """
+    date = datetime.datetime.fromtimestamp(os.path.getmtime(chemin_image)).strftime("%Y-%m-%d %H:%M:%S")
+    sujet, contraste = nom.split("_")[:2]
+    return f"{date}_{sujet}_{contraste}.nii.gz_sct_deepseg_sc_qc"
+
+
+def ecrire_index(noms, output_dir):
+    """
+    Écrit la page index.html listant les images de tous les sujets.
+    """
+    lignes = []
+    for nom in noms:
+        sag, ax = f"{nom}_sag.png", f"{nom}_ax.png"
+        cle = cle_flag(nom, os.path.join(output_dir, sag))
+        lignes.append(
+            f'<div class="sujet" data-cle="{html.escape(cle)}">'
+            f'<button class="flag"></button><span class="nom">{html.escape(nom)}</span>'
+            f'<img src="{html.escape(sag)}" alt="sagittale"><img src="{html.escape(ax)}" alt="axiales"></div>')
+    chemin = os.path.join(output_dir, "index.html")
+    with open(chemin, "w", encoding="utf-8") as f:
+        f.write(PAGE_HTML.format(lignes="\n".join(lignes)))
+    return chemin
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    os.makedirs(args.o, exist_ok=True)
+
+    sujets = lister_sujets(args.d_fusion, args.d_anat, args.d_label)
+    noms = []
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(traiter_sujet, *sujet, args.o, args.force) for sujet in sujets]
+        for future in futures:
+            nom, erreur = future.result()
+            if erreur:
+                print(f"Erreur pour {nom} : {erreur}")
+            else:
+                noms.append(nom)
+
+    chemin = ecrire_index(noms, args.o)
+    print(f"\n {len(noms)} sujet(s) dans {chemin}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Base de résultats SQLite (format long) pour les écarts calculés par seg_vs_label.py.
+
+OBJECTIF :
+----------
+seg_vs_label.py ajoutait chaque méthode comme une colonne du CSV de sortie : tout le fichier était
+relu, fusionné sur "Sujet" puis réécrit, une méthode déjà présente ne pouvait pas être mise à
+jour, et deux exécutions lancées en même temps (méthodes différentes) écrasaient les résultats
+l'une de l'autre. Ce module conserve les résultats dans une base SQLite, une ligne par
+(sujet, contraste, méthode, run) :
+  - l'enregistrement d'une méthode remplace seulement ses propres lignes (« upsert »), dans une
+    seule transaction ;
+  - la base est en mode WAL : plusieurs processus peuvent écrire et lire en même temps ;
+  - le CSV large lu par analyse_seg_vs_label.py (colonnes "Sujet" puis une colonne par méthode,
+    ex: "sub-amu01T1w", GT, propseg) est produit à partir de la base (`exporter_large`).
+
+STRUCTURE DE LA TABLE `resultats` :
+-----------------------------------
+- `sujet`, `contraste` : ex: sub-amu01, T1w
+- `methode`            : nom de la méthode (ex: GT, propseg)
+- `run`                : identifiant libre d'une exécution (vide par défaut) ; permet de garder
+                         plusieurs versions d'une même méthode
+- `valeur`             : écart en slices (NULL si non calculable, "N/A" dans le CSV)
+- `date`               : date de la dernière écriture de la ligne
+Clé primaire : (sujet, contraste, methode, run). À l'export, si une méthode a plusieurs runs, la
+valeur la plus récente est gardée (sauf si un run est demandé).
+
+UTILISATION :
+-------------
+Depuis seg_vs_label.py, avec l'option `-db resultats.sqlite` (le CSV large est alors réécrit à
+partir de la base après chaque exécution).
+
+En ligne de commande :
+
+    # Importer un ancien CSV large dans la base
+    python creer_GT/resultats.py -db resultats.sqlite -importer test_propseg_modifie_2004.csv
+
+    # Exporter la base au format large lu par analyse_seg_vs_label.py
+    python creer_GT/resultats.py -db resultats.sqlite -exporter test_propseg_modifie_2004.csv
+
+ARGUMENTS :
+-----------
+- `-db`       : fichier de la base SQLite (créée au besoin)
+- `-importer` : (Optionnel) CSV large (Sujet + une colonne par méthode) à ajouter à la base
+- `-exporter` : (Optionnel) CSV large à écrire à partir de la base
+- `-run`      : (Optionnel) run utilisé pour l'import, ou seul run exporté
+"""
+
+import os
+import re
+import sqlite3
+import argparse
+import datetime
+import pandas as pd
+
+COLONNES_LONG = ["sujet", "contraste", "methode", "run", "valeur"]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Importe ou exporte les résultats de seg_vs_label.py entre la base SQLite et le CSV large.")
+    parser.add_argument("-db", type=str, required=True, help="Fichier de la base SQLite")
+    parser.add_argument("-importer", type=str, default=None, help="CSV large à ajouter à la base")
+    parser.add_argument("-exporter", type=str, default=None, help="CSV large à écrire à partir de la base")
+    parser.add_argument("-run", type=str, default=None, help="Run utilisé pour l'import, ou seul run exporté")
+    return parser
+
+
+def ouvrir_base(chemin_db):
+    """
+    Ouvre (et crée au besoin) la base de résultats, en mode WAL.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(chemin_db)), exist_ok=True)
+    con = sqlite3.connect(chemin_db, timeout=60)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS resultats ("
+        " sujet TEXT NOT NULL, contraste TEXT NOT NULL, methode TEXT NOT NULL, run TEXT NOT NULL DEFAULT '',"
+        " valeur REAL, date TEXT NOT NULL,"
+        " PRIMARY KEY (sujet, contraste, methode, run))"
+    )
+    return con
+
+
+def separer_sujet_contraste(sujet_contraste):
+    """
+    Sépare un nom comme "sub-amu01T1w" (colonne Sujet de seg_vs_label.py) en ("sub-amu01", "T1w").
+    :return: Tuple (sujet, contraste), ou None si le nom ne suit pas ce format
+    """
+    match = re.fullmatch(r"(sub-[a-zA-Z0-9]+?)_?(T[12]w)", str(sujet_contraste))
+    return (match.group(1), match.group(2)) if match else None
+
+
+def valeur_numerique(valeur):
+    """
+    Convertit une valeur du CSV ou de seg_vs_label.py ("N/A", NaN, nombre) en float ou None.
+    """
+    valeur = pd.to_numeric(valeur, errors="coerce")
+    return None if pd.isna(valeur) else float(valeur)
+
+
+def enregistrer(chemin_db, lignes, run=""):
+    """
+    Ajoute ou remplace des résultats dans la base, dans une seule transaction.
+    :param lignes: Itérable de tuples (sujet, contraste, methode, valeur)
+    :return: Nombre de lignes écrites
+    """
+    date = datetime.datetime.now().isoformat(timespec="seconds")
+    lignes = [(sujet, contraste, methode, run or "", valeur_numerique(valeur), date)
+              for sujet, contraste, methode, valeur in lignes]
+    con = ouvrir_base(chemin_db)
+    try:
+        with con:
+            con.executemany(
+                "INSERT INTO resultats (sujet, contraste, methode, run, valeur, date) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (sujet, contraste, methode, run) DO UPDATE SET valeur = excluded.valeur, date = excluded.date",
+                lignes)
+    finally:
+        con.close()
+    return len(lignes)
+
+
+def enregistrer_resultats(chemin_db, resultats, methode, run=""):
+    """
+    Enregistre les résultats de seg_vs_label.py (dictionnaires {"Sujet": ..., methode: écart}).
+    Les sujets dont le nom ne contient pas le contraste sont ignorés.
+    :return: Nombre de lignes écrites
+    """
+    lignes = []
+    for resultat in resultats:
+        sujet_contraste = separer_sujet_contraste(resultat["Sujet"])
+        if sujet_contraste is None:
+            print(f"Nom de sujet inattendu, résultat ignoré : {resultat['Sujet']}")
+            continue
+        lignes.append((*sujet_contraste, methode, resultat.get(methode)))
+    return enregistrer(chemin_db, lignes, run)
+
+
+def lire_long(chemin_db, methodes=None, run=None):
+    """
+    Lit les résultats de la base au format long.
+    :param methodes: Méthodes à lire (toutes par défaut)
+    :param run: Seul run à lire ; par défaut, la valeur la plus récente de chaque
+                (sujet, contraste, méthode) est gardée
+    :return: DataFrame (sujet, contraste, methode, run, valeur)
+    """
+    con = ouvrir_base(chemin_db)
+    try:
+        df = pd.read_sql_query("SELECT sujet, contraste, methode, run, valeur, date FROM resultats", con)
+    finally:
+        con.close()
+    if methodes is not None:
+        df = df[df["methode"].isin(methodes)]
+    if run is not None:
+        df = df[df["run"] == run]
+    df = df.sort_values("date").drop_duplicates(["sujet", "contraste", "methode"], keep="last")
+    return df[COLONNES_LONG].sort_values(["sujet", "contraste", "methode"]).reset_index(drop=True)
+
+
+def vers_large(df_long):
+    """
+    Convertit des résultats au format long en tableau large : "Sujet" (ex: sub-amu01T1w) puis une
+    colonne par méthode, les méthodes par ordre alphabétique (l'ordre d'ajout des méthodes n'est
+    pas conservé dans la base ; analyse_seg_vs_label.py lit les colonnes par leur nom).
+    """
+    if df_long.empty:
+        return pd.DataFrame(columns=["Sujet"])
+    df = df_long.assign(Sujet=df_long["sujet"] + df_long["contraste"])
+    methodes = sorted(df["methode"].unique())
+    large = df.pivot(index="Sujet", columns="methode", values="valeur")[methodes]
+    large.columns.name = None
+    # Les écarts sont des nombres de slices : les écrire sans décimales comme seg_vs_label.py
+    for methode in methodes:
+        valeurs = large[methode].dropna()
+        if (valeurs == valeurs.round()).all():
+            large[methode] = large[methode].astype("Int64")
+    return large.reset_index().sort_values("Sujet")
+
+
+def depuis_large(df_large, run=""):
+    """
+    Convertit un tableau large (Sujet + une colonne par méthode) au format long.
+    Les sujets dont le nom ne contient pas le contraste sont ignorés.
+    :return: DataFrame (sujet, contraste, methode, run, valeur)
+    """
+    lignes = []
+    for _, row in df_large.iterrows():
+        sujet_contraste = separer_sujet_contraste(row["Sujet"])
+        if sujet_contraste is None:
+            continue
+        for methode in df_large.columns.drop("Sujet"):
+            lignes.append((*sujet_contraste, methode, run or "", valeur_numerique(row[methode])))
+    return pd.DataFrame(lignes, columns=COLONNES_LONG)
+
+
+def exporter_large(chemin_db, chemin_csv, run=None):
+    """
+    Écrit le CSV large lu par analyse_seg_vs_label.py à partir de la base. La lecture et
+    l'écriture se font sous le verrou d'écriture de la base, et le CSV est remplacé de façon
+    atomique : deux exports simultanés ne peuvent pas écrire un CSV incomplet.
+    """
+    con = ouvrir_base(chemin_db)
+    try:
+        con.execute("BEGIN IMMEDIATE")
+        large = vers_large(lire_long(chemin_db, run=run))
+        tmp = f"{chemin_csv}.{os.getpid()}.tmp"
+        large.to_csv(tmp, index=False, na_rep="N/A")
+        os.replace(tmp, chemin_csv)
+        con.rollback()
+    finally:
+        con.close()
+    return large
+
+
+def main():
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.importer:
+        df_long = depuis_large(pd.read_csv(args.importer), args.run or "")
+        n = enregistrer(args.db, df_long[["sujet", "contraste", "methode", "valeur"]].itertuples(index=False),
+                        args.run or "")
+        print(f"{n} résultats importés de {args.importer} dans {args.db}")
+    if args.exporter:
+        large = exporter_large(args.db, args.exporter, args.run)
+        print(f"{len(large)} sujets exportés dans {args.exporter}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,10 +16,13 @@ haut que le label de C1).
 FONCTIONNEMENT :
 ----------------
 1. Recherche des fichiers NIfTI de segmentation et de labels dans des dossiers
-   distincts selon deux regex définis par l’utilisateur.
+   distincts selon deux regex définis par l’utilisateur (à partir de l'index du dataset,
+   voir index_dataset.py).
 2. Appariement automatique des fichiers en fonction du nom sujet_contraste (ex: sub-amu01_T1w).
-3. Réorientation éventuelle des images/segmentations selon l'orientation (RAS).
-4. Calcul de l'écart entre le haut de la segmentation et le label le plus haut.
+3. Prise en compte de l'orientation (RAS) à partir de la matrice affine, sans réorienter les images.
+4. Calcul de l'écart entre le haut de la segmentation et le label le plus haut. Les données sont
+   lues dans leur type natif, par blocs de tranches en partant du haut (voir outils_nifti.py), et
+   le résultat est conservé dans le cache de métadonnées (voir cache_metadonnees.py).
 5. Export des résultats dans un fichier CSV dont le nom peut être modifié par l'utilisateur,
    avec une colonne par méthode de segmentation. Si le fichier existe déjà, le script vérifie si la
    colonne existe déjà. Si c'est le cas, rien n'est modifié, un message s'affiche précisant que la 
@@ -48,7 +51,8 @@ Exemple d'utilisation pour comparer la segmentation ground truth de contrast-agn
 Les sections qui peuvent être modifiées par l'utilisateur sont précisées dans le script.
 
 À partir du chemin spécifié pour les segmentations (-d_seg) ou pour les labels (-d_label), 
-le script recherche les fichiers .nii.gz correspondant au regex donné dans tous les sous-dossiers, 
+le script recherche les fichiers .nii.gz (ou .msk, voir masque_compact.py) correspondant au regex 
+donné dans tous les sous-dossiers, 
 en supposant que ceux-ci sont organisés selon la structure suivante :
 
 d_seg/
@@ -71,6 +75,14 @@ ARGUMENTS :
 - `-d_seg`              : chemin vers le dossier contenant les segmentations
 - `-d_label`            : chemin vers le dossier contenant les labels
 - `-seg_method`         : nom de la méthode de segmentation (ajouté comme nom de colonne dans le CSV)
+- `-jobs`               : (Optionnel) nombre de processus pour traiter les paires en parallèle (défaut : 1).
+                          Les résultats sont récupérés dans l'ordre des sujets et une erreur sur une
+                          paire n'interrompt pas le traitement des autres.
+- `-db`                 : (Optionnel) base SQLite des résultats (voir resultats.py). Les écarts y sont
+                          ajoutés ou mis à jour pour la méthode (plusieurs exécutions peuvent écrire
+                          en même temps), puis le CSV de sortie est réécrit à partir de la base.
+                          Une méthode déjà présente est alors mise à jour au lieu d'être ignorée.
+- `-run`                : (Optionnel) avec `-db`, identifiant de l'exécution (défaut : vide)
 
 AUTEUR :
 --------
@@ -80,13 +92,13 @@ Date : Avril 2025
 """
 
 import os
-import glob
 import re
 import pandas as pd
-import nibabel as nib
-import numpy as np
 import argparse
-from nibabel.orientations import aff2axcodes, axcodes2ornt, ornt_transform
+from concurrent.futures import ProcessPoolExecutor
+from cache_metadonnees import obtenir_metadonnees
+from index_dataset import lister_fichiers
+from resultats import enregistrer_resultats, exporter_large
 
 CSV_FILE = "test_propseg_modifie_2004.csv" # Adapter dépendemment du nom du fichier csv de sortie désiré.
 
@@ -98,6 +110,9 @@ def get_parser():
     parser.add_argument("-d_seg", type=str, help="Dossier contenant les fichiers de segmentation à analyser")
     parser.add_argument("-d_label", type=str, help="Dossier contenant les fichiers de labels à analyser")
     parser.add_argument("-seg_method", type=str, help="Nom de la méthode de segmentation utilisée")
+    parser.add_argument("-jobs", type=int, default=1, help="Nombre de processus pour traiter les paires en parallèle (défaut : 1)")
+    parser.add_argument("-db", type=str, default=None, help="Base SQLite des résultats (voir resultats.py)")
+    parser.add_argument("-run", type=str, default="", help="Avec -db, identifiant de l'exécution (défaut : vide)")
     return parser
 
 
@@ -105,33 +120,20 @@ def get_parser():
 def find_files(directory, regex_pattern):
     """
     Trouve les fichiers correspondant à une expression régulière dans un dossier.
+    Les fichiers sont pris dans l'index du dataset (voir index_dataset.py) : l'arbre n'est
+    parcouru qu'une fois et l'index est réutilisé tant que les dossiers ne changent pas. Comme
+    avec glob, tous les fichiers de <sujet>/anat sont considérés, quel que soit leur nom.
     """
-    all_files = glob.glob(os.path.join(directory, "*", "anat", "*.nii.gz"), recursive=True)
+    all_files = []
+    for f in lister_fichiers(directory):
+        parties = os.path.relpath(f, directory).split(os.sep)
+        if len(parties) == 3 and parties[1] == "anat" and f.endswith((".nii.gz", ".msk")):
+            all_files.append(f)
     matched_files = [f for f in all_files if re.search(regex_pattern, f) and "centerline" not in f]
     return matched_files
 
 
 
-def check_and_reorient(img, desired_orientation=('R', 'A', 'S')):
-    """
-    Vérifie et réoriente une image NIfTI selon l'orientation désirée.
-    :param img: Image NIfTI chargée avec nibabel
-    :param desired_orientation: Tuple définissant l'orientation cible (ex: ('R', 'A', 'S'))
-    :return: Image potentiellement réorientée
-    """
-    current_orientation = aff2axcodes(img.affine)  # Obtenir l'orientation actuelle
-    if current_orientation != desired_orientation:
-        # Calculer la transformation d'orientation
-        ornt_transform_matrix = ornt_transform(axcodes2ornt(current_orientation), axcodes2ornt(desired_orientation))
-        
-        # Appliquer la transformation
-        reoriented_img = img.as_reoriented(ornt_transform_matrix)
-        return reoriented_img
-    else:
-        return img
-
-
-
 def trouver_nom_sujet_contraste(file_path):
     """
     Trouve le nom du sujet et le contraste (T1w ou T2w) à partir du nom du fichier.
@@ -148,40 +150,24 @@ def process_segmentation(seg_file, label_file, methode):
     """
     Calcule l'écart entre la segmentation et le label.
     """
-    # Charger les images NIfTI
-    seg_img = nib.load(seg_file)
-    label_img = nib.load(label_file)
-
-    # Vérifier et corriger l'orientation de l'image si nécessaire
-    seg_img = check_and_reorient(seg_img)
-    label_img = check_and_reorient(label_img)
+    # Trouver la coordonnée Z (RAS) maximale où il y a un label (excluant le fond = 0).
+    # La valeur provient du cache de métadonnées si le fichier n'a pas changé.
+    max_z_label = obtenir_metadonnees(label_file, ["z_max_ras"])["z_max_ras"]
 
-    # Convertir en tableaux numpy
-    seg_data = seg_img.get_fdata()
-    label_data = label_img.get_fdata()
-
-    # Trouver les indices des labels (excluant le fond = 0)
-    label_indices = np.where(label_data != 0)[2]
-    
-    if label_indices.size == 0:
+    if max_z_label is None:
         return {
             "Sujet": trouver_nom_sujet_contraste(seg_file),
             methode: "N/A"
         }
-    
-    # Trouver la coordonnée Z maximale où il y a un label
-    max_z_label = np.max(label_indices)
 
     # Vérifier les limites de la segmentation
-    seg_indices = np.where(seg_data > 0)[2]
-    
-    if seg_indices.size == 0:
+    max_z_seg = obtenir_metadonnees(seg_file, ["z_max_ras"])["z_max_ras"]
+
+    if max_z_seg is None:
         return {
             "Sujet": trouver_nom_sujet_contraste(seg_file),
             methode: "N/A"
         }
-    
-    max_z_seg = np.max(seg_indices)
 
     # Calculer l'écart entre le label le plus haut et la limite supérieure de la segmentation
     ecart = max_z_seg - max_z_label
@@ -192,6 +178,53 @@ def process_segmentation(seg_file, label_file, methode):
     }
 
 
+def traiter_paire(seg_file, label_file, methode):
+    """
+    Applique process_segmentation sur une paire en isolant les erreurs : une paire qui échoue
+    donne "N/A" au lieu d'interrompre le traitement des autres sujets.
+    """
+    try:
+        return process_segmentation(seg_file, label_file, methode)
+    except Exception as e:
+        print(f"Erreur lors du traitement de {seg_file} : {e}")
+        return {
+            "Sujet": trouver_nom_sujet_contraste(seg_file),
+            methode: "N/A"
+        }
+
+
+
+def traiter_paires(paired_files, methode, jobs=1):
+    """
+    Traite toutes les paires (segmentation, label), en série ou dans un pool de processus.
+    Les résultats sont produits au fur et à mesure, dans l'ordre de paired_files.
+    :param paired_files: Liste de tuples (fichier de segmentation, fichier de labels)
+    :param methode: Nom de la méthode de segmentation
+    :param jobs: Nombre de processus à utiliser
+    """
+    if jobs <= 1:
+        for seg_file, label_file in paired_files:
+            print(f"Traitement : {seg_file} et {label_file}")
+            yield traiter_paire(seg_file, label_file, methode)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(traiter_paire, seg_file, label_file, methode)
+                   for seg_file, label_file in paired_files]
+        for (seg_file, label_file), future in zip(paired_files, futures):
+            print(f"Traitement : {seg_file} et {label_file}")
+            try:
+                yield future.result()
+            except Exception as e:
+                # Erreur du pool lui-même (ex: processus tué), pas de process_segmentation
+                print(f"Erreur lors du traitement de {seg_file} : {e}")
+                yield {
+                    "Sujet": trouver_nom_sujet_contraste(seg_file),
+                    methode: "N/A"
+                }
+
+
+
 def load_existing_results():
     """
     Charge le fichier CSV existant et retourne un DataFrame.
@@ -257,11 +290,13 @@ def main():
         print("Aucun fichier correspondant trouvé.")
         return
     
-    results = []
-    for seg_file, label_file in paired_files:
-        print(f"Traitement : {seg_file} et {label_file}")
-        result = process_segmentation(seg_file, label_file, args.seg_method)
-        results.append(result)
+    results = list(traiter_paires(paired_files, args.seg_method, jobs=args.jobs))
+
+    if args.db:
+        n = enregistrer_resultats(args.db, results, args.seg_method, args.run)
+        exporter_large(args.db, CSV_FILE)
+        print(f"{n} résultats de la méthode '{args.seg_method}' enregistrés dans '{args.db}' et exportés dans '{CSV_FILE}'.")
+        return
 
     save_results(results, args.seg_method)
 
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Les scripts s'importent entre eux par leur nom de module (lancés depuis leur dossier)
+for dossier in ("creer_GT", "analyser_segmentation_test"):
+    sys.path.insert(0, os.path.join(RACINE, dossier))
+
+
+@pytest.fixture(autouse=True)
+def cache_temporaire(tmp_path, monkeypatch):
+    """
+    Cache de métadonnées (et index, copies non compressées) propre à chaque test.
+    """
+    monkeypatch.setenv("EXTEND_SEG_CACHE", str(tmp_path / "cache" / "metadonnees.sqlite"))
+
+
+@pytest.fixture
+def sauver_nifti():
+    """
+    Fonction enregistrant un volume en NIfTI (dossiers créés au besoin) et retournant son chemin.
+    """
+    def sauver(chemin, data, affine=None):
+        chemin = str(chemin)
+        os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+        nib.save(nib.Nifti1Image(np.asarray(data), np.eye(4) if affine is None else affine), chemin)
+        return chemin
+    return sauver
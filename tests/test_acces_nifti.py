@@ -0,0 +1,96 @@
+import os
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from acces_nifti import charger_nifti, chemin_ombre, dossier_ombres
+
+
+def volume():
+    rng = np.random.default_rng(0)
+    return (rng.random((6, 7, 8)) > 0.6).astype(np.uint8)
+
+
+@pytest.mark.parametrize("classe", [nib.Nifti1Image, nib.Nifti2Image])
+def test_ombre_nifti1_nifti2(tmp_path, classe):
+    data = volume()
+    affine = np.diag([0.5, 0.5, 2.0, 1.0])
+    chemin = str(tmp_path / "sub-amu01_T1w_seg.nii.gz")
+    nib.save(classe(data, affine), chemin)
+
+    img = charger_nifti(chemin, ombre=True)
+    assert os.path.exists(chemin_ombre(chemin))
+    assert isinstance(img, classe)
+    assert img.get_data_dtype() == np.uint8
+    np.testing.assert_array_equal(np.asanyarray(img.dataobj), data)
+    np.testing.assert_array_equal(img.dataobj[:, :, 2:5], data[:, :, 2:5])
+    np.testing.assert_allclose(img.affine, affine)
+
+    # Deuxième lecture : l'ombre existante est réutilisée
+    np.testing.assert_array_equal(np.asanyarray(charger_nifti(chemin, ombre=True).dataobj), data)
+
+
+def test_ombre_int16_mise_a_echelle(tmp_path):
+    data = np.arange(6 * 7 * 8, dtype=np.int16).reshape(6, 7, 8)
+    img = nib.Nifti1Image(data, np.eye(4))
+    img.set_data_dtype(np.int16)
+    img.header.set_slope_inter(0.5, 10)
+    chemin = str(tmp_path / "image.nii.gz")
+    nib.save(img, chemin)
+
+    attendu = np.asanyarray(nib.load(chemin).dataobj)
+    lu = charger_nifti(chemin, ombre=True)
+    assert lu.get_data_dtype() == np.int16
+    np.testing.assert_allclose(np.asanyarray(lu.dataobj), attendu)
+    np.testing.assert_array_equal(lu.dataobj.get_unscaled(), nib.load(chemin).dataobj.get_unscaled())
+
+
+def test_ombre_remplacee_si_fichier_modifie(tmp_path):
+    chemin = str(tmp_path / "masque.nii.gz")
+    nib.save(nib.Nifti1Image(volume(), np.eye(4)), chemin)
+    charger_nifti(chemin, ombre=True)
+    ancienne = chemin_ombre(chemin)
+
+    nouveau = np.ones((6, 7, 8), dtype=np.uint8)
+    nib.save(nib.Nifti1Image(nouveau, np.eye(4)), chemin)
+    os.utime(chemin, ns=(0, os.stat(chemin).st_mtime_ns + 10 ** 9))
+    np.testing.assert_array_equal(np.asanyarray(charger_nifti(chemin, ombre=True).dataobj), nouveau)
+    assert not os.path.exists(ancienne)
+
+
+def test_sans_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXTEND_SEG_CACHE", "")
+    chemin = str(tmp_path / "masque.nii.gz")
+    nib.save(nib.Nifti1Image(volume(), np.eye(4)), chemin)
+    assert chemin_ombre(chemin) is None
+    np.testing.assert_array_equal(np.asanyarray(charger_nifti(chemin, ombre=True).dataobj), volume())
+
+
+def test_sans_ombre_par_defaut(tmp_path):
+    chemin = str(tmp_path / "masque.nii.gz")
+    nib.save(nib.Nifti1Image(volume(), np.eye(4)), chemin)
+    np.testing.assert_array_equal(np.asanyarray(charger_nifti(chemin).dataobj), volume())
+    assert not os.path.exists(chemin_ombre(chemin))
+
+
+def test_limite_taille_ombres(tmp_path, monkeypatch):
+    # Limite d'environ deux ombres : la moins récemment utilisée est supprimée
+    taille = 352 + volume().nbytes
+    monkeypatch.setenv("EXTEND_SEG_OMBRES_MAX", str(2.5 * taille / 1024 ** 3))
+    chemins = []
+    for i in range(3):
+        chemin = str(tmp_path / f"masque{i}.nii.gz")
+        nib.save(nib.Nifti1Image(volume(), np.eye(4)), chemin)
+        chemins.append(chemin)
+    charger_nifti(chemins[0], ombre=True)
+    charger_nifti(chemins[1], ombre=True)
+    os.utime(chemin_ombre(chemins[0]), ns=(0, 10 ** 9))
+    os.utime(chemin_ombre(chemins[1]), ns=(0, 0))
+    charger_nifti(chemins[1], ombre=True)  # Relecture : redevient la plus récente
+    charger_nifti(chemins[2], ombre=True)
+
+    assert not os.path.exists(chemin_ombre(chemins[0]))
+    assert os.path.exists(chemin_ombre(chemins[1]))
+    assert os.path.exists(chemin_ombre(chemins[2]))
+    assert len(os.listdir(dossier_ombres())) == 2
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+from analyse_seg_vs_label import analyser_methodes, analyser_multi, charger_long
+from resultats import enregistrer
+
+
+def donnees():
+    return pd.DataFrame({
+        "Sujet": ["sub-a01T1w", "sub-b02T1w", "sub-c03T1w", "sub-a01T1w", "sub-b02T1w", "sub-c03T1w"],
+        "methode": ["propseg", "propseg", "propseg", "GT", "GT", "GT"],
+        "valeur": [12.0, 4.0, np.nan, -3.0, 5.0, 0.0],
+    })
+
+
+def test_comptes_par_seuil():
+    recap, sujets = analyser_methodes(donnees(), [5, 0, 10])
+    recap = recap.set_index("methode")
+    assert list(recap.columns[-3:]) == ["sous_0", "sous_5", "sous_10"]
+    # Les comparaisons sont strictes et les valeurs manquantes ne sont jamais sous un seuil
+    assert recap.loc["GT", ["sous_0", "sous_5", "sous_10"]].tolist() == [1, 2, 3]
+    assert recap.loc["propseg", ["sous_0", "sous_5", "sous_10"]].tolist() == [0, 1, 1]
+    assert recap.loc["propseg", ["nb_sujets", "nb_valeurs", "nb_manquants"]].tolist() == [3, 2, 1]
+    assert recap.loc["GT", "moyenne"] == np.mean([-3.0, 5.0, 0.0])
+    assert recap.loc["propseg", "max"] == 12
+
+    assert len(sujets) == 1 + 2 + 3 + 0 + 1 + 1
+    assert sujets.query("methode == 'GT' and seuil == 5")["Sujet"].tolist() == ["sub-a01T1w", "sub-c03T1w"]
+
+
+def test_csv_et_base_identiques(tmp_path):
+    csv = str(tmp_path / "ecarts.csv")
+    pd.DataFrame({"Sujet": ["sub-a01T1w", "sub-b02T2w"], "GT": [-3, 5], "propseg": [12, "N/A"]}).to_csv(csv, index=False)
+    db = str(tmp_path / "resultats.sqlite")
+    enregistrer(db, [("sub-a01", "T1w", "GT", -3), ("sub-b02", "T2w", "GT", 5),
+                     ("sub-a01", "T1w", "propseg", 12), ("sub-b02", "T2w", "propseg", None)])
+
+    depuis_csv = charger_long(file_path=csv).sort_values(["methode", "Sujet"]).reset_index(drop=True)
+    depuis_db = charger_long(db=db).sort_values(["methode", "Sujet"]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(depuis_csv, depuis_db)
+
+    recap, _ = analyser_multi(str(tmp_path), file_path=csv, methodes=["GT"], seuils=[0, 10])
+    assert recap["methode"].tolist() == ["GT"]
+    assert recap[["sous_0", "sous_10"]].values.tolist() == [[1, 2]]
+    assert (tmp_path / "recapitulatif_methodes.csv").exists()
+    assert (tmp_path / "sujets_sous_seuil.csv").exists()
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from appliquer_facteur_echelle import mettre_a_echelle
+
+
+@pytest.mark.parametrize("facteur, aire", [(1.0, 100), (1.3, 169), (1.8, 324), (0.7, 49), (2.0, 400)])
+def test_aire_carre(facteur, aire):
+    data = np.zeros((40, 40, 3), dtype=np.uint8)
+    data[10:20, 10:20, :] = 1
+    sortie = mettre_a_echelle(data, facteur)
+    assert sortie.dtype == np.uint8
+    assert all(sortie[:, :, z].sum() == aire for z in range(3))
+
+
+def test_aire_disque():
+    x, y = np.mgrid[:80, :80]
+    disque = ((x - 40.0) ** 2 + (y - 40.0) ** 2 <= 10 ** 2).astype(np.uint8)[:, :, None]
+    aire = disque.sum()
+    for facteur in (0.8, 1.2, 1.5):
+        assert mettre_a_echelle(disque, facteur).sum() == pytest.approx(facteur ** 2 * aire, rel=0.05)
+
+
+def test_masque_vide():
+    assert not mettre_a_echelle(np.zeros((5, 5, 2)), 1.5).any()
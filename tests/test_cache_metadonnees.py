@@ -0,0 +1,41 @@
+import os
+import sqlite3
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+import acces_nifti
+import cache_metadonnees
+from cache_metadonnees import chemin_cache, obtenir_metadonnees
+
+
+def sha256_en_cache(chemin):
+    with sqlite3.connect(chemin_cache()) as con:
+        return con.execute("SELECT sha256 FROM metadonnees WHERE chemin = ?",
+                           (os.path.abspath(chemin),)).fetchone()[0]
+
+
+def test_hash_calcule_seulement_si_date_change(tmp_path, monkeypatch):
+    data = np.zeros((4, 4, 6), dtype=np.uint8)
+    data[1:3, 1:3, 2:5] = 1
+    chemin = str(tmp_path / "seg.nii.gz")
+    nib.save(nib.Nifti1Image(data, np.eye(4)), chemin)
+
+    appels = []
+    hash_fichier = cache_metadonnees.hash_fichier
+    monkeypatch.setattr(cache_metadonnees, "hash_fichier", lambda c: appels.append(c) or hash_fichier(c))
+
+    assert obtenir_metadonnees(chemin, ["z_max"])["z_max"] == 4
+    assert obtenir_metadonnees(chemin, ["z_min", "forme"])["z_min"] == 2
+    assert appels == [] and sha256_en_cache(chemin) is None
+
+    # Date changée, même contenu : le hash est calculé puis gardé
+    os.utime(chemin, ns=(0, os.stat(chemin).st_mtime_ns + 10 ** 9))
+    assert obtenir_metadonnees(chemin, ["z_max"])["z_max"] == 4
+    assert len(appels) == 1 and sha256_en_cache(chemin) == hash_fichier(chemin)
+
+    # Date changée de nouveau : le hash gardé suffit pour garder les informations
+    monkeypatch.setattr(acces_nifti, "charger_nifti", lambda *a, **k: pytest.fail("fichier relu"))
+    os.utime(chemin, ns=(0, os.stat(chemin).st_mtime_ns + 10 ** 9))
+    assert obtenir_metadonnees(chemin, ["z_max"])["z_max"] == 4
@@ -0,0 +1,91 @@
+import numpy as np
+import nibabel as nib
+import pytest
+from nibabel.orientations import axcodes2ornt, ornt_transform
+
+from calcul_csa import calculer_facteur, coords_labels_ras, csa_par_slice, slices_niveaux
+
+ZOOMS = (0.5, 0.5, 0.5)
+
+
+def cylindre(rayon, inclinaison=0.0, rapport=1.0, forme=(120, 80, 60)):
+    """
+    Masque flou (fraction de chaque voxel dans le cylindre, comme un GT softseg) d'un cylindre de
+    rayon (mm) donné dont l'axe est incliné de `inclinaison` degrés vers X. La section est une
+    ellipse de demi-axes rayon (X) et rayon x rapport (Y).
+    """
+    # 4 x 4 points par voxel dans le plan XY
+    sous = (np.arange(4) + 0.5) / 4 - 0.5
+    x = ((np.arange(forme[0])[:, None] + sous).ravel() * ZOOMS[0])[:, None]
+    y = ((np.arange(forme[1])[:, None] + sous).ravel() * ZOOMS[1])[None, :]
+    data = np.zeros(forme, dtype=np.float32)
+    pente = np.tan(np.radians(inclinaison))
+    for z in range(forme[2]):
+        cx = 20 + z * ZOOMS[2] * pente
+        # Section horizontale d'un cylindre incliné : ellipse allongée selon X
+        dedans = ((x - cx) * np.cos(np.radians(inclinaison))) ** 2 + ((y - 20) / rapport) ** 2 <= rayon ** 2
+        data[:, :, z] = dedans.reshape(forme[0], 4, forme[1], 4).mean(axis=(1, 3))
+    return data
+
+
+def test_cylindre_droit():
+    csa = csa_par_slice(cylindre(6), ZOOMS)
+    np.testing.assert_allclose(csa, np.pi * 6 ** 2, rtol=0.01)
+
+
+@pytest.mark.parametrize("rapport", [1.0, 1.5])
+def test_cylindre_incline(rapport):
+    data = cylindre(6, inclinaison=30, rapport=rapport)
+    attendu = np.pi * 6 ** 2 * rapport
+    # Sans correction : section horizontale, plus grande d'un facteur 1 / cos(30°)
+    np.testing.assert_allclose(np.nanmean(csa_par_slice(data, ZOOMS, correction_angle=False)),
+                               attendu / np.cos(np.radians(30)), rtol=0.01)
+    np.testing.assert_allclose(np.nanmean(csa_par_slice(data, ZOOMS)), attendu, rtol=0.01)
+
+
+def test_slices_vides():
+    data = cylindre(6)
+    data[:, :, :10] = 0
+    csa = csa_par_slice(data, ZOOMS)
+    assert np.isnan(csa[:10]).all() and not np.isnan(csa[10:]).any()
+
+
+def orienter(data, axcodes):
+    """
+    Met un volume donné en RAS dans l'orientation axcodes.
+    :return: Tuple (données, affine)
+    """
+    img = nib.Nifti1Image(data, np.diag(ZOOMS + (1.0,)))
+    img = img.as_reoriented(ornt_transform(axcodes2ornt("RAS"), axcodes2ornt(axcodes)))
+    return np.asanyarray(img.dataobj), img.affine
+
+
+def labels(valeurs_z, forme=(120, 80, 60)):
+    data = np.zeros(forme, dtype=np.uint8)
+    for valeur, z in valeurs_z.items():
+        data[40, 40, z] = valeur
+    return data
+
+
+@pytest.mark.parametrize("axcodes", ["RAS", "LPI", "PIR"])
+def test_orientations(tmp_path, sauver_nifti, axcodes):
+    label_path = sauver_nifti(tmp_path / "labels.nii.gz", *orienter(labels({2: 50, 5: 10}), axcodes))
+    gt_path = sauver_nifti(tmp_path / "gt.nii.gz", *orienter(cylindre(6), axcodes))
+    propseg_path = sauver_nifti(tmp_path / "propseg.nii.gz", *orienter(cylindre(5), axcodes))
+
+    assert coords_labels_ras(label_path) == {2: 50, 5: 10}
+    assert slices_niveaux(coords_labels_ras(label_path), 2, 4) == (10, 50)
+    csa_prop, csa_gt, facteur = calculer_facteur(propseg_path, gt_path, label_path)
+    np.testing.assert_allclose(csa_gt, np.pi * 6 ** 2, rtol=0.01)
+    np.testing.assert_allclose(facteur, (6 / 5) ** 2, rtol=0.02)
+
+
+def test_labels_manquants(tmp_path, sauver_nifti):
+    # Pas de label 5 (bas de C4) : niveaux introuvables
+    label_path = sauver_nifti(tmp_path / "labels.nii.gz", *orienter(labels({2: 50, 3: 35}), "RAS"))
+    seg_path = sauver_nifti(tmp_path / "seg.nii.gz", *orienter(cylindre(6), "RAS"))
+    assert slices_niveaux(coords_labels_ras(label_path), 2, 4) is None
+    assert all(np.isnan(calculer_facteur(seg_path, seg_path, label_path)))
+
+    vide_path = sauver_nifti(tmp_path / "vide.nii.gz", *orienter(labels({}), "RAS"))
+    assert coords_labels_ras(vide_path) == {}
@@ -0,0 +1,44 @@
+import os
+import stat
+import sys
+
+import pytest
+
+from calcul_facteurs_echelle import facteur_sct
+
+# Fausses commandes SCT : sct_image échoue si FAUX_SCT_ECHEC est défini, sct_process_segmentation
+# écrit une CSA de 50 mm² pour PropSeg et de 60 mm² pour le GT
+FAUX_SCT_IMAGE = """#!{python}
+import os, sys
+if os.environ.get("FAUX_SCT_ECHEC"):
+    sys.exit("ligne 1\\nValueError: orientation inconnue")
+"""
+FAUX_SCT_PROCESS = """#!{python}
+import sys
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+aire = 60 if "gt" in args["-o"] else 50
+open(args["-o"], "w").write(f"Slice (I->S),MEAN(area)\\n0,{{aire}}\\n1,{{aire}}\\n")
+"""
+
+
+@pytest.fixture(autouse=True)
+def faux_sct(tmp_path, monkeypatch):
+    dossier = tmp_path / "bin"
+    dossier.mkdir()
+    for nom, contenu in (("sct_image", FAUX_SCT_IMAGE), ("sct_process_segmentation", FAUX_SCT_PROCESS)):
+        script = dossier / nom
+        script.write_text(contenu.format(python=sys.executable))
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{dossier}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_facteur_sct():
+    ligne = facteur_sct("sub-amu01_T2w", "propseg.nii.gz", "gt.nii.gz", "labels.nii.gz")
+    assert ligne == {"Sujet": "sub-amu01_T2w", "CSA_PropSeg": 50, "CSA_GT": 60, "Facteur_Echelle": 1.2}
+
+
+def test_erreur_sct_rapportee(monkeypatch, capsys):
+    monkeypatch.setenv("FAUX_SCT_ECHEC", "1")
+    ligne = facteur_sct("sub-amu01_T2w", "propseg.nii.gz", "gt.nii.gz", "labels.nii.gz")
+    assert ligne["CSA_PropSeg"] == "Erreur sct_image (code 1) : ValueError: orientation inconnue"
+    assert "ligne 1" in capsys.readouterr().out
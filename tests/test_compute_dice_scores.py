@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+import compute_dice_scores
+
+
+def test_format_des_sorties(tmp_path, monkeypatch, sauver_nifti):
+    gt = np.zeros((10, 10, 10), dtype=np.uint8)
+    gt[2:6, 2:6, 2:6] = 1
+    pred = np.zeros_like(gt)
+    pred[2:6, 2:6, 2:4] = 1
+    sauver_nifti(str(tmp_path / "gt/sub-amu02/anat/sub-amu02_T1w_desc-softseg_label-SC_seg.nii.gz"), gt)
+    sauver_nifti(str(tmp_path / "pred/sub-amu02_T1w_seg_nnunet.nii.gz"), pred)
+    sauver_nifti(str(tmp_path / "autre/sub-amu02_T1w_seg.nii.gz"), gt)
+
+    sorties = {nom: str(tmp_path / f"{nom}.csv") for nom in ("scores", "stats", "long")}
+    monkeypatch.setattr(compute_dice_scores, "GT_DIR", str(tmp_path / "gt"))
+    monkeypatch.setattr(compute_dice_scores, "MODELES", {"nnunet": (str(tmp_path / "pred"), "_seg_nnunet.nii.gz"),
+                                                         "autre": (str(tmp_path / "autre"), "_seg.nii.gz")})
+    monkeypatch.setattr(compute_dice_scores, "SUBJECTS", ["sub-amu02"])
+    monkeypatch.setattr(compute_dice_scores, "JOBS", 1)
+    monkeypatch.setattr(compute_dice_scores, "OUTPUT_ALL_DICE_CSV", sorties["scores"])
+    monkeypatch.setattr(compute_dice_scores, "OUTPUT_STATS_DICE_CSV", sorties["stats"])
+    monkeypatch.setattr(compute_dice_scores, "OUTPUT_LONG_CSV", sorties["long"])
+    compute_dice_scores.main()
+
+    scores = pd.read_csv(sorties["scores"])
+    assert list(scores.columns) == ["subject", "contrast", "dice_score"]
+    assert scores.to_dict("records") == [{"subject": "sub-amu02", "contrast": "T1w", "dice_score": round(2 / 3, 4)}]
+    assert list(pd.read_csv(sorties["stats"]).columns) == ["mean_dice", "std_dice", "cv_dice"]
+
+    long = pd.read_csv(sorties["long"])
+    assert set(long["model"]) == {"nnunet", "autre"}
+    assert long.query("model == 'autre' and metric == 'dice'")["value"].tolist() == [1.0]
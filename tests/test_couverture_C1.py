@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import couverture_C1
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch, sauver_nifti):
+    forme = (12, 12, 40)
+    gt = np.zeros(forme, dtype=np.uint8)
+    gt[4:8, 4:8, 5:36] = 1
+    labels = np.zeros(forme, dtype=np.uint8)
+    for valeur, z in ((1, 34), (2, 28), (3, 21), (4, 14)):
+        labels[6, 6, z] = valeur
+    pred_a = gt.copy()
+    pred_a[:, :, 31:] = 0
+    pred_b = gt.copy()
+    pred_b[4:6, :, :] = 0
+
+    sauver_nifti(str(tmp_path / "gt/sub-a01/anat/sub-a01_T1w_desc-softseg_label-SC_seg.nii.gz"), gt)
+    sauver_nifti(str(tmp_path / "labels/sub-a01/anat/sub-a01_T1w_label-discs_dlabel.nii.gz"), labels)
+    sauver_nifti(str(tmp_path / "a/sub-a01_T1w_contrast.nii.gz"), pred_a)
+    sauver_nifti(str(tmp_path / "b/sub-a01_T1w_seg_nnunet.nii.gz"), pred_b)
+    # Sujet sans prédiction du deuxième modèle
+    sauver_nifti(str(tmp_path / "gt/sub-b02/anat/sub-b02_T1w_desc-softseg_label-SC_seg.nii.gz"), gt)
+    sauver_nifti(str(tmp_path / "labels/sub-b02/anat/sub-b02_T1w_label-discs_dlabel.nii.gz"), labels)
+    sauver_nifti(str(tmp_path / "a/sub-b02_T1w_contrast.nii.gz"), pred_a)
+
+    monkeypatch.setattr(couverture_C1, "seg_gt_dir", str(tmp_path / "gt"))
+    monkeypatch.setattr(couverture_C1, "label_path", str(tmp_path / "labels"))
+    monkeypatch.setattr(couverture_C1, "modeles", {"contrast_agnostic": (str(tmp_path / "a"), "_contrast.nii.gz"),
+                                                   "extend_seg": (str(tmp_path / "b"), "_seg_nnunet.nii.gz")})
+    for nom in ("output_csv_path", "output_long_csv_path", "output_profile_csv_path"):
+        monkeypatch.setattr(couverture_C1, nom, str(tmp_path / f"{nom}.csv"))
+    return gt, pred_a, pred_b
+
+
+def test_evaluer_sujet(dataset):
+    gt, pred_a, pred_b = dataset
+    predictions = couverture_C1.lister_sujets()["sub-a01_T1w"]
+    couvertures, profil = couverture_C1.evaluer_sujet("sub-a01_T1w", predictions)
+
+    # C1 : slices 28 à 34 ; la prédiction a s'arrête à la slice 30
+    assert couvertures["contrast_agnostic"] == pytest.approx(couverture_C1.compute_c1_coverage(gt, pred_a, 34, 28))
+    assert couvertures["contrast_agnostic"] == pytest.approx(3 / 7 * 100)
+    assert couvertures["extend_seg"] == pytest.approx(50)
+
+    # Même profil qu'à partir des volumes entiers
+    niveaux = couverture_C1.niveaux_vertebraux(couverture_C1.lire_labels(
+        os.path.join(couverture_C1.label_path, "sub-a01/anat/sub-a01_T1w_label-discs_dlabel.nii.gz")))
+    attendu = couverture_C1.profil_niveaux(gt, {"contrast_agnostic": pred_a, "extend_seg": pred_b}, niveaux)
+    assert pd.DataFrame(profil).equals(pd.DataFrame(attendu))
+    assert [ligne["level"] for ligne in profil[:3]] == ["C1", "C2", "C3"]
+    assert (profil[0]["z_inf"], profil[0]["z_sup"]) == (28, 34)
+
+
+def test_sujets_incomplets(dataset, monkeypatch):
+    couverture_C1.main()
+    assert pd.read_csv(couverture_C1.output_csv_path)["subject"].tolist() == ["sub-a01_T1w"]
+
+    monkeypatch.setattr(couverture_C1, "garder_incomplets", True)
+    couverture_C1.main()
+    df = pd.read_csv(couverture_C1.output_csv_path)
+    assert df["subject"].tolist() == ["sub-a01_T1w", "sub-b02_T1w"]
+    assert np.isnan(df.loc[1, "coverage_extend_seg (%)"])
@@ -0,0 +1,51 @@
+import os
+
+import nibabel as nib
+import numpy as np
+
+from flux import COLONNES, chaine
+
+
+def test_chaine_deux_sujets(tmp_path, sauver_nifti):
+    forme = (8, 8, 40)
+    gt = np.zeros(forme, dtype=np.uint8)
+    gt[2:6, 2:6, 0:20] = 1
+    propseg = np.zeros(forme, dtype=np.uint8)
+    propseg[3:5, 3:5, 0:35] = 1
+    labels = np.zeros(forme, dtype=np.uint8)
+    labels[4, 4, 22] = 1
+
+    travaux = []
+    for sujet, data_gt in (("sub-a01_T1w", gt), ("sub-a02_T1w", np.zeros(forme, dtype=np.uint8))):
+        chemins = [str(tmp_path / f"{sujet}_{nom}.nii.gz") for nom in ("propseg", "gt", "labels")]
+        for chemin, data in zip(chemins, (propseg, data_gt, labels)):
+            sauver_nifti(chemin, data)
+        travaux.append((sujet, *chemins, 1.0))
+
+    sortie_dir = str(tmp_path / "sortie")
+    os.makedirs(sortie_dir)
+    lignes = list(chaine(travaux, sortie_dir, decalage=5, marge_c1=10))
+    assert [ligne["Sujet"] for ligne in lignes] == ["sub-a01_T1w", "sub-a02_T1w"]
+    assert all(list(ligne) == COLONNES for ligne in lignes)
+
+    # Premier sujet : GT jusqu'à z = 19 - 5, PropSeg au-dessus, puis rien au-dessus de C1 + 10
+    attendu = propseg.copy()
+    attendu[:, :, :15] = gt[:, :, :15]
+    attendu[:, :, 32:] = 0
+    final = np.asanyarray(nib.load(os.path.join(sortie_dir, "sub-a01_T1w_fusion_cropped.nii.gz")).dataobj)
+    np.testing.assert_array_equal(final, attendu)
+
+    ok = lignes[0]
+    assert ok["Erreur"] is None
+    assert ok["Facteur_Echelle"] == 1.0
+    assert ok["Ecart_C1"] == 31 - 22
+    n_commun = np.count_nonzero(attendu & gt)
+    assert ok["Dice_GT"] == round(2 * n_commun / (np.count_nonzero(attendu) + np.count_nonzero(gt)), 4)
+    assert ok["Volume_GT_mm3"] == np.count_nonzero(gt)
+    assert ok["Volume_final_mm3"] == np.count_nonzero(attendu)
+
+    # Deuxième sujet : GT vide, erreur dans la fusion, aucun fichier écrit et métriques vides
+    erreur = lignes[1]
+    assert erreur["Erreur"].startswith("fusion : Z max trop petit")
+    assert np.isnan(erreur["Dice_GT"]) and np.isnan(erreur["Ecart_C1"])
+    assert not os.path.exists(os.path.join(sortie_dir, "sub-a02_T1w_fusion_cropped.nii.gz"))
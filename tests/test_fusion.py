@@ -0,0 +1,40 @@
+import nibabel as nib
+import numpy as np
+
+from fusion import charger_masque, fusionner_sujet
+
+
+def test_charger_masque(tmp_path, sauver_nifti):
+    data = np.zeros((10, 12, 14), dtype=np.float32)
+    data[2:5, 3:9, 4:11] = 0.6
+    chemin = str(tmp_path / "seg.nii.gz")
+    sauver_nifti(chemin, data)
+    _, masque = charger_masque(chemin)
+    assert masque.dtype == np.uint8 and masque.flags.writeable
+    np.testing.assert_array_equal(masque, (data > 0).astype(np.uint8))
+
+    sauver_nifti(chemin, np.zeros((4, 4, 4), dtype=np.uint8))
+    assert not charger_masque(chemin)[1].any()
+
+
+def test_fusion_et_crop(tmp_path, sauver_nifti):
+    forme = (8, 8, 40)
+    gt = np.zeros(forme, dtype=np.uint8)
+    gt[2:6, 2:6, 0:20] = 1
+    propseg = np.zeros(forme, dtype=np.uint8)
+    propseg[3:5, 3:5, 0:35] = 1
+    labels = np.zeros(forme, dtype=np.uint8)
+    labels[4, 4, 22] = 1
+    chemins = {nom: str(tmp_path / f"{nom}.nii.gz") for nom in ("gt", "propseg", "labels")}
+    for nom, data in (("gt", gt), ("propseg", propseg), ("labels", labels)):
+        sauver_nifti(chemins[nom], data)
+
+    fusionner_sujet("sub-a01_T1w", chemins["gt"], chemins["propseg"], str(tmp_path), decalage=5,
+                    label_path=chemins["labels"], marge_c1=10)
+    sortie = np.asanyarray(nib.load(str(tmp_path / "sub-a01_T1w_fusion_cropped.nii.gz")).dataobj)
+
+    # GT jusqu'à z = 19 - 5, PropSeg au-dessus, puis rien au-dessus de C1 + 10
+    attendu = propseg.copy()
+    attendu[:, :, :15] = gt[:, :, :15]
+    attendu[:, :, 32:] = 0
+    np.testing.assert_array_equal(sortie, attendu)
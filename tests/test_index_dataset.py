@@ -0,0 +1,50 @@
+import os
+
+from index_dataset import decouper_nom_bids, lister_fichiers, obtenir_index
+from seg_vs_label import find_files
+
+
+def creer(racine, *relatifs):
+    for relatif in relatifs:
+        chemin = os.path.join(racine, relatif)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        open(chemin, "w").close()
+
+
+def test_decouper_nom_bids():
+    assert decouper_nom_bids("sub-amu01_T1w.nii.gz") == ("sub-amu01", "T1w", "")
+    assert decouper_nom_bids("sub-amu01_acq-sag_T2w_label-discs_dlabel.nii") == ("sub-amu01", "T2w", "label-discs_dlabel")
+    assert decouper_nom_bids("masque.nii.gz") is None
+    assert decouper_nom_bids("sub-amu01_T1w.json") is None
+
+
+def test_index_garde_tous_les_fichiers(tmp_path):
+    racine = str(tmp_path / "labels")
+    creer(racine,
+          "sub-amu01/anat/sub-amu01_T1w_seg.nii",
+          "sub-amu01/anat/sub-amu01_T1w_seg.nii.gz",
+          "sub-amu01/anat/masque_manuel.nii.gz",
+          "sub-amu01/anat/sub-amu01_T1w.json")
+
+    index = obtenir_index(racine)
+    assert index == {("sub-amu01", "T1w", "seg"): os.path.join(racine, "sub-amu01/anat/sub-amu01_T1w_seg.nii")}
+    assert lister_fichiers(racine) == [os.path.join(racine, "sub-amu01/anat", nom) for nom in
+                                       ("masque_manuel.nii.gz", "sub-amu01_T1w_seg.nii", "sub-amu01_T1w_seg.nii.gz")]
+
+    # Index relu depuis le disque, puis reconstruit après l'ajout d'un fichier
+    assert len(lister_fichiers(racine)) == 3
+    creer(racine, "sub-amu01/anat/sub-amu01_T2w_seg.nii.gz")
+    assert ("sub-amu01", "T2w", "seg") in obtenir_index(racine)
+    assert len(lister_fichiers(racine)) == 4
+
+
+def test_find_files_comme_glob(tmp_path):
+    racine = str(tmp_path / "labels")
+    creer(racine,
+          "sub-amu01/anat/sub-amu01_T1w_seg.nii.gz",
+          "sub-amu01/anat/sub-amu01_T1w_seg.nii",
+          "sub-amu01/anat/seg_manuelle_T1w.nii.gz",
+          "sub-amu01/anat/sub-amu01_T1w_centerline.nii.gz",
+          "sub-amu01/dwi/sub-amu01_dwi_seg.nii.gz")
+    assert find_files(racine, r"seg") == [os.path.join(racine, "sub-amu01/anat", nom) for nom in
+                                          ("seg_manuelle_T1w.nii.gz", "sub-amu01_T1w_seg.nii.gz")]
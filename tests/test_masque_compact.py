@@ -0,0 +1,74 @@
+import os
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from acces_nifti import charger_nifti
+from masque_compact import MasqueCompact, compact_vers_nifti, ecrire_compact, nifti_vers_compact
+
+
+def masque_moelle():
+    x, y = np.mgrid[:120, :100]
+    masque = np.zeros((120, 100, 40), dtype=bool)
+    for z in range(5, 35):
+        masque[:, :, z] = (x - 60 - z / 5) ** 2 / 1.3 + (y - 50) ** 2 < (6 + z % 3) ** 2
+    return masque
+
+
+@pytest.fixture
+def fichiers(tmp_path):
+    masque = masque_moelle()
+    affine = np.diag([0.5, 0.6, 1.2, 1.0])
+    affine[:3, 3] = (-10, 4, 30)
+    chemin_nifti = str(tmp_path / "seg.nii.gz")
+    chemin_msk = str(tmp_path / "seg.msk")
+    nib.save(nib.Nifti1Image(masque.astype(np.float32) * 0.9, affine), chemin_nifti)
+    nifti_vers_compact(chemin_nifti, chemin_msk)
+    return masque, affine, chemin_nifti, chemin_msk
+
+
+def test_aller_retour(fichiers, tmp_path):
+    masque, affine, _, chemin_msk = fichiers
+    retour = str(tmp_path / "retour.nii.gz")
+    compact_vers_nifti(chemin_msk, retour)
+    img = nib.load(retour)
+    assert img.get_data_dtype() == np.uint8
+    np.testing.assert_array_equal(np.asanyarray(img.dataobj), masque.astype(np.uint8))
+    np.testing.assert_allclose(img.affine, affine)
+
+
+def test_lecture_partielle(fichiers):
+    masque, _, _, chemin_msk = fichiers
+    mc = charger_nifti(chemin_msk)
+    assert isinstance(mc, MasqueCompact)
+    assert mc.shape == masque.shape
+    assert mc.etendue_z() == (5, 34)
+    attendu = masque.astype(np.uint8)
+    np.testing.assert_array_equal(mc.dataobj[:, :, 10:20], attendu[:, :, 10:20])
+    np.testing.assert_array_equal(mc.dataobj[..., 12], attendu[..., 12])
+    np.testing.assert_array_equal(mc.dataobj[5:50, ..., 3:30:4], attendu[5:50, ..., 3:30:4])
+    np.testing.assert_array_equal(mc.dataobj[..., ::-2], attendu[..., ::-2])
+    np.testing.assert_array_equal(mc.dataobj[60, :, ::-1], attendu[60, :, ::-1])
+    np.testing.assert_array_equal(mc.dataobj[60, 50, 30:2:-3], attendu[60, 50, 30:2:-3])
+    np.testing.assert_array_equal(mc.dataobj[60, 50, 2:30:-1], attendu[60, 50, 2:30:-1])
+    np.testing.assert_array_equal(mc.dataobj[60], attendu[60])
+    np.testing.assert_array_equal(mc.dataobj[:, :, -1], attendu[:, :, -1])
+    assert mc.dataobj[..., 4].shape == masque.shape[:2]
+
+
+def test_taille(fichiers, tmp_path):
+    masque, affine, chemin_nifti, chemin_msk = fichiers
+    chemin_uint8 = str(tmp_path / "seg_uint8.nii.gz")
+    nib.save(nib.Nifti1Image(masque.astype(np.uint8), affine), chemin_uint8)
+    assert os.path.getsize(chemin_msk) < os.path.getsize(chemin_uint8) < os.path.getsize(chemin_nifti)
+
+
+def test_masque_vide(tmp_path):
+    chemin = str(tmp_path / "vide.msk")
+    img = nib.Nifti1Image(np.zeros((4, 5, 6), dtype=np.uint8), np.eye(4))
+    ecrire_compact(np.zeros((4, 5, 6)), img, chemin)
+    mc = MasqueCompact(chemin)
+    assert mc.etendue_z() is None
+    assert not np.asarray(mc).any()
+
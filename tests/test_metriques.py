@@ -0,0 +1,60 @@
+import nibabel as nib
+import numpy as np
+import pytest
+
+from metriques import comparer_masques, metriques_paire, metriques_predictions
+
+
+def cubes():
+    gt = np.zeros((20, 20, 20), dtype=bool)
+    gt[5:15, 5:15, 5:15] = True
+    pred = np.zeros_like(gt)
+    pred[5:15, 5:15, 10:18] = True
+    return pred, gt
+
+
+def test_dice_jaccard_volumes():
+    pred, gt = cubes()
+    r = comparer_masques(pred, gt, (0.5, 0.5, 2.0))
+    # Intersection 500 voxels, prédiction 800, GT 1000
+    assert r["dice"] == pytest.approx(2 * 500 / 1800)
+    assert r["jaccard"] == pytest.approx(500 / 1300)
+    assert r["volume_pred_mm3"] == pytest.approx(800 * 0.5)
+    assert r["volume_gt_mm3"] == pytest.approx(1000 * 0.5)
+    assert r["diff_volume_pct"] == pytest.approx(-20)
+    assert "hausdorff_mm" not in r
+
+
+def test_cas_limites():
+    pred, gt = cubes()
+    assert comparer_masques(gt, gt, (1, 1, 1))["dice"] == 1
+    vide = np.zeros_like(gt)
+    assert comparer_masques(vide, gt, (1, 1, 1))["dice"] == 0
+    r = comparer_masques(vide, vide, (1, 1, 1))
+    assert np.isnan(r["dice"]) and r["volume_gt_mm3"] == 0
+    with pytest.raises(ValueError):
+        comparer_masques(pred[:-1], gt, (1, 1, 1))
+
+
+def test_distances():
+    pred, gt = cubes()
+    r = comparer_masques(pred, gt, (1.0, 1.0, 1.0), distances=True)
+    # Le centre de la face inférieure du GT (z = 5) est à 5 voxels de la surface la plus proche
+    # de la prédiction (sa face inférieure, z = 10)
+    assert r["hausdorff_mm"] == pytest.approx(5)
+    assert 0 < r["assd_mm"] < 5
+    assert comparer_masques(gt, gt, (1, 1, 1), distances=True)["hausdorff_mm"] == 0
+
+
+def test_fichiers(tmp_path):
+    pred, gt = cubes()
+    chemins = {}
+    for nom, data in (("pred", pred), ("gt", gt)):
+        chemins[nom] = str(tmp_path / f"{nom}.nii.gz")
+        nib.save(nib.Nifti1Image(data.astype(np.float32) * 0.8, np.eye(4)), chemins[nom])
+    assert metriques_paire(chemins["pred"], chemins["gt"])["dice"] == pytest.approx(2 * 500 / 1800)
+
+    resultats = metriques_predictions(chemins["gt"], {"a": chemins["pred"], "b": chemins["gt"],
+                                                      "manquant": str(tmp_path / "absent.nii.gz")})
+    assert resultats["b"]["dice"] == 1
+    assert resultats["manquant"] is None
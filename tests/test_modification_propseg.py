@@ -0,0 +1,75 @@
+import csv
+import os
+import stat
+import sys
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+import modification_propseg
+
+# Faux sct_propseg : copie l'image d'entrée dans le fichier de sortie
+FAUX_SCT_PROPSEG = """#!{python}
+import sys, shutil
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+shutil.copy(args["-i"], args["-o"])
+"""
+
+
+@pytest.fixture
+def images(tmp_path, monkeypatch):
+    dossier = tmp_path / "bin"
+    dossier.mkdir()
+    script = dossier / "sct_propseg"
+    script.write_text(FAUX_SCT_PROPSEG.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{dossier}{os.pathsep}{os.environ['PATH']}")
+
+    liste = []
+    for sujet, valeur in (("sub-amu01", 1.0), ("sub-amu02", 8.0)):
+        chemin = str(tmp_path / f"{sujet}_T2w.nii.gz")
+        nib.save(nib.Nifti1Image(np.ones((2, 2, 2), dtype=np.uint8), np.eye(4)), chemin)
+        max_area, max_deformation, min_contrast = modification_propseg.parametres_propseg(valeur)
+        liste.append({'path': chemin, 'subject': sujet, 'nom_contraste': 'T2w', 'contrast': 't2',
+                      'propseg_value': valeur, 'max_area': max_area, 'max_deformation': max_deformation,
+                      'min_contrast': min_contrast,
+                      'output_path': str(tmp_path / "sortie" / f"{sujet}_T2w_propseg.nii.gz")})
+    return liste
+
+
+def lancer(images, tmp_path):
+    log_file = str(tmp_path / "parametres.csv")
+    modification_propseg.run_propseg(images, log_file=log_file, jobs=2,
+                                     manifest_path=str(tmp_path / "sortie" / ".manifest.json"))
+    with open(log_file, newline='') as f:
+        return {ligne['subject']: ligne for ligne in csv.DictReader(f)}
+
+
+def test_reprise_garde_les_lignes_sautees(images, tmp_path, capsys):
+    premier = lancer(images, tmp_path)
+    assert set(premier) == {"sub-amu01", "sub-amu02"}
+
+    # Relance : tout est à jour, le CSV garde les lignes de la première exécution
+    assert lancer(images, tmp_path) == premier
+    assert capsys.readouterr().out.count("segmentation sautée") == 2
+
+    # Log supprimé : les lignes sautées sont refaites à partir du manifeste, sans durée
+    os.remove(tmp_path / "parametres.csv")
+    refait = lancer(images, tmp_path)
+    assert refait["sub-amu01"]["max_area"] == "400"
+    assert refait["sub-amu02"]["wall_time_s"] == ""
+
+
+def test_erreur_sur_une_image(images, tmp_path, monkeypatch):
+    executer = modification_propseg.executer_propseg
+
+    def executer_ou_echouer(img, *args):
+        if img['subject'] == "sub-amu01":
+            raise ValueError("segmentation illisible")
+        return executer(img, *args)
+
+    monkeypatch.setattr(modification_propseg, "executer_propseg", executer_ou_echouer)
+    lignes = lancer(images, tmp_path)
+    assert set(lignes) == {"sub-amu02"}
+    assert os.path.exists(images[1]['output_path'])
@@ -0,0 +1,47 @@
+import nibabel as nib
+import numpy as np
+import pytest
+from nibabel.orientations import axcodes2ornt, ornt_transform
+
+from outils_nifti import appliquer_dans_boite, boite_englobante, union_boites, z_max_ras
+
+
+def image_ras():
+    data = np.zeros((9, 10, 20), dtype=np.uint8)
+    data[3:6, 4:7, 2:14] = 1
+    return nib.Nifti1Image(data, np.diag([0.8, 0.9, 1.5, 1.0]))
+
+
+@pytest.mark.parametrize("codes", [("R", "A", "S"), ("L", "P", "I"), ("R", "S", "A"), ("S", "L", "P"), ("A", "I", "R")])
+def test_z_max_ras_orientations(codes, tmp_path):
+    img = image_ras()
+    reoriente = img.as_reoriented(ornt_transform(axcodes2ornt(("R", "A", "S")), axcodes2ornt(codes)))
+    chemin = str(tmp_path / "seg.nii.gz")
+    nib.save(reoriente, chemin)
+
+    attendu = int(np.max(np.where(np.asanyarray(img.dataobj) > 0)[2]))
+    assert attendu == 13
+    assert z_max_ras(nib.load(chemin)) == attendu
+    assert z_max_ras(nib.load(chemin), epaisseur=3) == attendu
+
+
+def test_z_max_ras_vide():
+    assert z_max_ras(nib.Nifti1Image(np.zeros((4, 4, 4), dtype=np.uint8), np.eye(4))) is None
+
+
+def test_boites():
+    data = np.zeros((10, 10, 10))
+    data[2:4, 5, 7:9] = 1
+    assert boite_englobante(data) == (slice(2, 4), slice(5, 6), slice(7, 9))
+    assert boite_englobante(data, marge=2) == (slice(0, 6), slice(3, 8), slice(5, 10))
+    assert boite_englobante(np.zeros((3, 3, 3))) is None
+    assert union_boites(None, (slice(1, 2), slice(3, 4)), (slice(0, 1), slice(5, 6))) == (slice(0, 2), slice(3, 6))
+
+
+def test_appliquer_dans_boite():
+    data = np.zeros((10, 10, 10), dtype=np.float32)
+    data[2:4, 5, 7:9] = 0.7
+    sortie = appliquer_dans_boite(data, lambda bloc: bloc > 0, marge=1, dtype=np.uint8)
+    assert sortie.dtype == np.uint8
+    np.testing.assert_array_equal(sortie, (data > 0).astype(np.uint8))
+    assert not appliquer_dans_boite(np.zeros((3, 3, 3)), lambda bloc: bloc + 1).any()
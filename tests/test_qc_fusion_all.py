@@ -0,0 +1,68 @@
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+import qc_fusion_all
+
+# Faux sct_qc : écrit les images du sujet, une entrée dans _json et un index.html contenant toutes
+# les entrées du dossier (mis en forme avec indent=2, ou absentes si FAUX_QC_FORMAT=inconnu)
+FAUX_SCT_QC = """#!{python}
+import sys, os, json, glob, time
+args = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+q, n, p = args["-qc"], args["-qc-subject"], args["-p"]
+os.makedirs(os.path.join(q, "_json"), exist_ok=True)
+os.makedirs(os.path.join(q, n, p), exist_ok=True)
+open(os.path.join(q, n, p, "img.png"), "w").write("png")
+json.dump([{{"subject": n, "cmd": p}}], open(os.path.join(q, "_json", f"qc_{{time.time_ns()}}.json"), "w"))
+data = []
+for f in sorted(glob.glob(os.path.join(q, "_json", "*.json"))):
+    data.extend(json.load(open(f)))
+contenu = "[]" if os.environ.get("FAUX_QC_FORMAT") == "inconnu" else json.dumps(data, indent=2)
+open(os.path.join(q, "index.html"), "w").write("<html><script>var x = [1, 2];\\nvar sct_data = " + contenu + ";</script></html>")
+"""
+
+
+@pytest.fixture
+def faux_sct(tmp_path, monkeypatch):
+    dossier = tmp_path / "bin"
+    dossier.mkdir()
+    script = dossier / "sct_qc"
+    script.write_text(FAUX_SCT_QC.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{dossier}{os.pathsep}{os.environ['PATH']}")
+    qc_dir = str(tmp_path / "qc")
+    os.makedirs(qc_dir)
+    return qc_dir
+
+
+def entrees_index(qc_dir):
+    with open(os.path.join(qc_dir, "index.html")) as f:
+        html = f.read()
+    debut = html.index("sct_data = ") + len("sct_data = ")
+    return json.JSONDecoder().raw_decode(html, debut)[0]
+
+
+@pytest.mark.parametrize("format_index", ["sct", "inconnu"])
+def test_index_reconstruit(faux_sct, monkeypatch, format_index):
+    monkeypatch.setenv("FAUX_QC_FORMAT", format_index)
+    for nom in ("sub-a01_T1w_seg.nii.gz", "sub-b02_T1w_seg.nii.gz"):
+        job = (nom, "anat.nii.gz", "seg.nii.gz")
+        qc_fusion_all.fusionner_rapport(qc_fusion_all.generer_qc(*job, faux_sct), faux_sct, job)
+
+    entrees = qc_fusion_all.lire_entrees(faux_sct)
+    assert len(entrees) == 4
+    if format_index == "sct":
+        assert entrees_index(faux_sct) == entrees
+    assert os.path.exists(os.path.join(faux_sct, "sub-b02_T1w_seg.nii.gz", "sct_label_vertebrae", "img.png"))
+    assert [d for d in os.listdir(faux_sct) if d.startswith(".qc_")] == []
+
+
+def test_trouver_entrees():
+    entrees = [{"a": 1, "b": [2, 3]}]
+    html = 'var y = [0]; var data = [ {"b": [2,3],  "a": 1} ];'
+    debut, fin = qc_fusion_all.trouver_entrees(html, entrees)
+    assert json.loads(html[debut:fin]) == entrees
+    assert qc_fusion_all.trouver_entrees("var data = [];", entrees) is None
@@ -0,0 +1,53 @@
+import pandas as pd
+
+from resultats import depuis_large, enregistrer, exporter_large, lire_long, separer_sujet_contraste, vers_large
+
+
+def test_separer_sujet_contraste():
+    assert separer_sujet_contraste("sub-amu01T1w") == ("sub-amu01", "T1w")
+    assert separer_sujet_contraste("sub-amu01_T2w") == ("sub-amu01", "T2w")
+    assert separer_sujet_contraste("amu01") is None
+
+
+def test_upsert(tmp_path):
+    db = str(tmp_path / "resultats.sqlite")
+    assert enregistrer(db, [("sub-a01", "T1w", "propseg", 3), ("sub-a01", "T2w", "propseg", "N/A")]) == 2
+    enregistrer(db, [("sub-a01", "T1w", "GT", -2)])
+    # Une méthode déjà présente est mise à jour sans toucher aux autres
+    enregistrer(db, [("sub-a01", "T1w", "propseg", 5)])
+
+    df = lire_long(db)
+    assert len(df) == 3
+    valeurs = {(r.contraste, r.methode): r.valeur for r in df.itertuples()}
+    assert valeurs[("T1w", "propseg")] == 5
+    assert valeurs[("T1w", "GT")] == -2
+    assert pd.isna(valeurs[("T2w", "propseg")])
+    assert lire_long(db, methodes=["GT"])["methode"].tolist() == ["GT"]
+
+
+def test_runs(tmp_path):
+    db = str(tmp_path / "resultats.sqlite")
+    enregistrer(db, [("sub-a01", "T1w", "propseg", 1)], run="v1")
+    enregistrer(db, [("sub-a01", "T1w", "propseg", 2)], run="v2")
+    assert lire_long(db)["valeur"].tolist() == [2]
+    assert lire_long(db, run="v1")["valeur"].tolist() == [1]
+
+
+def test_pivot_et_export(tmp_path):
+    db = str(tmp_path / "resultats.sqlite")
+    enregistrer(db, [("sub-b02", "T1w", "propseg", 4), ("sub-a01", "T1w", "propseg", -1),
+                     ("sub-a01", "T1w", "GT", 2.5), ("sub-b02", "T1w", "GT", None)])
+    large = vers_large(lire_long(db))
+    assert list(large.columns) == ["Sujet", "GT", "propseg"]
+    assert large["Sujet"].tolist() == ["sub-a01T1w", "sub-b02T1w"]
+    assert str(large["propseg"].dtype) == "Int64"
+
+    csv = str(tmp_path / "resultats.csv")
+    exporter_large(db, csv)
+    with open(csv) as f:
+        assert f.read().splitlines() == ["Sujet,GT,propseg", "sub-a01T1w,2.5,-1", "sub-b02T1w,N/A,4"]
+
+    # Aller-retour format large -> long
+    long = depuis_large(pd.read_csv(csv), run="import")
+    assert len(long) == 4 and set(long["run"]) == {"import"}
+    assert vers_large(long).equals(large)